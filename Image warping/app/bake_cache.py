@@ -0,0 +1,80 @@
+import hashlib
+import os
+import shutil
+
+import bpy
+
+from presets import CACHE_ROOT
+from result_cache import file_hash
+
+BAKE_CACHE_DIR = os.path.join(CACHE_ROOT, "bakes")
+BAKED_MARKER = "baked.ok"
+
+
+def bake_key(blender_file_path):
+    # The simulation only depends on the preset file and the Blender that runs it.
+    digest = hashlib.sha256()
+    digest.update(file_hash(blender_file_path).encode())
+    digest.update(bpy.app.version_string.encode())
+    return digest.hexdigest()[:16]
+
+
+def point_caches():
+    for obj in bpy.data.objects:
+        for modifier in obj.modifiers:
+            point_cache = getattr(modifier, "point_cache", None)
+            if point_cache is not None:
+                yield point_cache
+
+
+def bake_to(baked_path):
+    # Bakes the open preset into a copy at baked_path.
+    # Save first: disk caches live in "//blendcache_<name>/" next to the file being baked.
+    bpy.ops.wm.save_as_mainfile(filepath=baked_path)
+    for point_cache in point_caches():
+        point_cache.use_disk_cache = True
+    bpy.ops.ptcache.bake_all(bake=True)
+    bpy.ops.wm.save_mainfile()
+
+
+def baked_preset_path(blender_file_path, cache_dir=BAKE_CACHE_DIR):
+    # Returns a copy of the preset whose simulation is already baked to disk, baking it on first use.
+    # A preset without point caches (true of every shipped preset, whose deformation is baked into the
+    # mesh) has nothing to bake: None is returned with the preset itself left open, and nothing is cached.
+    stem = os.path.splitext(os.path.basename(blender_file_path))[0]
+    entry_dir = os.path.join(cache_dir, f"{stem}_{bake_key(blender_file_path)}")
+    baked_path = os.path.join(entry_dir, stem + ".blend")
+    if os.path.exists(os.path.join(entry_dir, BAKED_MARKER)):
+        return baked_path
+    bpy.ops.wm.open_mainfile(filepath=os.path.abspath(blender_file_path))
+    if not any(True for _ in point_caches()):
+        return None
+
+    # Bake into a private directory and rename it into place, so concurrent workers never see half a cache.
+    tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    bake_to(os.path.join(tmp_dir, stem + ".blend"))
+    open(os.path.join(tmp_dir, BAKED_MARKER), "w").close()
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # Another worker finished the same bake first.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return baked_path
+
+
+def clear_stale(cache_dir=BAKE_CACHE_DIR, preset_paths=()):
+    # Drop cache entries whose preset file has changed or whose Blender version is gone.
+    keep = set()
+    for preset_path in preset_paths:
+        stem = os.path.splitext(os.path.basename(preset_path))[0]
+        keep.add(f"{stem}_{bake_key(preset_path)}")
+    if not os.path.isdir(cache_dir):
+        return []
+    removed = []
+    for name in os.listdir(cache_dir):
+        if name not in keep:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            removed.append(name)
+    return removed
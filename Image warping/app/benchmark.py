@@ -0,0 +1,145 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from encoders import write_png
+from memory import current_rss_bytes, peak_rss_bytes
+from presets import effect_name_for
+from stages import STAGE_HOOKS
+
+# Page sizes of an A4 scan at roughly 100, 300 and 600 dpi.
+DEFAULT_RESOLUTIONS = [(827, 1169), (2480, 3508), (4960, 7016)]
+
+
+def reference_document(width, height, seed=0):
+    # A synthetic but fixed page: white paper with dark "text lines" and a grey figure block,
+    # so every machine benchmarks exactly the same pixels without shipping large scans.
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 245, dtype=np.uint8)
+    margin = width // 10
+    line_height = max(2, height // 60)
+    for top in range(margin, height - margin, line_height * 2):
+        x = margin
+        while x < width - margin:
+            word = int(rng.integers(width // 40, width // 10))
+            page[top:top + line_height, x:min(x + word, width - margin)] = 30
+            x += word + width // 60
+    page[height // 3:height // 2, margin:width // 2] = 160
+    return page
+
+
+def reference_documents(directory, resolutions=DEFAULT_RESOLUTIONS):
+    paths = []
+    for width, height in resolutions:
+        path = os.path.join(directory, f"reference_{width}x{height}.png")
+        if not os.path.exists(path):
+            write_png(path, reference_document(width, height))
+        paths.append(path)
+    return paths
+
+
+class StageRecorder:
+    # Collects per-stage wall time and the highest RSS seen at a stage boundary for one render.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.output_bytes = 0
+        self.peak_rss = current_rss_bytes()
+
+    def __call__(self, name, seconds, info):
+        self.stages[name] = self.stages.get(name, 0) + seconds
+        self.output_bytes += info.get("bytes", 0)
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+
+
+def machine_info():
+    import bpy
+
+    return {
+        "blender": bpy.app.version_string,
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmark(presets, documents, out_path, repeats=1, bake_cache=True):
+    # Renders every preset against every document from a fresh scene and appends one JSON line
+    # per render to out_path. Returns the list of records.
+    from renderer import render_image
+
+    recorder = StageRecorder()
+    STAGE_HOOKS.append(recorder)
+    info = machine_info()
+    records = []
+    try:
+        with tempfile.TemporaryDirectory() as out_dir, open(out_path, "a") as results:
+            for preset_path in presets:
+                for document in documents:
+                    for repeat in range(repeats):
+                        recorder.reset()
+                        output_path = os.path.join(out_dir, "benchmark.png")
+                        start = time.perf_counter()
+                        render_image(preset_path, document, effect_name_for(preset_path), output_path,
+                                     bake_cache=bake_cache)
+                        record = dict(info,
+                                      preset=os.path.basename(preset_path),
+                                      document=os.path.basename(document),
+                                      repeat=repeat,
+                                      bake_cache=bake_cache,
+                                      total_seconds=time.perf_counter() - start,
+                                      stages=recorder.stages,
+                                      peak_rss_bytes=recorder.peak_rss,
+                                      process_peak_rss_bytes=peak_rss_bytes(),
+                                      output_bytes=recorder.output_bytes,
+                                      timestamp=time.time())
+                        results.write(json.dumps(record) + "\n")
+                        results.flush()
+                        records.append(record)
+                        print(f"{record['preset']} x {record['document']}: {record['total_seconds']:.2f}s, "
+                              f"peak RSS {record['peak_rss_bytes'] / 2**20:.0f} MB, {record['output_bytes']} bytes")
+    finally:
+        STAGE_HOOKS.remove(recorder)
+    return records
+
+
+def load_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def stage_medians(records):
+    # {(preset, document): {stage: median seconds, "total": median seconds}}
+    grouped = {}
+    for record in records:
+        timings = dict(record["stages"], total=record["total_seconds"])
+        group = grouped.setdefault((record["preset"], record["document"]), {})
+        for name, seconds in timings.items():
+            group.setdefault(name, []).append(seconds)
+    return {key: {name: statistics.median(values) for name, values in group.items()}
+            for key, group in grouped.items()}
+
+
+def compare(records, baseline_records, threshold=1.1):
+    # Prints stages whose median got slower than threshold x the baseline; returns how many did.
+    current = stage_medians(records)
+    baseline = stage_medians(baseline_records)
+    regressions = 0
+    for key, timings in sorted(current.items()):
+        for name, seconds in sorted(timings.items()):
+            before = baseline.get(key, {}).get(name)
+            # Stages under 10 ms are too noisy to compare.
+            if not before or max(seconds, before) < 0.01:
+                continue
+            ratio = seconds / before
+            if ratio > threshold:
+                regressions += 1
+                print(f"SLOWER {key[0]} x {key[1]} {name}: {before:.3f}s -> {seconds:.3f}s ({ratio:.2f}x)")
+    return regressions
@@ -0,0 +1,205 @@
+import io
+import json
+import os
+import tarfile
+import time
+import zipfile
+
+import numpy as np
+
+from encoders import encode_png
+
+INDEX_NAME = "index.jsonl"
+DEFAULT_SHARD_BYTES = 1024 ** 3
+
+
+class DatasetWriter:
+    # Streams rendered samples into an output directory and appends one index line per sample,
+    # mapping (source image, preset) to where the sample landed. Subclasses decide the layout.
+    # A shard is written under a ".partial" name and renamed once it is closed; only then are its
+    # index lines written and flushed and its samples reported by committed(), so a run that is
+    # interrupted never leaves index entries (or jobs marked done) pointing at an unreadable shard.
+    def __init__(self, out_dir, max_shard_bytes=DEFAULT_SHARD_BYTES):
+        self.out_dir = out_dir
+        self.max_shard_bytes = max_shard_bytes
+        os.makedirs(out_dir, exist_ok=True)
+        self.index = open(os.path.join(out_dir, INDEX_NAME), "a")
+        self.shard_number = self.next_shard_number()
+        self.shard_bytes = 0
+        self.pending = []
+        self.finished = []
+
+    def next_shard_number(self):
+        # Appending to an existing dataset starts a fresh shard instead of rewriting old ones.
+        numbers = [int(name.split("-")[1].split(".")[0]) for name in os.listdir(self.out_dir)
+                   if name.startswith("shard-") and name.split("-")[1].split(".")[0].isdigit()]
+        return max(numbers, default=-1) + 1
+
+    def shard_name(self, extension):
+        return f"shard-{self.shard_number:06d}.{extension}"
+
+    def shard_path(self, extension):
+        # Where the open shard is written until close_shard() renames it to shard_name().
+        return os.path.join(self.out_dir, self.shard_name(extension) + ".partial")
+
+    def write(self, key, pixels, source, preset, job=None):
+        # job is handed back by committed() once the sample's shard is complete on disk.
+        entry = self.write_sample(key, pixels)
+        entry.update(key=key, source=source, preset=preset)
+        self.pending.append((entry, job))
+        if self.shard_bytes >= self.max_shard_bytes:
+            self.close_shard()
+            self.shard_bytes = 0
+            self.shard_number += 1
+            self.commit()
+
+    def write_sample(self, key, pixels):
+        raise NotImplementedError
+
+    def close_shard(self):
+        pass
+
+    def finish_shard(self, partial_path):
+        os.replace(partial_path, partial_path[:-len(".partial")])
+
+    def commit(self):
+        for entry, job in self.pending:
+            self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+        self.finished.extend(job for _, job in self.pending)
+        self.pending = []
+
+    def committed(self):
+        # Jobs of every sample whose shard has been closed since the last call.
+        finished, self.finished = self.finished, []
+        return finished
+
+    def close(self):
+        self.close_shard()
+        self.commit()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FileWriter(DatasetWriter):
+    # One PNG per sample, the layout render_all_effects has always produced. Each file is complete
+    # once written, so every sample is committed straight away.
+    def write(self, *args, **kwargs):
+        super().write(*args, **kwargs)
+        self.commit()
+
+    def write_sample(self, key, pixels):
+        name = key + ".png"
+        with open(os.path.join(self.out_dir, name), "wb") as f:
+            f.write(encode_png(pixels))
+        return {"file": name}
+
+
+class TarShardWriter(DatasetWriter):
+    # WebDataset-style tar shards: each sample is "<key>.png" plus "<key>.json" metadata.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tar = None
+
+    def add_member(self, name, data):
+        # Returns the byte offset of the member's data, so readers can seek straight to it.
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+        self.tar.addfile(info, io.BytesIO(data))
+        return offset
+
+    def write_sample(self, key, pixels):
+        if self.tar is None:
+            self.tar = tarfile.open(self.shard_path("tar"), "w")
+        png = encode_png(pixels)
+        offset = self.add_member(key + ".png", png)
+        self.add_member(key + ".json", json.dumps({"height": pixels.shape[0], "width": pixels.shape[1]}).encode())
+        self.shard_bytes = self.tar.offset
+        return {"shard": self.shard_name("tar"), "offset": offset, "size": len(png), "member": key + ".png"}
+
+    def close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.finish_shard(self.tar.name)
+            self.tar = None
+
+
+class NpzShardWriter(DatasetWriter):
+    # Raw pixel arrays grouped into .npz shards, one array per sample named by its key. Each array is
+    # streamed into the shard's zip as "<key>.npy" when it arrives, the same layout np.savez writes,
+    # so only one sample is held in memory at a time.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.zip = None
+        self.members = 0
+
+    def write_sample(self, key, pixels):
+        if self.zip is None:
+            self.zip = zipfile.ZipFile(self.shard_path("npz"), "w", allowZip64=True)
+            self.members = 0
+        with self.zip.open(key + ".npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asanyarray(pixels), allow_pickle=False)
+        entry = {"shard": self.shard_name("npz"), "offset": self.members, "member": key}
+        self.members += 1
+        self.shard_bytes += pixels.nbytes
+        return entry
+
+    def close_shard(self):
+        if self.zip is not None:
+            self.zip.close()
+            self.finish_shard(self.zip.filename)
+            self.zip = None
+
+
+class Hdf5ShardWriter(DatasetWriter):
+    # Chunked HDF5 shards holding PNG-encoded samples in a resizable variable-length dataset.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.file = None
+
+    def open_shard(self):
+        import h5py
+
+        self.file = h5py.File(self.shard_path("h5"), "w")
+        self.images = self.file.create_dataset("images", shape=(0,), maxshape=(None,), chunks=(64,),
+                                               dtype=h5py.vlen_dtype(np.uint8))
+        self.keys = self.file.create_dataset("keys", shape=(0,), maxshape=(None,), chunks=(64,),
+                                             dtype=h5py.string_dtype())
+
+    def write_sample(self, key, pixels):
+        if self.file is None:
+            self.open_shard()
+        png = np.frombuffer(encode_png(pixels), dtype=np.uint8)
+        row = self.images.shape[0]
+        self.images.resize((row + 1,))
+        self.keys.resize((row + 1,))
+        self.images[row] = png
+        self.keys[row] = key
+        self.shard_bytes += len(png)
+        return {"shard": self.shard_name("h5"), "offset": row, "size": len(png)}
+
+    def close_shard(self):
+        if self.file is not None:
+            path = self.file.filename
+            self.file.close()
+            self.finish_shard(path)
+            self.file = None
+
+
+WRITERS = {
+    "files": FileWriter,
+    "tar": TarShardWriter,
+    "npz": NpzShardWriter,
+    "hdf5": Hdf5ShardWriter,
+}
+
+
+def open_writer(kind, out_dir, max_shard_bytes=DEFAULT_SHARD_BYTES):
+    return WRITERS[kind](out_dir, max_shard_bytes)
@@ -0,0 +1,136 @@
+import io
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+def png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def encode_png(pixels, compress_level=6):
+    # 8- or 16-bit PNG from an (h, w) or (h, w, c) uint8 or uint16 array, using the "Up" filter on
+    # every row: a single vectorised subtraction that compresses scanned pages far better than no filter.
+    if pixels.ndim == 2:
+        pixels = pixels[..., None]
+    height, width, channels = pixels.shape
+    bit_depth = 16 if pixels.dtype == np.uint16 else 8
+    # PNG samples are big-endian; the filter works on bytes either way.
+    rows = np.ascontiguousarray(pixels, dtype=">u2" if bit_depth == 16 else np.uint8).view(np.uint8).reshape(height, -1)
+    filtered = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    filtered[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, PNG_COLOR_TYPES[channels], 0, 0, 0)
+    return (PNG_SIGNATURE + png_chunk(b"IHDR", header)
+            + png_chunk(b"IDAT", zlib.compress(filtered.tobytes(), compress_level))
+            + png_chunk(b"IEND", b""))
+
+
+def write_png(path, pixels, compress_level=6):
+    data = encode_png(pixels, compress_level)
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def encode_qoi(pixels):
+    # QOI (qoiformat.org) from an (h, w, 3|4) uint8 array. The format is a sequential byte stream, but
+    # every op only depends on the previous pixel and on the last earlier pixel with the same hash,
+    # so the op of each pixel is chosen with whole-array NumPy operations.
+    if pixels.dtype != np.uint8 or pixels.ndim != 3 or pixels.shape[2] not in (3, 4):
+        raise ValueError("QOI stores 8-bit RGB or RGBA pixels")
+    height, width, channels = pixels.shape
+    px = np.empty((height * width, 4), dtype=np.uint8)
+    px[:, :channels] = pixels.reshape(-1, channels)
+    if channels == 3:
+        px[:, 3] = 255
+    prev = np.empty_like(px)
+    prev[0] = (0, 0, 0, 255)
+    prev[1:] = px[:-1]
+    count = len(px)
+    out = np.zeros((count, 5), dtype=np.uint8)
+    lengths = np.zeros(count, dtype=np.int64)
+
+    # Runs of repeated pixels: one QOI_OP_RUN byte every 62 pixels and at the end of each run.
+    same = (px == prev).all(axis=1)
+    positions = np.arange(count)
+    starts = np.maximum.accumulate(np.where(same, 0, positions + 1))
+    in_run = positions - starts
+    run_end = same & ((in_run % 62 == 61) | np.append(~same[1:], True))
+    out[run_end, 0] = 0xC0 | (in_run[run_end] % 62)
+    lengths[run_end] = 1
+
+    # The decoder keeps the last pixel seen for each of the 64 hash slots.
+    values = px.astype(np.int64)
+    hashes = (values[:, 0] * 3 + values[:, 1] * 5 + values[:, 2] * 7 + values[:, 3] * 11) % 64
+    order = np.argsort(hashes, kind="stable")
+    seen = np.zeros(count, dtype=bool)
+    seen[order[1:]] = (hashes[order[1:]] == hashes[order[:-1]]) & (px[order[1:]] == px[order[:-1]]).all(axis=1)
+    index = ~same & seen
+    out[index, 0] = hashes[index]
+    lengths[index] = 1
+
+    rest = ~same & ~index
+    diff = (px.astype(np.int16) - prev).astype(np.int8).astype(np.int16)
+    dr, dg, db = diff[:, 0], diff[:, 1], diff[:, 2]
+    keep_alpha = px[:, 3] == prev[:, 3]
+    small = rest & keep_alpha & (diff[:, :3] >= -2).all(axis=1) & (diff[:, :3] <= 1).all(axis=1)
+    out[small, 0] = 0x40 | ((dr[small] + 2) << 4) | ((dg[small] + 2) << 2) | (db[small] + 2)
+    lengths[small] = 1
+    luma = (rest & keep_alpha & ~small & (dg >= -32) & (dg <= 31) & (dr - dg >= -8) & (dr - dg <= 7)
+            & (db - dg >= -8) & (db - dg <= 7))
+    out[luma, 0] = 0x80 | (dg[luma] + 32)
+    out[luma, 1] = ((dr[luma] - dg[luma] + 8) << 4) | (db[luma] - dg[luma] + 8)
+    lengths[luma] = 2
+    rgb = rest & keep_alpha & ~small & ~luma
+    out[rgb, 0] = 0xFE
+    out[rgb, 1:4] = px[rgb, :3]
+    lengths[rgb] = 4
+    rgba = rest & ~keep_alpha
+    out[rgba, 0] = 0xFF
+    out[rgba, 1:5] = px[rgba]
+    lengths[rgba] = 5
+
+    chunks = out[np.arange(5) < lengths[:, None]]
+    header = b"qoif" + struct.pack(">IIBB", width, height, channels, 0)
+    return header + chunks.tobytes() + b"\x00" * 7 + b"\x01"
+
+
+def encode_webp(pixels, compress_level=6):
+    # Lossless WebP through Pillow; compress_level 0-9 maps onto WebP's effort setting (method 0-6).
+    if pixels.dtype != np.uint8:
+        raise ValueError("WebP stores 8-bit pixels")
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "WEBP", lossless=True, quality=100, method=round(compress_level * 6 / 9))
+    return buffer.getvalue()
+
+
+def encode_npy(pixels, compress_level=None):
+    # The raw array, any dtype; the quickest to write and to load back with np.load.
+    buffer = io.BytesIO()
+    np.save(buffer, pixels)
+    return buffer.getvalue()
+
+
+# Output formats of the render writer and their file extensions.
+OUTPUT_FORMATS = {"png": ".png", "webp": ".webp", "qoi": ".qoi", "npy": ".npy"}
+
+
+def encode(pixels, output_format="png", compress_level=6):
+    if output_format == "png":
+        return encode_png(pixels, compress_level)
+    if output_format == "webp":
+        return encode_webp(pixels, compress_level)
+    if output_format == "qoi":
+        return encode_qoi(pixels)
+    if output_format == "npy":
+        return encode_npy(pixels)
+    raise ValueError(f"Unknown output format {output_format!r}")
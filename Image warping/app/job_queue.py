@@ -0,0 +1,190 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class JobQueue:
+    # A render queue in one SQLite file on a filesystem every render node mounts. Workers claim a job
+    # by leasing it for lease_seconds and keep the lease alive with heartbeats while rendering; a job
+    # whose lease runs out (its node crashed or lost the mount) is claimed again by someone else.
+    # After max_attempts failed or abandoned tries a job is moved to the "dead" state and left alone
+    # until retry_dead() puts it back.
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # WAL needs shared memory between the processes, which network filesystems do not give us, so the
+        # queue uses the rollback journal and plain file locks. Every claim is one short write transaction.
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=DELETE")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS queue (
+            job_id TEXT PRIMARY KEY, job TEXT, preset_path TEXT,
+            status TEXT, attempts INTEGER DEFAULT 0, lease_owner TEXT, lease_expires REAL,
+            error TEXT, updated REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS queue_status ON queue (status)")
+
+    def add(self, jobs):
+        # Jobs already in the queue keep their state, so re-running the same command only adds new work.
+        now = time.time()
+        before = self.db.total_changes
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.executemany(
+            "INSERT OR IGNORE INTO queue (job_id, job, preset_path, status, updated) VALUES (?, ?, ?, 'pending', ?)",
+            [(job.get("job_id") or job["output_path"], json.dumps(job), job["preset_path"], now) for job in jobs])
+        self.db.execute("COMMIT")
+        return self.db.total_changes - before
+
+    def claim(self, worker, preset_path=None):
+        # Leases the next pending or abandoned job, preferring preset_path so the worker can keep its scene loaded.
+        while True:
+            now = time.time()
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                "SELECT job_id, job, attempts, status FROM queue "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY preset_path = ? DESC, rowid LIMIT 1", (now, preset_path)).fetchone()
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+            job_id, job, attempts, status = row
+            if status == "leased" and attempts >= self.max_attempts:
+                self.db.execute("UPDATE queue SET status = 'dead', lease_owner = NULL, error = ?, updated = ? "
+                                "WHERE job_id = ?", ("lease expired on the last attempt", now, job_id))
+                self.db.execute("COMMIT")
+                continue
+            self.db.execute("UPDATE queue SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                            "lease_expires = ?, updated = ? WHERE job_id = ?",
+                            (worker, now + self.lease_seconds, now, job_id))
+            self.db.execute("COMMIT")
+            return dict(json.loads(job), job_id=job_id)
+
+    def heartbeat(self, job_id, worker):
+        # False when the lease was lost to another worker; the render may still finish, complete() accepts it.
+        cursor = self.db.execute("UPDATE queue SET lease_expires = ?, updated = ? "
+                                 "WHERE job_id = ? AND status = 'leased' AND lease_owner = ?",
+                                 (time.time() + self.lease_seconds, time.time(), job_id, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id):
+        self.db.execute("UPDATE queue SET status = 'done', lease_owner = NULL, error = NULL, updated = ? "
+                        "WHERE job_id = ?", (time.time(), job_id))
+
+    def fail(self, job_id, worker, error):
+        # Back to pending for another try, or dead once it has used up its attempts.
+        self.db.execute("UPDATE queue SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, "
+                        "lease_owner = NULL, error = ?, updated = ? "
+                        "WHERE job_id = ? AND status = 'leased' AND lease_owner = ?",
+                        (self.max_attempts, error, time.time(), job_id, worker))
+
+    def unfinished(self):
+        return self.db.execute("SELECT COUNT(*) FROM queue WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def dead_jobs(self):
+        return [(json.loads(job), error) for job, error in
+                self.db.execute("SELECT job, error FROM queue WHERE status = 'dead' ORDER BY rowid")]
+
+    def retry_dead(self):
+        cursor = self.db.execute("UPDATE queue SET status = 'pending', attempts = 0, updated = ? WHERE status = 'dead'",
+                                 (time.time(),))
+        return cursor.rowcount
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM queue GROUP BY status"))
+
+    def finished(self):
+        # job_id -> (status, error) of every job that is done or dead.
+        return {job_id: (status, error) for job_id, status, error in
+                self.db.execute("SELECT job_id, status, error FROM queue WHERE status IN ('done', 'dead')")}
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Heartbeat:
+    # Renews a lease from a background thread while the render blocks the worker's main thread.
+    # SQLite connections belong to the thread that opened them, so the thread opens its own.
+    def __init__(self, queue_path, job_id, worker, lease_seconds):
+        self.args = (queue_path, job_id, worker, lease_seconds)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        queue_path, job_id, worker, lease_seconds = self.args
+        with JobQueue(queue_path, lease_seconds) as job_queue:
+            while not self.stopped.wait(lease_seconds / 3):
+                if not job_queue.heartbeat(job_id, worker):
+                    print(f"Lost the lease on {job_id[:12]}; another worker may render it too")
+                    return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def work(queue_path, worker_id=0, threads=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+         max_attempts=DEFAULT_MAX_ATTEMPTS, poll_seconds=10, instrumentation=None):
+    # Claims and renders jobs until none are pending or leased anywhere. While other nodes still hold
+    # leases it keeps polling, so it can pick up their jobs if they die.
+    from metrics import install
+    from renderer import RenderSession
+
+    install(worker_id=worker_id, **(instrumentation or {}))
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    session = RenderSession()
+    rendered = 0
+    preset_path = None
+    with JobQueue(queue_path, lease_seconds, max_attempts) as job_queue:
+        while True:
+            job = job_queue.claim(worker, preset_path)
+            if job is None:
+                if job_queue.unfinished() == 0:
+                    break
+                time.sleep(poll_seconds)
+                continue
+            preset_path = job["preset_path"]
+            name = f"{os.path.basename(job['image_path'])} -> {os.path.basename(job['preset_path'])}"
+            try:
+                with Heartbeat(queue_path, job["job_id"], worker, lease_seconds):
+                    os.makedirs(os.path.dirname(job["output_path"]), exist_ok=True)
+                    session.render(job["preset_path"], job["image_path"], job["effect_name"], job["output_path"],
+                                   threads=threads, **job["options"])
+            except Exception as e:
+                print(f"[{worker}] {name} failed: {e}")
+                job_queue.fail(job["job_id"], worker, str(e))
+                continue
+            job_queue.complete(job["job_id"])
+            rendered += 1
+            print(f"[{worker}] {name}")
+    return rendered
+
+
+def run_workers(queue_path, workers, threads=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+                max_attempts=DEFAULT_MAX_ATTEMPTS, instrumentation=None):
+    # Several independent queue workers on this machine; they coordinate only through the queue file.
+    if workers == 1:
+        return work(queue_path, 0, threads, lease_seconds, max_attempts, instrumentation=instrumentation)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=work, args=(queue_path, worker_id, threads, lease_seconds, max_attempts),
+                                 kwargs={"instrumentation": instrumentation})
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
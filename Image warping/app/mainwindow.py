@@ -1,64 +1,161 @@
+import time
+started = time.perf_counter()
+
+import functools
 import os
 import shutil
-import time
 import sys
-import bpy
+import threading
 from PyQt5.QtWidgets import QApplication,QProgressDialog,QMainWindow, QStackedWidget, QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog, QMessageBox, QSpacerItem, QSizePolicy, QHBoxLayout, QRadioButton,QStackedWidget
-from PyQt5.QtGui import QPixmap 
-from PyQt5.QtCore import Qt, QSize, pyqtSignal
-from qt_material import apply_stylesheet
-import qtawesome as qta
+from PyQt5.QtGui import QImage, QPixmap 
+from PyQt5.QtCore import Qt, QDir, QSize, QThread, QTimer, pyqtSignal
+from encoders import encode_png
+from manifest import MANIFEST_NAME, JobManifest, output_name
+from preset_registry import PresetRegistry
+from presets import CACHE_ROOT
+from render_profiles import RENDER_PROFILES
+from result_cache import ResultCache
+
+PREVIEW_QUALITY = RENDER_PROFILES["preview"]
+STYLESHEET_CACHE = os.path.join(CACHE_ROOT, "stylesheets")
+BUTTON_STYLE = """
+            QPushButton {
+                background-color: #28282B;
+                color: #FFFFFF;
+            }"""
 image_path= ""
 
-def make_blender_ready(blender_file_path,selected_image_path):    
-    bpy.ops.wm.open_mainfile(filepath=blender_file_path)
-    bpy.ops.ptcache.bake_all(bake=True)
-    obj = bpy.data.objects.get("demo for blender")
-    if obj is not None:
-        bpy.context.view_layer.objects.active = obj
-        obj.select_set(True)
-    else:
-        print("Object 'demo for blender' not found.")
-
-    material = bpy.data.materials.new(name="MyMaterial")
-
-    texture = bpy.data.textures.new(name="MyTexture", type='IMAGE')
-
-    image = bpy.data.images.load(selected_image_path)
-
-    texture.image = image
-    
-    material.use_nodes = True
-    nodes = material.node_tree.nodes
-    node = nodes.get("Principled BSDF")
-    tex_node = nodes.new("ShaderNodeTexImage")
-    tex_node.image = image
-    material.node_tree.links.new(tex_node.outputs["Color"], node.inputs["Base Color"])
-
-    obj.data.materials[0] = material
-
-def render_image(blender_file_path,selected_image_path,effect_name):
-
-    bpy.ops.wm.read_homefile(use_empty=True)
-    make_blender_ready(blender_file_path,selected_image_path)
-    
-    output_directory = os.path.dirname(os.path.abspath(__file__))
-    output_path = os.path.join(output_directory, "temp.png")
-
-    if(effect_name == "Curved"):
-        bpy.ops.object.shade_smooth(use_auto_smooth=True)
-    
-    bpy.context.scene.render.film_transparent = True
-    bpy.context.scene.render.filepath = output_path
-
-    render_result = bpy.ops.render.render(write_still=True)
-    if render_result == {'FINISHED'}:
-        print("Rendering completed successfully.")
-    else:
-        print("Rendering failed.")
-
-    return output_path
-    
+def load_renderer():
+    # Importing bpy takes seconds and hundreds of MB, so the renderer is not imported before the window
+    # shows. Only RenderThread calls this: it imports bpy and runs every render, so Blender is only
+    # ever driven from the thread that initialised it.
+    loaded = "renderer" in sys.modules
+    start = time.perf_counter()
+    import renderer
+    if not loaded:
+        print(f"Loaded Blender in {time.perf_counter() - start:.2f} s")
+    return renderer
+
+def render_image(*args, **kwargs):
+    return load_renderer().render_image(*args, **kwargs)
+
+@functools.lru_cache(maxsize=None)
+def icon(name, **options):
+    import qtawesome as qta
+
+    return qta.icon(name, color='white', **options)
+
+def apply_theme(app, theme='dark_blue.xml'):
+    # qt_material rewrites every themed icon and renders its stylesheet template on each call, so both are
+    # generated once per theme and qt_material version and read back from the cache on later starts.
+    from importlib.metadata import version
+    import qt_material
+
+    directory = os.path.join(STYLESHEET_CACHE, os.path.splitext(theme)[0] + "_" + version("qt-material"))
+    stylesheet_path = os.path.join(directory, "stylesheet.qss")
+    if not os.path.exists(stylesheet_path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = stylesheet_path + ".tmp" + str(os.getpid())
+        qt_material.apply_stylesheet(app, theme=theme, parent=os.path.join(directory, "icons"), save_as=tmp_path)
+        os.replace(tmp_path, stylesheet_path)
+        return
+    qt_material.add_fonts()
+    QDir.addSearchPath('icon', os.path.join(directory, "icons"))
+    QDir.addSearchPath('qt_material', os.path.join(os.path.dirname(qt_material.__file__), 'resources'))
+    with open(stylesheet_path) as f:
+        app.setStyleSheet(f.read())
+
+def pixels_to_qimage(pixels):
+    # Wraps an (H, W, 4) uint8 render without copying; keep pixels alive as long as the QImage is used.
+    height, width = pixels.shape[:2]
+    return QImage(pixels.data, width, height, pixels.strides[0], QImage.Format_RGBA8888)
+
+class RenderThread(QThread):
+    # The one thread that drives Blender: previews, full-quality saves and "Render All Effects" all run
+    # here, off the GUI thread. Only the most recent preview request is kept, so clicking through
+    # several effects renders the last one rather than all of them; tasks (run_task) run in order.
+    # rendered carries either the in-memory pixels of a fresh render or the path of a cached one.
+    rendered = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    progress = pyqtSignal(str)
+    task_finished = pyqtSignal(object, str)
+
+    def __init__(self, result_cache, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.result_cache = result_cache
+        self.condition = threading.Condition()
+        self.pending = None
+        self.tasks = []
+        self.warming = False
+        self.stopping = False
+        self.task_finished.connect(self.finish_task)
+
+    def submit(self, request_id, blender_file_path, selected_image_path, effect_name):
+        with self.condition:
+            self.pending = (request_id, blender_file_path, selected_image_path, effect_name)
+            self.condition.notify()
+
+    def run_task(self, task, done):
+        # task(thread) runs on this thread; done(error) is then called on the GUI thread, with the
+        # error message or an empty string.
+        with self.condition:
+            self.tasks.append((task, done))
+            self.condition.notify()
+
+    def finish_task(self, done, error):
+        done(error)
+
+    def warm_up(self):
+        # Loads Blender once the window is up, so the first preview does not wait for the import.
+        with self.condition:
+            self.warming = True
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.tasks and not self.warming and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                warming, self.warming = self.warming, False
+                task = self.tasks.pop(0) if self.tasks else None
+                request = None
+                if task is None:
+                    request = self.pending
+                    self.pending = None
+            if warming:
+                load_renderer()
+            if task is not None:
+                task, done = task
+                try:
+                    task(self)
+                    self.task_finished.emit(done, "")
+                except Exception as e:
+                    self.task_finished.emit(done, str(e))
+                continue
+            if request is None:
+                continue
+            request_id, blender_file_path, selected_image_path, effect_name = request
+            try:
+                settings = {"effect": effect_name, "quality": PREVIEW_QUALITY}
+                key = self.result_cache.key(selected_image_path, blender_file_path, settings)
+                cached_path = self.result_cache.get(key)
+                if cached_path is not None:
+                    self.rendered.emit(request_id, cached_path)
+                    continue
+                pixels = render_image(blender_file_path, selected_image_path, effect_name, quality=PREVIEW_QUALITY)
+                self.rendered.emit(request_id, pixels)
+                # Encoded only after the preview is on its way to the screen.
+                self.result_cache.put_bytes(key, encode_png(pixels))
+            except Exception as e:
+                self.failed.emit(request_id, str(e))
 
 class StackedWidget(QStackedWidget):
     switch_screen_signal = pyqtSignal(int, QPixmap)
@@ -134,26 +231,17 @@ class UploadScreen(QWidget):
         self.button_layout = QVBoxLayout()
         self.layout.addLayout(self.button_layout)
 
-        fa5_icon = qta.icon('fa5s.upload', color='white',scalefactor=0.5)        
+        fa5_icon = icon('fa5s.upload', scalefactor=0.5)
         self.upload_button = QPushButton(" Upload Image")
-        self.upload_button.setStyleSheet("""
-            QPushButton {
-                background-color: #28282B;                
-                color: #FFFFFF;
-            }
-        """)
+        self.upload_button.setStyleSheet(BUTTON_STYLE)
         self.upload_button.setIcon(fa5_icon)
         self.upload_button.setIconSize(QSize(15, 15))
         self.upload_button.clicked.connect(self.upload_image)
         self.button_layout.addWidget(self.upload_button)
 
-        fa5_icon = qta.icon('fa5s.exchange-alt', color='white',scalefactor=0.5)
+        fa5_icon = icon('fa5s.exchange-alt', scalefactor=0.5)
         self.change_button = QPushButton(" Change Image")
-        self.change_button.setStyleSheet("""
-            QPushButton {
-                background-color: #28282B;
-                color: #FFFFFF;
-            }""")
+        self.change_button.setStyleSheet(BUTTON_STYLE)
         self.change_button.setIcon(fa5_icon)
         self.change_button.setIconSize(QSize(15, 15))
         self.change_button.setVisible(False)
@@ -163,13 +251,9 @@ class UploadScreen(QWidget):
         spacer = QSpacerItem(20, 0, QSizePolicy.Minimum)
         self.button_layout.addSpacerItem(spacer)
 
-        fa5_icon = qta.icon('fa5s.magic', color='white',scalefactor=0.5)
+        fa5_icon = icon('fa5s.magic', scalefactor=0.5)
         self.apply_button = QPushButton(" Apply Effects")
-        self.apply_button.setStyleSheet("""
-            QPushButton {
-                background-color: #28282B;
-                color: #FFFFFF;
-            }""")
+        self.apply_button.setStyleSheet(BUTTON_STYLE)
         self.apply_button.setIcon(fa5_icon)
         self.apply_button.setIconSize(QSize(15, 15))
         self.apply_button.setVisible(False)
@@ -239,35 +323,17 @@ class EffectsScreen(QWidget):
 
         self.effect_buttons = []
 
-        effect_groups = {
-            "Perspective": ["Y-Left","Y-Right", "X-Top","X-Bottom"],
-            "Rotation": ["90°","180°","270°","360"],
-            "Fold Corners": ["Fold TL","Fold TR","Fold BL","Fold BR","Fold Both Top","Fold Both Right"],
-            "Fold Axes" : ["Fold Vertical","Fold Horizontal","Fold Diagonal 1","Fold Diagonal 2"],
-            "Crumpled": ["Easy Crumpled 1", "Easy Crumpled 2" , "Hard Crumpled 1","Hard Crumpled 2"],
-            "Crease Corners": ["Crease TL","Crease TR","Crease BL","Crease BR","Crease Both Right","Crease Both Left","Crease Both Top","Crease Both Bottom","Crease All Corners"],
-            "Crease Axes" : ["Crease Vertical","Crease Multiple Vertical","Crease Horizontal","Crease Multiple Horizontal","Crease Diagonal 1","Crease Diagonal 2","Plus(+)","Cross(X)"],
-            "Curled": [ "Curl TL","Curl TR","Curl BL","Curl BR","Curl Both Right","Curl Both Left","Curl Both Top","Curl Both Bottom","Curl All Corners"],
-        }
-
-        labels = {
-            "Perspective": "Perspective",
-            "Rotation": "Rotation",
-            "Fold Corners": "Fold Corners",
-            "Fold Axes": "Fold Axes",
-            "Crumpled": "Crumpled",
-            "Crease Corners": "Crease Corners",
-            "Crease Axes": "Crease Axes",
-            "Curled": "Curled",
-        }
+        # The registry is the one place that maps effect names to preset files.
+        self.presets = PresetRegistry()
+        effect_groups = self.presets.groups
 
         self.label_layout = QVBoxLayout()
-        for label in labels.values():
+        for label in effect_groups:
             self.label_layout.addWidget(QLabel(label))
         self.effect_options_layout.addLayout(self.label_layout)
 
         self.effect_name_layout = QVBoxLayout()
-        for label in labels.values():
+        for label in effect_groups:
             group = QHBoxLayout()
             group.setAlignment(Qt.AlignTop) 
             for effect_names in effect_groups[label]:
@@ -282,28 +348,15 @@ class EffectsScreen(QWidget):
         self.save_export_layout = QHBoxLayout()
 
         # Export to blender Button
-        fa5_icon = qta.icon('fa5s.file-export', color='white', scalefactor=0.5)
         self.export_button = QPushButton(" Export to Blender File")
         self.export_button.setVisible(False)
-        self.export_button.setStyleSheet("""
-            QPushButton {
-                background-color: #28282B;
-                color: #FFFFFF;
-            }""")
+        self.export_button.setStyleSheet(BUTTON_STYLE)
         self.export_button.clicked.connect(self.export_to_blender)
-        self.export_button.setIcon(fa5_icon)
         self.export_button.setIconSize(QSize(15, 15))
 
         # Save Button
-        fa5_icon = qta.icon('fa5s.save', color='white', scalefactor=0.5)
         self.save_button = QPushButton(" Save File as PNG")
-        self.save_button.setStyleSheet("""
-            QPushButton {
-                background-color: #28282B;
-                color: #FFFFFF;
-                color: #FFFFFF;
-            }""")
-        self.save_button.setIcon(fa5_icon)
+        self.save_button.setStyleSheet(BUTTON_STYLE)
         self.save_button.setIconSize(QSize(15, 15))
         self.save_button.setVisible(False)
         self.save_button.clicked.connect(self.save_image)
@@ -318,31 +371,48 @@ class EffectsScreen(QWidget):
 
         self.layout.addLayout(self.save_export_layout)
 
-        fa5_icon = qta.icon('fa5s.list', color='white', scalefactor=0.5)
         self.render_button = QPushButton(" Render All Effects")
-        self.render_button.setStyleSheet("""
-            QPushButton {
-                background-color: #28282B;
-                color: #FFFFFF;
-                color: #FFFFFF;
-            }""")
-        self.render_button.setIcon(fa5_icon)
+        self.render_button.setStyleSheet(BUTTON_STYLE)
         self.render_button.setIconSize(QSize(15, 15))
         self.render_button.clicked.connect(self.render_all_effects)
         self.layout.addWidget(self.render_button)
 
         self.back_button = QPushButton("Go Back")
-        self.back_button.setStyleSheet("""
-            QPushButton {
-                background-color: #28282B;
-                color: #FFFFFF;
-                color: #FFFFFF;
-            }""")
+        self.back_button.setStyleSheet(BUTTON_STYLE)
         self.back_button.setIconSize(QSize(15, 15))
         self.back_button.clicked.connect(self.go_back)
         self.layout.addWidget(self.back_button)
 
         self.selected_effect = None
+        self.selected_preset_path = None
+
+        # Created with the icons the first time this screen is shown; see showEvent.
+        self.spinner = None
+
+        self.preview_request = 0
+        self.result_cache = ResultCache()
+        self.render_thread = RenderThread(self.result_cache)
+        self.render_thread.rendered.connect(self.preview_rendered)
+        self.render_thread.failed.connect(self.preview_failed)
+        self.render_thread.start()
+        QApplication.instance().aboutToQuit.connect(self.render_thread.stop)
+
+    def showEvent(self, event):
+        # The icon font is loaded here rather than at startup, since the window opens on the upload screen.
+        if self.spinner is None:
+            import qtawesome as qta
+
+            self.export_button.setIcon(icon('fa5s.file-export', scalefactor=0.5))
+            self.save_button.setIcon(icon('fa5s.save', scalefactor=0.5))
+            self.render_button.setIcon(icon('fa5s.list', scalefactor=0.5))
+
+            # Spinner shown over the preview while a render is in flight.
+            self.spinner = qta.IconWidget(parent=self.image_label)
+            self.spinner.setIconSize(QSize(48, 48))
+            self.spinner.setIcon(qta.icon('fa5s.spinner', color='white', animation=qta.Spin(self.spinner)))
+            self.spinner.setFixedSize(48, 48)
+            self.spinner.setVisible(False)
+        super().showEvent(event)
 
     def export_to_blender(self):
         blender_file_path, _ = QFileDialog.getSaveFileName(self, "Export to Blender File", "", "Blender Files (*.blend)")
@@ -350,112 +420,7 @@ class EffectsScreen(QWidget):
             effect_name = self.selected_effect
 
             # Specify the source Blender preset file path based on the selected effect
-            preset_file_path = ""
-
-                       
-            if effect_name == "Y-Right":
-                preset_file_path = "./warp presets/right.blend"
-            elif effect_name == "Y-Left":
-                preset_file_path = "./warp presets/left.blend"
-            elif effect_name == "X-Top":
-                preset_file_path = "./warp presets/top.blend"
-            elif effect_name == "X-Bottom":
-                preset_file_path = "./warp presets/bottom.blend"
-            # Rotation
-            elif effect_name == "90°":
-                preset_file_path = "./warp presets/90.blend"
-            elif effect_name == "180°":
-                preset_file_path = "./warp presets/180.blend"
-            elif effect_name == "270°":
-                preset_file_path = "./warp presets/270.blend"
-            elif effect_name == "360":
-                preset_file_path = "./warp presets/360.blend"
-            # Fold Corners
-            elif effect_name == "Fold TL":
-                preset_file_path = "./warp presets/fold_tl.blend"
-            elif effect_name == "Fold TR":
-                preset_file_path = "./warp presets/fold_tr.blend"
-            elif effect_name == "Fold BL":
-                preset_file_path = "./warp presets/fold_bl.blend"
-            elif effect_name == "Fold BR":
-                preset_file_path = "./warp presets/fold_br.blend"
-            elif effect_name == "Fold Both Right":
-                preset_file_path = "./warp presets/fold_both_r.blend"
-            elif effect_name == "Fold Both Top":
-                preset_file_path = "./warp presets/fold_both_t.blend"
-            elif effect_name == "Fold Vertical":
-                preset_file_path = "./warp presets/fold_v.blend"
-            elif effect_name == "Fold Horizontal":
-                preset_file_path = "./warp presets/fold_h.blend"
-            elif effect_name == "Fold Diagonal 1":
-                preset_file_path = "./warp presets/fold_d1.blend"
-            elif effect_name == "Fold Diagonal 2":
-                preset_file_path = "./warp presets/fold_d2.blend"
-            # Crumpled
-            elif effect_name == "Easy Crumpled 1":
-                preset_file_path = "./warp presets/easy_crumpled_1.blend"
-            elif effect_name == "Easy Crumpled 2":
-                preset_file_path = "./warp presets/easy_crumpled_2.blend"
-            elif effect_name == "Hard Crumpled 1":
-                preset_file_path = "./warp presets/hard_crumpled_1.blend"
-            elif effect_name == "Hard Crumpled 2":
-                preset_file_path = "./warp presets/hard_crumpled_2.blend"
-            # Crease Corners
-            elif effect_name == "Crease TL":
-                preset_file_path = "./warp presets/crease_tl.blend"
-            elif effect_name == "Crease TR":
-                preset_file_path = "./warp presets/crease_tr.blend"
-            elif effect_name == "Crease BL":
-                preset_file_path = "./warp presets/crease_bl.blend"
-            elif effect_name == "Crease BR":
-                preset_file_path = "./warp presets/crease_br.blend"
-            elif effect_name == "Crease Both Right":
-                preset_file_path = "./warp presets/crease_both_r.blend"
-            elif effect_name == "Crease Both Left":
-                preset_file_path = "./warp presets/crease_both_l.blend"
-            elif effect_name == "Crease Both Top":
-                preset_file_path = "./warp presets/crease_both_t.blend"
-            elif effect_name == "Crease Both Bottom":
-                preset_file_path = "./warp presets/crease_both_b.blend"
-            elif effect_name == "Crease All Corners":
-                preset_file_path = "./warp presets/crease_all.blend"
-            # Crease Axes
-            elif effect_name == "Crease Vertical":
-                preset_file_path = "./warp presets/crease_v_single.blend"
-            elif effect_name == "Crease Multiple Vertical":
-                preset_file_path = "./warp presets/crease_v_multiple.blend"
-            elif effect_name == "Crease Horizontal":
-                preset_file_path = "./warp presets/crease_h_single.blend"
-            elif effect_name == "Crease Multiple Horizontal":
-                preset_file_path = "./warp presets/crease_h_multiple.blend"
-            elif effect_name == "Crease Diagonal 1":
-                preset_file_path = "./warp presets/crease_d1.blend"
-            elif effect_name == "Crease Diagonal 2":
-                preset_file_path = "./warp presets/crease_d2.blend"
-            elif effect_name == "Plus(+)":
-                preset_file_path = "./warp presets/crease_plus.blend"
-            elif effect_name == "Cross(X)":
-                preset_file_path = "./warp presets/crease_cross.blend"                
-            # Curled
-            elif effect_name == "Curl TL":
-                preset_file_path = "./warp presets/curl_tl.blend"
-            elif effect_name == "Curl TR":
-                preset_file_path = "./warp presets/curl_tr.blend"
-            elif effect_name == "Curl BL":
-                preset_file_path = "./warp presets/curl_bl.blend"
-            elif effect_name == "Curl BR":
-                preset_file_path = "./warp presets/curl_br.blend"
-            elif effect_name == "Curl Both Right":
-                preset_file_path = "./warp presets/curl_both_r.blend"
-            elif effect_name == "Curl Both Left":
-                preset_file_path = "./warp presets/curl_both_l.blend"
-            elif effect_name == "Curl Both Top":
-                preset_file_path = "./warp presets/curl_both_t.blend"
-            elif effect_name == "Curl Both Bottom":
-                preset_file_path = "./warp presets/curl_both_b.blend"
-            elif effect_name == "Curl All Corners":
-                preset_file_path = "./warp presets/curl_all_corners.blend"
-
+            preset_file_path = self.presets.path_for(effect_name)
 
             if preset_file_path:
                 try:
@@ -475,133 +440,70 @@ class EffectsScreen(QWidget):
         if effect_button.isChecked():
             self.selected_effect = effect_button.text()
             self.export_button.setVisible(True)
-            if self.selected_effect == "Y-Right":
-                blender_file_path = "./warp presets/right.blend"
-            elif self.selected_effect == "Y-Left":
-                blender_file_path = "./warp presets/left.blend"
-            elif self.selected_effect == "X-Top":
-                blender_file_path = "./warp presets/top.blend"
-            elif self.selected_effect == "X-Bottom":
-                blender_file_path = "./warp presets/bottom.blend"
-            # Rotation
-            elif self.selected_effect == "90°":
-                blender_file_path = "./warp presets/90.blend"
-            elif self.selected_effect == "180°":
-                blender_file_path = "./warp presets/180.blend"
-            elif self.selected_effect == "270°":
-                blender_file_path = "./warp presets/270.blend"
-            elif self.selected_effect == "360":
-                blender_file_path = "./warp presets/360.blend"
-            # Fold Corners
-            elif self.selected_effect == "Fold TL":
-                blender_file_path = "./warp presets/fold_tl.blend"
-            elif self.selected_effect == "Fold TR":
-                blender_file_path = "./warp presets/fold_tr.blend"
-            elif self.selected_effect == "Fold BL":
-                blender_file_path = "./warp presets/fold_bl.blend"
-            elif self.selected_effect == "Fold BR":
-                blender_file_path = "./warp presets/fold_br.blend"
-            elif self.selected_effect == "Fold Both Right":
-                blender_file_path = "./warp presets/fold_both_r.blend"
-            elif self.selected_effect == "Fold Both Top":
-                blender_file_path = "./warp presets/fold_both_t.blend"
-           
-            # Fold Axes
-            elif self.selected_effect == "Fold Vertical":
-                blender_file_path = "./warp presets/fold_v.blend"
-            elif self.selected_effect == "Fold Horizontal":
-                blender_file_path = "./warp presets/fold_h.blend"
-            elif self.selected_effect == "Fold Diagonal 1":
-                blender_file_path = "./warp presets/fold_d1.blend"
-            elif self.selected_effect == "Fold Diagonal 2":
-                blender_file_path = "./warp presets/fold_d2.blend"
-            # Crumpled
-            elif self.selected_effect == "Easy Crumpled 1":
-                blender_file_path = "./warp presets/easy_crumpled_1.blend"
-            elif self.selected_effect == "Easy Crumpled 2":
-                blender_file_path = "./warp presets/easy_crumpled_2.blend"
-            elif self.selected_effect == "Hard Crumpled 1":
-                blender_file_path = "./warp presets/hard_crumpled_1.blend"
-            elif self.selected_effect == "Hard Crumpled 2":
-                blender_file_path = "./warp presets/hard_crumpled_2.blend"
-            # Crease Corners
-            elif self.selected_effect == "Crease TL":
-                blender_file_path = "./warp presets/crease_tl.blend"
-            elif self.selected_effect == "Crease TR":
-                blender_file_path = "./warp presets/crease_tr.blend"
-            elif self.selected_effect == "Crease BL":
-                blender_file_path = "./warp presets/crease_bl.blend"
-            elif self.selected_effect == "Crease BR":
-                blender_file_path = "./warp presets/crease_br.blend"
-            elif self.selected_effect == "Crease Both Right":
-                blender_file_path = "./warp presets/crease_both_r.blend"
-            elif self.selected_effect == "Crease Both Left":
-                blender_file_path = "./warp presets/crease_both_l.blend"
-            elif self.selected_effect == "Crease Both Top":
-                blender_file_path = "./warp presets/crease_both_t.blend"
-            elif self.selected_effect == "Crease Both Bottom":
-                blender_file_path = "./warp presets/crease_both_b.blend"
-            elif self.selected_effect == "Crease All Corners":
-                blender_file_path = "./warp presets/crease_all.blend"
-            # Crease Axes
-            elif self.selected_effect == "Crease Vertical":
-                blender_file_path = "./warp presets/crease_v_single.blend"
-            elif self.selected_effect == "Crease Multiple Vertical":
-                blender_file_path = "./warp presets/crease_v_multiple.blend"
-            elif self.selected_effect == "Crease Horizontal":
-                blender_file_path = "./warp presets/crease_h_single.blend"
-            elif self.selected_effect == "Crease Multiple Horizontal":
-                blender_file_path = "./warp presets/crease_h_multiple.blend"
-            elif self.selected_effect == "Crease Diagonal 1":
-                blender_file_path = "./warp presets/crease_d1.blend"
-            elif self.selected_effect == "Crease Diagonal 2":
-                blender_file_path = "./warp presets/crease_d2.blend"
-            elif self.selected_effect == "Plus(+)":
-                blender_file_path = "./warp presets/crease_plus.blend"
-            elif self.selected_effect == "Cross(X)":
-                blender_file_path = "./warp presets/crease_cross.blend"
-            # Curled
-            elif self.selected_effect == "Curl TL":
-                blender_file_path = "./warp presets/curl_tl.blend"
-            elif self.selected_effect == "Curl TR":
-                blender_file_path = "./warp presets/curl_tr.blend"
-            elif self.selected_effect == "Curl BL":
-                blender_file_path = "./warp presets/curl_bl.blend"
-            elif self.selected_effect == "Curl BR":
-                blender_file_path = "./warp presets/curl_br.blend"
-            elif self.selected_effect == "Curl Both Right":
-                blender_file_path = "./warp presets/curl_both_r.blend"
-            elif self.selected_effect == "Curl Both Left":
-                blender_file_path = "./warp presets/curl_both_l.blend"
-            elif self.selected_effect == "Curl Both Top":
-                blender_file_path = "./warp presets/curl_both_t.blend"
-            elif self.selected_effect == "Curl Both Bottom":
-                blender_file_path = "./warp presets/curl_both_b.blend"
-            elif self.selected_effect == "Curl All Corners":
-                blender_file_path = "./warp presets/curl_all_corners.blend"
-
-            output_path = render_image(blender_file_path,image_path,self.selected_effect)
-            pixmap = QPixmap(output_path)
-            self.set_image(pixmap)
-            self.save_button.setVisible(True)
+            blender_file_path = self.presets.path_for(self.selected_effect)
+
+            self.selected_preset_path = blender_file_path
+            self.preview_request += 1
+            self.show_spinner()
+            self.render_thread.submit(self.preview_request, blender_file_path, image_path, self.selected_effect)
         else:
             self.selected_effect = None
+            self.selected_preset_path = None
             self.export_button.setVisible(False)
             self.save_button.setVisible(False)
 
 
+    def preview_rendered(self, request_id, result):
+        # Results for effects the user has already clicked away from are dropped.
+        if request_id != self.preview_request:
+            return
+        self.spinner.setVisible(False)
+        if isinstance(result, str):
+            pixmap = QPixmap(result)
+        else:
+            pixmap = QPixmap.fromImage(pixels_to_qimage(result))
+        self.set_image(pixmap)
+        self.save_button.setVisible(self.selected_effect is not None)
+
+    def preview_failed(self, request_id, message):
+        if request_id != self.preview_request:
+            return
+        self.spinner.setVisible(False)
+        QMessageBox.critical(self, "Render Error", "An error occurred while rendering the effect:\n" + message)
+
+    def show_spinner(self):
+        self.spinner.move((self.image_label.width() - self.spinner.width()) // 2,
+                          (self.image_label.height() - self.spinner.height()) // 2)
+        self.spinner.setVisible(True)
+        self.spinner.raise_()
+
     def save_image(self):
-        if self.image_label.pixmap():
+        if self.image_label.pixmap() and self.selected_preset_path:
             file_path, _ = QFileDialog.getSaveFileName(
                 self, "Save Image", "", "PNG Image (*.png);;All Files (*)"
             )
             if file_path:
-                self.image_label.pixmap().save(file_path, "PNG")
+                if not file_path.lower().endswith(".png"):
+                    file_path += ".png"
+                # The preview is a scaled-down, low-sample render; save a full-quality render instead.
+                progress_dialog = QProgressDialog("Rendering "+self.selected_effect+" at full quality ...", None, 0, 0, self)
+                progress_dialog.setMinimumSize(300, 100)
+                progress_dialog.setWindowTitle("Attention")
+                progress_dialog.setWindowModality(Qt.WindowModal)
+                progress_dialog.show()
+                preset_path, source_path, effect_name = self.selected_preset_path, image_path, self.selected_effect
+
+                def task(thread):
+                    render_image(preset_path, source_path, effect_name, output_path=file_path)
+
+                def done(error):
+                    progress_dialog.hide()
+                    if error:
+                        QMessageBox.critical(self, "Save Error", "An error occurred while rendering the file:\n" + error)
+
+                self.render_thread.run_task(task, done)
 
     def render_all_effects(self):
-        dataset_dir = "dataset"
-        if not os.path.exists(dataset_dir):
-            os.makedirs(dataset_dir)
         global image_path
         base_image_path = image_path 
         base_image_name = os.path.basename(base_image_path)
@@ -610,131 +512,60 @@ class EffectsScreen(QWidget):
         if not os.path.exists(dataset_dir):
             os.makedirs(dataset_dir)
 
-        effect_names =[ "Y-Left","Y-Right","X-Top","X-Bottom","90°","180°","270°","360","Fold TL","Fold TR","Fold BL","Fold BR","Fold Both Right","Fold Both Left","Fold Both Top","Fold Both Bottom","Fold Vertical","Fold Horizontal","Fold Diagonal 1","Fold Diagonal 2","Easy Crumpled 1", "Easy Crumpled 2" , "Hard Crumpled 1","Hard Crumpled 2","Crease TL","Crease TR","Crease BL","Crease BR","Crease Both Right","Crease Both Left","Crease Both Top","Crease Both Bottom","Crease All Corners","Crease Vertical","Crease Multiple Vertical","Crease Horizontal","Crease Multiple Horizontal","Crease Diagonal 1","Crease Diagonal 2","Plus(+)","Cross(X)","Curl TL","Curl TR","Curl BL","Curl BR","Curl Both Right","Curl Both Left","Curl Both Top","Curl Both Bottom","Curl All Corners"]
-        for effect_name in effect_names:
-
-            self.progress_dialog = QProgressDialog("Rendering "+effect_name+" ...", None, 0, 0, self)
-            self.progress_dialog.setMinimumSize(300, 100)
-            self.progress_dialog.setWindowTitle("Attention")
-            self.progress_dialog.setWindowModality(Qt.WindowModal)
-            self.progress_dialog.setAutoClose(False)
-            self.progress_dialog.setAutoReset(False)
-            self.progress_dialog.show()
-            QApplication.processEvents()  
-            
-            if effect_name == "Y-Right":
-                blender_file_path = "./warp presets/right.blend"
-            elif effect_name == "Y-Left":
-                blender_file_path = "./warp presets/left.blend"
-            elif effect_name == "X-Top":
-                blender_file_path = "./warp presets/top.blend"
-            elif effect_name == "X-Bottom":
-                blender_file_path = "./warp presets/bottom.blend"
-            # Rotation
-            elif effect_name == "90°":
-                blender_file_path = "./warp presets/90.blend"
-            elif effect_name == "180°":
-                blender_file_path = "./warp presets/180.blend"
-            elif effect_name == "270°":
-                blender_file_path = "./warp presets/270.blend"
-            elif effect_name == "360":
-                blender_file_path = "./warp presets/360.blend"
-            # Fold Corners
-            elif effect_name == "Fold TL":
-                blender_file_path = "./warp presets/fold_tl.blend"
-            elif effect_name == "Fold TR":
-                blender_file_path = "./warp presets/fold_tr.blend"
-            elif effect_name == "Fold BL":
-                blender_file_path = "./warp presets/fold_bl.blend"
-            elif effect_name == "Fold BR":
-                blender_file_path = "./warp presets/fold_br.blend"
-            elif effect_name == "Fold Both Right":
-                blender_file_path = "./warp presets/fold_both_r.blend"
-            elif effect_name == "Fold Both Top":
-                blender_file_path = "./warp presets/fold_both_t.blend"
-            elif effect_name == "Fold Vertical":
-                blender_file_path = "./warp presets/fold_v.blend"
-            elif effect_name == "Fold Horizontal":
-                blender_file_path = "./warp presets/fold_h.blend"
-            elif effect_name == "Fold Diagonal 1":
-                blender_file_path = "./warp presets/fold_d1.blend"
-            elif effect_name == "Fold Diagonal 2":
-                blender_file_path = "./warp presets/fold_d2.blend"
-            # Crumpled
-            elif effect_name == "Easy Crumpled 1":
-                blender_file_path = "./warp presets/easy_crumpled_1.blend"
-            elif effect_name == "Easy Crumpled 2":
-                blender_file_path = "./warp presets/easy_crumpled_2.blend"
-            elif effect_name == "Hard Crumpled 1":
-                blender_file_path = "./warp presets/hard_crumpled_1.blend"
-            elif effect_name == "Hard Crumpled 2":
-                blender_file_path = "./warp presets/hard_crumpled_2.blend"
-            # Crease Corners
-            elif effect_name == "Crease TL":
-                blender_file_path = "./warp presets/crease_tl.blend"
-            elif effect_name == "Crease TR":
-                blender_file_path = "./warp presets/crease_tr.blend"
-            elif effect_name == "Crease BL":
-                blender_file_path = "./warp presets/crease_bl.blend"
-            elif effect_name == "Crease BR":
-                blender_file_path = "./warp presets/crease_br.blend"
-            elif effect_name == "Crease Both Right":
-                blender_file_path = "./warp presets/crease_both_r.blend"
-            elif effect_name == "Crease Both Left":
-                blender_file_path = "./warp presets/crease_both_l.blend"
-            elif effect_name == "Crease Both Top":
-                blender_file_path = "./warp presets/crease_both_t.blend"
-            elif effect_name == "Crease Both Bottom":
-                blender_file_path = "./warp presets/crease_both_b.blend"
-            elif effect_name == "Crease All Corners":
-                blender_file_path = "./warp presets/crease_all.blend"
-            # Crease Axes
-            elif effect_name == "Crease Vertical":
-                blender_file_path = "./warp presets/crease_v_single.blend"
-            elif effect_name == "Crease Multiple Vertical":
-                blender_file_path = "./warp presets/crease_v_multiple.blend"
-            elif effect_name == "Crease Horizontal":
-                blender_file_path = "./warp presets/crease_h_single.blend"
-            elif effect_name == "Crease Multiple Horizontal":
-                blender_file_path = "./warp presets/crease_h_multiple.blend"
-            elif effect_name == "Crease Diagonal 1":
-                blender_file_path = "./warp presets/crease_d1.blend"
-            elif effect_name == "Crease Diagonal 2":
-                blender_file_path = "./warp presets/crease_d2.blend"
-            elif effect_name == "Plus(+)":
-                blender_file_path = "./warp presets/crease_plus.blend"
-            elif effect_name == "Cross(X)":
-                blender_file_path = "./warp presets/crease_cross.blend"                
-            # Curled
-            elif effect_name == "Curl TL":
-                blender_file_path = "./warp presets/curl_tl.blend"
-            elif effect_name == "Curl TR":
-                blender_file_path = "./warp presets/curl_tr.blend"
-            elif effect_name == "Curl BL":
-                blender_file_path = "./warp presets/curl_bl.blend"
-            elif effect_name == "Curl BR":
-                blender_file_path = "./warp presets/curl_br.blend"
-            elif effect_name == "Curl Both Right":
-                blender_file_path = "./warp presets/curl_both_r.blend"
-            elif effect_name == "Curl Both Left":
-                blender_file_path = "./warp presets/curl_both_l.blend"
-            elif effect_name == "Curl Both Top":
-                blender_file_path = "./warp presets/curl_both_t.blend"
-            elif effect_name == "Curl Both Bottom":
-                blender_file_path = "./warp presets/curl_both_b.blend"
-            elif effect_name == "Curl All Corners":
-                blender_file_path = "./warp presets/curl_all_corners.blend"
-
-            timestamp = str(int(time.time()))  
-            output_image_name = f"{effect_name}_{timestamp}_output.png"
-
-            output_image_path = os.path.join(dataset_dir, output_image_name)
-
-            output_path=render_image(blender_file_path, base_image_path, effect_name)
-
-            shutil.move(output_path, output_image_path)
-
+        effects = [(effect_name, self.presets.path_for(effect_name)) for effect_name in self.presets.effect_names()]
+
+        self.progress_dialog = QProgressDialog("Rendering ...", None, 0, 0, self)
+        self.progress_dialog.setMinimumSize(300, 100)
+        self.progress_dialog.setWindowTitle("Attention")
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setAutoReset(False)
+        self.render_thread.progress.connect(self.progress_dialog.setLabelText)
+        self.progress_dialog.show()
+
+        # Runs on the render thread; the manifest is opened there too, since SQLite connections
+        # belong to the thread that opened them.
+        def task(thread):
+            manifest = JobManifest(os.path.join(dataset_dir, MANIFEST_NAME))
+            try:
+                for effect_name, blender_file_path in effects:
+                    thread.progress.emit("Rendering "+effect_name+" ...")
+
+                    # Named by content hash, so the same document and effect always map to the same file
+                    # and a run that was interrupted picks up where it stopped.
+                    job = {"image_path": base_image_path, "preset_path": blender_file_path, "settings": {"effect": effect_name}}
+                    job["job_id"] = manifest.job_id(base_image_path, blender_file_path, job["settings"])
+                    job["output_path"] = os.path.join(dataset_dir, output_name(base_image_path, blender_file_path, job["job_id"]) + ".png")
+                    manifest.record([job])
+                    if job["job_id"] in manifest.done_ids() and os.path.exists(job["output_path"]):
+                        continue
+
+                    try:
+                        key = self.result_cache.key(base_image_path, blender_file_path, {"effect": effect_name})
+                        cached_path = self.result_cache.get(key)
+                        if cached_path is None:
+                            pixels=render_image(blender_file_path, base_image_path, effect_name)
+                            # Encode once and write the same bytes to the dataset and the cache.
+                            png_data = encode_png(pixels)
+                            with open(job["output_path"], "wb") as f:
+                                f.write(png_data)
+                            self.result_cache.put_bytes(key, png_data)
+                        else:
+                            shutil.copyfile(cached_path, job["output_path"])
+                        manifest.mark_done(job["job_id"])
+                    except Exception as e:
+                        manifest.mark_failed(job["job_id"], str(e))
+                        print("Rendering " + effect_name + " failed: " + str(e))
+            finally:
+                manifest.close()
+
+        def done(error):
+            self.render_thread.progress.disconnect(self.progress_dialog.setLabelText)
             self.progress_dialog.hide()
+            if error:
+                QMessageBox.critical(self, "Render Error", "An error occurred while rendering the effects:\n" + error)
+
+        self.render_thread.run_task(task, done)
 
     def set_image(self, pixmap):
         window_size = self.parent().size()  
@@ -746,8 +577,15 @@ class EffectsScreen(QWidget):
 if __name__ == "__main__":
 
     app = QApplication(sys.argv)
-    apply_stylesheet(app, theme='dark_blue.xml')
+    apply_theme(app)
     window = MainWindow()
     window.setMinimumSize(1000, 800)
     window.show()
+
+    def window_shown():
+        # Runs once the event loop has drawn the window; Blender starts loading only after that.
+        print(f"Window shown {time.perf_counter() - started:.2f} s after start")
+        window.effects_screen.render_thread.warm_up()
+
+    QTimer.singleShot(0, window_shown)
     sys.exit(app.exec())
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from result_cache import file_hash
+
+MANIFEST_NAME = "manifest.sqlite"
+
+
+class JobManifest:
+    # SQLite record of every (input hash, preset hash, settings) -> output path with its status,
+    # so an interrupted batch resumes by skipping finished jobs and retrying only failed ones.
+    # File hashes are memoised in the database on (size, mtime), so a restart does not re-read every input.
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        # WAL keeps the per-job status updates cheap and lets other processes read a running manifest.
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            image_hash TEXT, preset_hash TEXT, settings TEXT,
+            image_path TEXT, preset_path TEXT, output_path TEXT,
+            status TEXT, attempts INTEGER DEFAULT 0, error TEXT, updated REAL)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)""")
+        self.db.commit()
+        self.hashes = {}
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self.hashes:
+            self.hashes[memo_key] = self.stored_hash(path, stat)
+        return self.hashes[memo_key]
+
+    def stored_hash(self, path, stat):
+        row = self.db.execute("SELECT hash FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                              (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+        digest = file_hash(path)
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def job_id(self, image_path, preset_path, settings=None):
+        # Same inputs and settings always give the same id, whatever the file names or run order.
+        digest = hashlib.sha256()
+        digest.update(self.file_hash(image_path).encode())
+        digest.update(self.file_hash(preset_path).encode())
+        digest.update(json.dumps(settings or {}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def record(self, jobs):
+        # Adds jobs not seen before as pending; jobs from an earlier run keep their status.
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR IGNORE INTO jobs (job_id, image_hash, preset_hash, settings, image_path, preset_path, "
+            "output_path, status, updated) VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?)",
+            [(job["job_id"], self.file_hash(job["image_path"]), self.file_hash(job["preset_path"]),
+              json.dumps(job["settings"], sort_keys=True), job["image_path"], job["preset_path"],
+              job["output_path"], now) for job in jobs])
+        self.db.commit()
+
+    def done_ids(self):
+        return {row[0] for row in self.db.execute("SELECT job_id FROM jobs WHERE status = 'done'")}
+
+    def failed_ids(self):
+        return {row[0] for row in self.db.execute("SELECT job_id FROM jobs WHERE status = 'failed'")}
+
+    def mark_done(self, job_id):
+        self.db.execute("UPDATE jobs SET status = 'done', attempts = attempts + 1, error = NULL, updated = ? "
+                        "WHERE job_id = ?", (time.time(), job_id))
+        self.db.commit()
+
+    def mark_failed(self, job_id, error):
+        self.db.execute("UPDATE jobs SET status = 'failed', attempts = attempts + 1, error = ?, updated = ? "
+                        "WHERE job_id = ?", (error, time.time(), job_id))
+        self.db.commit()
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def output_name(image_path, preset_path, job_id):
+    # Readable stems plus a slice of the content hash: distinct jobs never collide on a name.
+    image_stem = os.path.splitext(os.path.basename(image_path))[0]
+    preset_stem = os.path.splitext(os.path.basename(preset_path))[0]
+    return f"{image_stem}_{preset_stem}_{job_id[:12]}"
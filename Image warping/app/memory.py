@@ -0,0 +1,18 @@
+import resource
+import sys
+
+
+def current_rss_bytes():
+    # Resident set size right now; falls back to the peak where /proc is unavailable.
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except OSError:
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
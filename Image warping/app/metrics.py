@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+
+from stages import STAGE_HOOKS
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class JobEvents:
+    # Gathers the stage timings of the current job and hands one summary event per job to emit().
+    # Files encoded by the background writer (output_writer) finish after their job, on another
+    # thread, so each "encode" stage is handed to emit() as an event of its own.
+    def __init__(self, worker_id=0):
+        self.worker_id = worker_id
+        self.stages = {}
+        self.details = {}
+
+    def __call__(self, name, seconds, info):
+        if name == "encode":
+            self.emit({
+                "event": "encode",
+                "time": time.time(),
+                "worker": self.worker_id,
+                "pid": os.getpid(),
+                "preset": info.get("preset"),
+                "image": info.get("image"),
+                "format": info.get("format"),
+                "encode_seconds": seconds,
+                "bytes_written": info.get("bytes", 0),
+                "ok": "error" not in info,
+                "error": info.get("error"),
+            })
+            return
+        if name != "job":
+            self.stages[name] = self.stages.get(name, 0) + seconds
+            self.details.update(info)
+            return
+        event = {
+            "event": "job",
+            "time": time.time(),
+            "worker": self.worker_id,
+            "pid": os.getpid(),
+            "preset": info.get("preset"),
+            "effect": info.get("effect"),
+            "image": info.get("image"),
+            "input_bytes": info.get("input_bytes"),
+            "input_width": self.details.get("width"),
+            "input_height": self.details.get("height"),
+            "bake_seconds": self.stages.get("bake", 0),
+            "render_seconds": self.stages.get("render", 0),
+            "total_seconds": seconds,
+            "bytes_written": self.details.get("bytes", 0),
+            "stages": self.stages,
+            "ok": "error" not in info,
+            "error": info.get("error"),
+        }
+        self.stages = {}
+        self.details = {}
+        self.emit(event)
+
+    def emit(self, event):
+        raise NotImplementedError
+
+
+class EventLog(JobEvents):
+    # Appends one JSON line per job. Lines are written in a single call, so several worker
+    # processes can share one log file.
+    def __init__(self, path, worker_id=0):
+        super().__init__(worker_id)
+        self.file = open(path, "a", buffering=1)
+
+    def emit(self, event):
+        self.file.write(json.dumps(event) + "\n")
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class PrometheusExporter(JobEvents):
+    # Keeps job counters and per-stage latency histograms and rewrites a node_exporter textfile
+    # (<directory>/image_warping_worker<id>.prom) after every job. Throughput is rate(image_warping_jobs_total).
+    def __init__(self, directory, worker_id=0):
+        super().__init__(worker_id)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"image_warping_worker{worker_id}.prom")
+        self.jobs = {}
+        self.bytes_written = 0
+        self.histograms = {}
+        # Writer threads report encodes while the render thread reports jobs.
+        self.lock = threading.Lock()
+
+    def emit(self, event):
+        with self.lock:
+            if event["event"] == "encode":
+                self.bytes_written += event["bytes_written"]
+                self.histograms.setdefault("encode", Histogram()).observe(event["encode_seconds"])
+            else:
+                self.count_job(event)
+            self.write()
+
+    def count_job(self, event):
+        status = "ok" if event["ok"] else "failed"
+        key = (event["preset"], status)
+        self.jobs[key] = self.jobs.get(key, 0) + 1
+        self.bytes_written += event["bytes_written"]
+        for name, seconds in dict(event["stages"], job=event["total_seconds"]).items():
+            self.histograms.setdefault(name, Histogram()).observe(seconds)
+
+    def write(self):
+        worker = f'worker="{self.worker_id}"'
+        lines = [
+            "# HELP image_warping_jobs_total Render jobs finished, by preset and status.",
+            "# TYPE image_warping_jobs_total counter",
+        ]
+        for (preset, status), count in sorted(self.jobs.items()):
+            lines.append(f'image_warping_jobs_total{{{worker},preset="{preset}",status="{status}"}} {count}')
+        lines += [
+            "# HELP image_warping_bytes_written_total Bytes of encoded output written.",
+            "# TYPE image_warping_bytes_written_total counter",
+            f"image_warping_bytes_written_total{{{worker}}} {self.bytes_written}",
+            "# HELP image_warping_stage_seconds Wall time of each render stage.",
+            "# TYPE image_warping_stage_seconds histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            labels = f'{worker},stage="{name}"'
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                lines.append(f'image_warping_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'image_warping_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"image_warping_stage_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"image_warping_stage_seconds_count{{{labels}}} {histogram.count}")
+        # Written to a temporary name and renamed, so the collector never reads half a file.
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+def install(event_log=None, metrics_dir=None, worker_id=0):
+    # Registers the requested hooks for this process; both are optional.
+    if event_log:
+        STAGE_HOOKS.append(EventLog(event_log, worker_id))
+    if metrics_dir:
+        STAGE_HOOKS.append(PrometheusExporter(metrics_dir, worker_id))
@@ -0,0 +1,90 @@
+import os
+import queue
+import threading
+import time
+
+from encoders import OUTPUT_FORMATS, encode
+from stages import stage
+
+
+def write_encoded(path, pixels, output_format="png", compress_level=6, info=None):
+    # Encodes one file and writes it atomically, reported to the stage hooks as "encode" with info
+    # (e.g. the preset and image). Returns the number of bytes written.
+    with stage("encode", format=output_format, **(info or {})) as details:
+        data = encode(pixels, output_format, compress_level)
+        tmp_path = f"{path}.tmp{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        details["bytes"] = len(data)
+    return len(data)
+
+
+class AsyncWriter:
+    # Encodes rendered pixel buffers and writes them to disk on a few background threads, so the next
+    # render starts while the previous one is still being compressed. The queue is bounded: when the
+    # writers fall behind, submit() blocks instead of holding every finished frame in memory.
+    def __init__(self, output_format="png", compress_level=6, threads=2, queue_size=8):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}; choose from {', '.join(OUTPUT_FORMATS)}")
+        self.output_format = output_format
+        self.compress_level = compress_level
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.finished = queue.Queue()
+        self.lock = threading.Lock()
+        self.encode_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.bytes_written = 0
+        self.files = 0
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(max(1, threads))]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, path, pixels, job=None, info=None):
+        # job is handed back unchanged by done() once the file is on disk (or failed to write).
+        # info is passed to the "encode" stage hooks, e.g. the preset and image for the event log.
+        start = time.perf_counter()
+        self.queue.put((path, pixels, job, info or {}))
+        self.wait_seconds += time.perf_counter() - start
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, pixels, job, info = item
+            error = None
+            written = 0
+            start = time.perf_counter()
+            try:
+                written = write_encoded(path, pixels, self.output_format, self.compress_level, info)
+            except Exception as e:
+                error = str(e)
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.encode_seconds += seconds
+                self.bytes_written += written
+                self.files += 0 if error else 1
+            self.finished.put((job, error))
+
+    def done(self):
+        # (job, error) for every file finished since the last call; error is None on success.
+        finished = []
+        while True:
+            try:
+                finished.append(self.finished.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def close(self):
+        # Waits for the queued files and returns the ones finished since the last done().
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return self.done()
+
+    def summary(self):
+        return (f"Encoded {self.files} {self.output_format} files ({self.bytes_written / 1024 ** 2:.1f} MB) "
+                f"in {self.encode_seconds:.1f} s on {len(self.threads)} writer threads; "
+                f"rendering waited {self.wait_seconds:.1f} s for the writers")
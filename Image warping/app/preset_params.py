@@ -0,0 +1,43 @@
+import os
+import random
+
+from preset_registry import EFFECT_GROUPS
+
+# Parameters each effect group exposes and the range they are sampled from, in degrees added to the
+# preset's own camera or page. The shipped Fold, Crease, Crumpled and Curled presets store their
+# deformation baked into the page mesh (no modifiers, cloth or shape keys), so there is nothing to
+# scale and those groups have no parameters: --variants renders them once, as saved.
+PRESET_PARAMETERS = {
+    "Perspective": {"camera_tilt": (-8.0, 8.0)},
+    "Rotation": {"rotation": (-15.0, 15.0)},
+}
+# The deformation parameters scale the modifiers of presets built with them (1.0 renders the preset
+# as saved; see renderer.PARAMETER_TARGETS). Rendering one on a preset without such modifiers fails.
+PARAMETER_DEFAULTS = {
+    "camera_tilt": 0.0,
+    "rotation": 0.0,
+    "fold_angle": 1.0,
+    "crumple_strength": 1.0,
+    "crease_depth": 1.0,
+    "curl_radius": 1.0,
+}
+
+GROUP_FOR_STEM = {stem: group for group, effects in EFFECT_GROUPS.items() for stem in effects.values()}
+
+
+def parameters_for(preset_path):
+    stem = os.path.splitext(os.path.basename(preset_path))[0]
+    return PRESET_PARAMETERS.get(GROUP_FOR_STEM.get(stem), {})
+
+
+def sample_variants(preset_path, count, seed=0):
+    # count parameter sets for one preset. The same seed always gives the same variants, and
+    # each preset gets its own stream so adding presets does not reshuffle the others.
+    stem = os.path.splitext(os.path.basename(preset_path))[0]
+    rng = random.Random(f"{seed}:{stem}")
+    ranges = parameters_for(preset_path)
+    if not ranges:
+        # Nothing to vary: one render as the preset was saved.
+        return [{}]
+    return [{name: round(rng.uniform(low, high), 3) for name, (low, high) in sorted(ranges.items())}
+            for _ in range(count)]
@@ -0,0 +1,112 @@
+import json
+import os
+
+from presets import CACHE_ROOT, PRESET_DIR
+from result_cache import file_hash
+
+PRESET_METADATA_DIR = os.path.join(CACHE_ROOT, "preset_metadata")
+
+# The GUI effect groups and the preset file (stem in PRESET_DIR) behind every effect.
+EFFECT_GROUPS = {
+    "Perspective": {
+        "Y-Left": "left", "Y-Right": "right", "X-Top": "top", "X-Bottom": "bottom",
+    },
+    "Rotation": {
+        "90°": "90", "180°": "180", "270°": "270", "360": "360",
+    },
+    "Fold Corners": {
+        "Fold TL": "fold_tl", "Fold TR": "fold_tr", "Fold BL": "fold_bl", "Fold BR": "fold_br",
+        "Fold Both Top": "fold_both_t", "Fold Both Right": "fold_both_r",
+    },
+    "Fold Axes": {
+        "Fold Vertical": "fold_v", "Fold Horizontal": "fold_h", "Fold Diagonal 1": "fold_d1", "Fold Diagonal 2": "fold_d2",
+    },
+    "Crumpled": {
+        "Easy Crumpled 1": "easy_crumpled_1", "Easy Crumpled 2": "easy_crumpled_2",
+        "Hard Crumpled 1": "hard_crumpled_1", "Hard Crumpled 2": "hard_crumpled_2",
+    },
+    "Crease Corners": {
+        "Crease TL": "crease_tl", "Crease TR": "crease_tr", "Crease BL": "crease_bl", "Crease BR": "crease_br",
+        "Crease Both Right": "crease_both_r", "Crease Both Left": "crease_both_l",
+        "Crease Both Top": "crease_both_t", "Crease Both Bottom": "crease_both_b",
+        "Crease All Corners": "crease_all",
+    },
+    "Crease Axes": {
+        "Crease Vertical": "crease_v_single", "Crease Multiple Vertical": "crease_v_multiple",
+        "Crease Horizontal": "crease_h_single", "Crease Multiple Horizontal": "crease_h_multiple",
+        "Crease Diagonal 1": "crease_d1", "Crease Diagonal 2": "crease_d2",
+        "Plus(+)": "crease_plus", "Cross(X)": "crease_cross",
+    },
+    "Curled": {
+        "Curl TL": "curl_tl", "Curl TR": "curl_tr", "Curl BL": "curl_bl", "Curl BR": "curl_br",
+        "Curl Both Right": "curl_both_r", "Curl Both Left": "curl_both_l",
+        "Curl Both Top": "curl_both_t", "Curl Both Bottom": "curl_both_b",
+        "Curl All Corners": "curl_all_corners",
+    },
+}
+EFFECT_FOR_STEM = {stem: effect_name for effects in EFFECT_GROUPS.values() for effect_name, stem in effects.items()}
+
+
+class PresetRegistry:
+    # Scans the preset directory once and maps every effect to its .blend file. Effects whose file
+    # is missing are reported and left out, so callers never end up with a path that does not exist.
+    def __init__(self, preset_dir=PRESET_DIR, groups=EFFECT_GROUPS):
+        available = {os.path.splitext(name)[0] for name in os.listdir(preset_dir) if name.endswith(".blend")}
+        self.groups = {}
+        self.paths = {}
+        missing = []
+        for group, effects in groups.items():
+            self.groups[group] = []
+            for effect_name, stem in effects.items():
+                if stem in available:
+                    self.groups[group].append(effect_name)
+                    self.paths[effect_name] = os.path.join(preset_dir, stem + ".blend")
+                else:
+                    missing.append(f"{effect_name} ({stem}.blend)")
+        if missing:
+            print("Presets missing from " + preset_dir + ": " + ", ".join(missing))
+
+    def effect_names(self):
+        return list(self.paths)
+
+    def path_for(self, effect_name):
+        return self.paths.get(effect_name)
+
+    def metadata(self, effect_name):
+        return load_metadata(self.paths[effect_name])
+
+
+def metadata_path(preset_path, metadata_dir=PRESET_METADATA_DIR):
+    # Keyed by preset content, so an edited preset is inspected again.
+    stem = os.path.splitext(os.path.basename(preset_path))[0]
+    return os.path.join(metadata_dir, f"{stem}_{file_hash(preset_path)[:16]}.json")
+
+
+def load_metadata(preset_path):
+    # What the renderer learned about a preset the first time it opened it, or None before that:
+    # has_physics, smooth_shaded, engine, resolution and render_seconds.
+    try:
+        with open(metadata_path(preset_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_metadata(preset_path, metadata):
+    path = metadata_path(preset_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f)
+    os.replace(tmp_path, path)
+
+
+def record_render_seconds(preset_path, seconds):
+    # Keeps a running estimate of how long the preset takes to render, for scheduling and reporting.
+    metadata = load_metadata(preset_path)
+    if metadata is None:
+        return
+    previous = metadata.get("render_seconds")
+    metadata["render_seconds"] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+    metadata["renders"] = metadata.get("renders", 0) + 1
+    save_metadata(preset_path, metadata)
@@ -0,0 +1,27 @@
+import fnmatch
+import os
+
+PRESET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warp presets")
+CACHE_ROOT = os.environ.get("IMAGE_WARPING_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "image-warping"))
+
+
+def collect_presets(selection, preset_dir=PRESET_DIR):
+    # Presets are selected by file stem, e.g. "fold_*,curl_tl".
+    stems = sorted(os.path.splitext(name)[0] for name in os.listdir(preset_dir) if name.endswith(".blend"))
+    patterns = [pattern.strip() for pattern in selection.split(",") if pattern.strip()]
+    selected = []
+    for stem in stems:
+        if any(fnmatch.fnmatch(stem, pattern) for pattern in patterns):
+            selected.append(os.path.join(preset_dir, stem + ".blend"))
+    return selected
+
+
+def effect_name_for(preset_path):
+    # The GUI effect name of a preset ("Fold TL" for fold_tl.blend), so batch jobs and GUI renders
+    # agree on names, e.g. render_image keys the smooth shading step on it. Presets outside the
+    # effect groups get their title-cased stem.
+    # preset_registry imports this module, so the import waits until the first call.
+    from preset_registry import EFFECT_FOR_STEM
+
+    stem = os.path.splitext(os.path.basename(preset_path))[0]
+    return EFFECT_FOR_STEM.get(stem, stem.replace("_", " ").title())
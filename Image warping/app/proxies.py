@@ -0,0 +1,62 @@
+import os
+
+from presets import CACHE_ROOT
+from result_cache import file_hash
+
+PROXY_DIR = os.path.join(CACHE_ROOT, "proxies")
+# PNG at a low compression level keeps the cache small; uncompressed TGA is the quickest for Blender to load.
+PROXY_FORMATS = {"png": ".png", "tga": ".tga"}
+
+_warned = []
+
+
+def proxy_path(image_path, size, proxy_format="png", proxy_dir=PROXY_DIR):
+    return os.path.join(proxy_dir, f"{file_hash(image_path)[:16]}_{size}{PROXY_FORMATS[proxy_format]}")
+
+
+def source_size(image_path):
+    # The document's own (width, height), read from the file header, or None without Pillow.
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    Image.MAX_IMAGE_PIXELS = None
+    with Image.open(image_path) as image:
+        return image.size
+
+
+def proxy_for(image_path, size, proxy_format="png"):
+    # Returns a copy of the document whose longer side is at most size pixels, cached by content,
+    # or the document itself when it is already that small.
+    path = proxy_path(image_path, size, proxy_format)
+    if os.path.exists(path):
+        return path
+    try:
+        # Pillow is optional here: without it Blender simply loads the full-size document.
+        from PIL import Image
+    except ImportError:
+        if not _warned:
+            _warned.append(True)
+            print("Pillow is not installed; rendering documents at full size.")
+        return image_path
+
+    # Large scans are trusted local inputs, not decompression bombs.
+    Image.MAX_IMAGE_PIXELS = None
+    with Image.open(image_path) as image:
+        if max(image.size) <= size:
+            return image_path
+        scale = size / max(image.size)
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # JPEG scans are decoded straight at a reduced scale instead of at full size.
+        image.draft("RGB", target)
+        mode = "RGBA" if "A" in image.getbands() else "RGB"
+        proxy = image.convert(mode).resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}{PROXY_FORMATS[proxy_format]}"
+    if proxy_format == "png":
+        proxy.save(tmp_path, compress_level=1)
+    else:
+        proxy.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
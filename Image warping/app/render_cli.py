@@ -0,0 +1,784 @@
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+
+from manifest import MANIFEST_NAME, JobManifest, output_name
+from presets import collect_presets, effect_name_for
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def collect_inputs(patterns):
+    # Each pattern may be a directory, a glob or a single file.
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        for path in sorted(matches):
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                inputs.append(os.path.abspath(path))
+    # Keep order but drop duplicates from overlapping patterns.
+    return list(dict.fromkeys(inputs))
+
+
+def output_path_for(out_dir, image_path, preset_path, suffix="", extension=".png"):
+    image_stem = os.path.splitext(os.path.basename(image_path))[0]
+    preset_stem = os.path.splitext(os.path.basename(preset_path))[0]
+    return os.path.join(out_dir, f"{image_stem}_{preset_stem}{suffix}{extension}")
+
+
+def sample_key(image_path, preset_path, suffix=""):
+    # WebDataset treats everything after the first dot as the extension, so keys must not contain dots.
+    return os.path.splitext(os.path.basename(output_path_for("", image_path, preset_path, suffix)))[0].replace(".", "_")
+
+
+def job_settings(effect_name, options=None):
+    # Only the options that change the rendered pixels are part of a job's identity.
+    settings = {"effect": effect_name}
+    settings.update((name, value) for name, value in (options or {}).items()
+                    if name not in ("bake_cache", "reuse", "passes_path"))
+    return settings
+
+
+def build_jobs(inputs, presets, out_dir, skip_existing=False, options=None, write_files=True, manifest=None,
+               quality_for=None, variants_for=None, extension=".png"):
+    # Preset-major order lets each worker keep a preset scene loaded across consecutive documents.
+    # Without write_files the jobs carry no output path and the rendered pixels come back instead.
+    # With a manifest every job gets a content-hash id and is named after it.
+    # quality_for(preset_path) gives the render settings of each preset, e.g. a resolved profile.
+    # variants_for(preset_path) gives (name suffix, extra options) pairs to render every document
+    # with, e.g. parameter sets and simulation frames (see job_variants). The documents of one
+    # variant stay together so a worker re-bakes at most once per parameter set.
+    jobs = []
+    for preset_path in presets:
+        preset_options = options or {}
+        if quality_for is not None:
+            preset_options = dict(preset_options, quality=quality_for(preset_path))
+        variants = variants_for(preset_path) if variants_for is not None else [("", {})]
+        for suffix, extra_options in variants:
+            job_options = dict(preset_options, **extra_options) if extra_options else preset_options
+            for image_path in inputs:
+                effect_name = effect_name_for(preset_path)
+                job = {
+                    "key": sample_key(image_path, preset_path, suffix),
+                    "image_path": image_path,
+                    "preset_path": preset_path,
+                    "effect_name": effect_name,
+                    "output_path": (output_path_for(out_dir, image_path, preset_path, suffix, extension)
+                                    if write_files else None),
+                    "options": job_options,
+                }
+                if manifest is not None:
+                    job["settings"] = job_settings(effect_name, job_options)
+                    job["job_id"] = manifest.job_id(image_path, preset_path, job["settings"])
+                    job["key"] = output_name(image_path, preset_path, job["job_id"]).replace(".", "_")
+                    if write_files:
+                        job["output_path"] = os.path.join(out_dir, job["key"] + extension)
+                if skip_existing and job["output_path"] and os.path.exists(job["output_path"]):
+                    continue
+                jobs.append(job)
+    return jobs
+
+
+def parse_frames(spec):
+    # "10,20,40-100:20" -> [10, 20, 40, 60, 80, 100]
+    frames = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            span, _, step = part.partition(":")
+            first, last = (int(n) for n in span.split("-"))
+            frames.extend(range(first, last + 1, int(step or 1)))
+        else:
+            frames.append(int(part))
+    return list(dict.fromkeys(frames))
+
+
+def preset_has_physics(preset_path):
+    # From the preset's metadata, which is recorded before any job is built if no render has yet, so the
+    # job list does not change once the first render writes it. Without Blender (e.g. only enqueueing)
+    # an uninspected preset counts as static, like every shipped preset.
+    from preset_registry import load_metadata
+
+    metadata = load_metadata(preset_path)
+    if metadata is None:
+        try:
+            from renderer import inspect_preset
+        except ImportError:
+            return False
+        metadata = inspect_preset(preset_path)
+    return metadata["has_physics"]
+
+
+def frame_options(preset_path, frames=None, frame_steps=0, frame_samples=0, seed=0):
+    # The simulation states to render: absolute frames, evenly spaced steps through the bake
+    # (progressively stronger deformations), or a seeded random subset of it. A preset without
+    # physics looks the same on every frame, so it renders once.
+    import random
+
+    if not preset_has_physics(preset_path):
+        return [{}]
+    options = [{"frame": frame} for frame in parse_frames(frames or "")]
+    options += [{"progress": round(step / frame_steps, 3)} for step in range(1, frame_steps + 1)]
+    if frame_samples:
+        stem = os.path.splitext(os.path.basename(preset_path))[0]
+        rng = random.Random(f"{seed}:{stem}:frames")
+        options += [{"progress": progress} for progress in sorted(round(rng.uniform(0.1, 1), 3) for _ in range(frame_samples))]
+    return options or [{}]
+
+
+def job_variants(preset_path, args):
+    # (name suffix, extra render options) for every parameter set x simulation frame of one preset.
+    param_sets = [None]
+    if args.variants:
+        from preset_params import sample_variants
+
+        param_sets = sample_variants(preset_path, args.variants, args.seed)
+    frames = frame_options(preset_path, args.frames, args.frame_steps, args.frame_samples, args.seed)
+    variants = []
+    for index, params in enumerate(param_sets):
+        for frame in frames:
+            suffix = ""
+            extra_options = dict(frame)
+            if params is not None:
+                suffix += f"_v{index}"
+                extra_options["params"] = params
+            if "frame" in frame:
+                suffix += f"_f{frame['frame']}"
+            elif "progress" in frame:
+                suffix += f"_p{round(frame['progress'] * 1000):04d}"
+            variants.append((suffix, extra_options))
+    return variants
+
+
+def can_tile(preset_path, options):
+    # Tiling copies the page object, so it needs a preset without physics and plain single renders.
+    if any(name in options for name in ("passes", "params", "frame", "progress")):
+        return False
+    return not preset_has_physics(preset_path)
+
+
+def group_tiles(jobs, tile_size):
+    # Packs consecutive jobs of the same preset and options into tile jobs of up to tile_size documents.
+    grouped = []
+    batch = []
+    for job in jobs + [None]:
+        if batch and (job is None or len(batch) == tile_size or job["preset_path"] != batch[0]["preset_path"]
+                      or job["options"] != batch[0]["options"]):
+            if len(batch) == 1:
+                grouped.append(batch[0])
+            else:
+                grouped.append({"tile": batch, "preset_path": batch[0]["preset_path"],
+                                "effect_name": batch[0]["effect_name"], "options": batch[0]["options"]})
+            batch = []
+        if job is None:
+            break
+        if can_tile(job["preset_path"], job["options"]):
+            batch.append(job)
+        else:
+            grouped.append(job)
+    return grouped
+
+
+def split_tiles(results):
+    # Turns the result of a tile job back into one result per document.
+    for result in results:
+        if "tile" not in result:
+            yield result
+            continue
+        for index, job in enumerate(result["tile"]):
+            pixels = result["pixels"][index] if result["pixels"] is not None else None
+            yield dict(job, worker_id=result["worker_id"], ok=result["ok"], error=result["error"], pixels=pixels)
+
+
+def run_inline(jobs, threads=None):
+    from renderer import RenderSession
+
+    session = RenderSession()
+    for job in jobs:
+        try:
+            if "tile" in job:
+                output_paths = [tile_job["output_path"] for tile_job in job["tile"]]
+                pixels = session.render_tiled(job["preset_path"], [tile_job["image_path"] for tile_job in job["tile"]],
+                                              job["effect_name"], output_paths, threads=threads, **job["options"])
+            else:
+                pixels = session.render(job["preset_path"], job["image_path"], job["effect_name"], job["output_path"],
+                                        threads=threads, **job["options"])
+            yield dict(job, worker_id=0, ok=True, error=None, pixels=pixels)
+        except Exception as e:
+            yield dict(job, worker_id=0, ok=False, error=str(e), pixels=None)
+
+
+def timed(results, totals):
+    # Passes the results through, adding the time spent waiting for each one to totals["render"].
+    results = iter(results)
+    while True:
+        start = time.perf_counter()
+        try:
+            result = next(results)
+        except StopIteration:
+            return
+        totals["render"] += time.perf_counter() - start
+        yield result
+
+
+def run_pool(jobs, workers, threads, instrumentation=None):
+    from worker_pool import RenderPool
+
+    with RenderPool(workers, threads, instrumentation) as pool:
+        print(f"Started {pool.workers} workers with {pool.threads_per_worker} render threads each")
+        yield from pool.run(jobs)
+
+
+def render(args):
+    inputs = collect_inputs(args.inputs)
+    presets = collect_presets(args.presets)
+    if not inputs:
+        print("No input images matched.")
+        return 1
+    if not presets:
+        print("No presets matched " + args.presets)
+        return 1
+
+    passes = [name.strip() for name in args.passes.split(",") if name.strip()] if args.passes else []
+    write_files = args.format == "files"
+    if passes and not write_files:
+        print("--passes writes its labels next to each PNG, so it needs --format files.")
+        return 1
+    if args.queue and (not write_files or args.output_format != "png"):
+        print("--queue workers write PNG files, so it needs --format files and --output-format png.")
+        return 1
+    if args.output_format != "png" and (passes or args.writer_threads < 1):
+        print("--output-format other than png needs the writer threads and cannot be combined with --passes.")
+        return 1
+    from encoders import OUTPUT_FORMATS
+
+    os.makedirs(args.out, exist_ok=True)
+    options = {"bake_cache": not args.no_bake_cache, "reuse": not args.no_scene_reuse}
+    if passes:
+        options.update(passes=passes, pass_format=args.pass_format)
+    # Documents are swapped for right-sized proxies unless --no-proxy; the choice is part of the render settings.
+    proxy = {"proxy": False} if args.no_proxy else {"proxy_format": args.proxy_format}
+    quality_for = lambda preset_path: proxy
+    if args.profile:
+        from render_profiles import load_overrides, resolve_profile
+
+        overrides = load_overrides(args.profile_overrides)
+        quality_for = lambda preset_path: dict(resolve_profile(args.profile, preset_path, overrides), **proxy)
+    if args.output_format in ("webp", "qoi"):
+        # Both formats store 8 bits per channel; catch a 16-bit profile before anything renders.
+        deep = [os.path.basename(preset_path) for preset_path in presets
+                if int(quality_for(preset_path).get("color_depth", 8)) == 16]
+        if deep:
+            print(f"--output-format {args.output_format} stores 8-bit pixels, but the render profile gives "
+                  f"16-bit output for {', '.join(deep)}; use png or npy, or another profile.")
+            return 1
+    if "uv" in passes:
+        # Only Cycles has a UV pass; check the engine each preset will render with before anything renders.
+        from preset_registry import load_metadata
+
+        engines = {os.path.basename(preset_path): quality_for(preset_path).get("engine")
+                   or (load_metadata(preset_path) or {}).get("engine") for preset_path in presets}
+        not_cycles = [name for name, engine in engines.items() if engine not in (None, "CYCLES")]
+        if not_cycles:
+            print(f"--passes uv needs Cycles, but {', '.join(not_cycles)} render with another engine; "
+                  f"use a Cycles profile such as --profile balanced.")
+            return 1
+    variants_for = None
+    if args.variants or args.frames or args.frame_steps or args.frame_samples:
+        variants_for = lambda preset_path: job_variants(preset_path, args)
+    manifest = None if args.no_manifest else JobManifest(args.manifest or os.path.join(args.out, MANIFEST_NAME))
+    jobs = build_jobs(inputs, presets, args.out, args.skip_existing, options, write_files, manifest, quality_for,
+                      variants_for, OUTPUT_FORMATS[args.output_format])
+    if manifest is not None:
+        # Resuming: jobs finished by an earlier run are skipped, pending and failed ones run again.
+        manifest.record(jobs)
+        if args.queue:
+            sync_manifest(args.queue, manifest)
+        done_ids = manifest.done_ids()
+        remaining = [job for job in jobs if job["job_id"] not in done_ids
+                     or (write_files and not os.path.exists(job["output_path"]))]
+        if len(remaining) < len(jobs):
+            print(f"Skipping {len(jobs) - len(remaining)} jobs already done in {manifest.path}")
+        jobs = remaining
+    total = len(jobs)
+    if passes:
+        # The labels come from the same render as the image, e.g. doc_fold_tl.png + doc_fold_tl.passes.npz.
+        extension = ".exr" if args.pass_format == "exr" else ".passes.npz"
+        for job in jobs:
+            job["options"] = dict(job["options"], passes_path=os.path.splitext(job["output_path"])[0] + extension)
+    if args.queue:
+        return enqueue(args, jobs, manifest)
+
+    writer = None
+    if not write_files:
+        from dataset_writer import open_writer
+
+        writer = open_writer(args.format, args.out, int(args.shard_size_mb * 1024 ** 2))
+
+    # The result cache holds encoded files, so it is only consulted when writing loose files without passes.
+    cache = None
+    if write_files and not passes and not args.no_result_cache:
+        from result_cache import ResultCache
+
+        cache = ResultCache()
+        pending = []
+        for job in jobs:
+            settings = job_settings(job["effect_name"], job["options"])
+            if args.output_format != "png":
+                settings["output_format"] = args.output_format
+            key = cache.key(job["image_path"], job["preset_path"], settings)
+            cached_path = cache.get(key, OUTPUT_FORMATS[args.output_format])
+            if cached_path is None:
+                job["cache_key"] = key
+                pending.append(job)
+            else:
+                shutil.copyfile(cached_path, job["output_path"])
+                if manifest is not None:
+                    manifest.mark_done(job["job_id"])
+        if len(pending) < total:
+            print(f"Reused {total - len(pending)} cached renders")
+        jobs = pending
+
+    encoder = None
+    if write_files and not passes and args.writer_threads > 0:
+        if args.workers == 1:
+            from output_writer import AsyncWriter
+
+            # The render hands its pixels back and the writer threads encode them while the next render runs.
+            encoder = AsyncWriter(args.output_format, args.compress_level, args.writer_threads, args.writer_queue)
+            jobs = [dict(job, output_path=None, write_path=job["output_path"]) for job in jobs]
+        else:
+            # Each pool worker encodes and writes its own files, so encoding scales with the workers instead
+            # of every full-resolution frame being sent to this process and compressed here.
+            encode = {"output_format": args.output_format, "compress_level": args.compress_level}
+            jobs = [dict(job, output_path=None, write_path=job["output_path"], encode=encode) for job in jobs]
+
+    render_jobs = group_tiles(jobs, args.tile) if args.tile > 1 else jobs
+    instrumentation = {"event_log": args.event_log, "metrics_dir": args.metrics_dir}
+    if args.workers == 1:
+        from metrics import install
+
+        # The render and the writer threads run in this process; pool workers install their own.
+        install(worker_id=0, **instrumentation)
+    if args.workers == 1:
+        results = run_inline(render_jobs, args.threads_per_worker)
+    else:
+        results = run_pool(render_jobs, args.workers, args.threads_per_worker, instrumentation)
+    totals = {"render": 0.0}
+    results = timed(split_tiles(results), totals)
+
+    failed = []
+
+    def mark_done(job_ids):
+        if manifest is not None:
+            for job_id in job_ids:
+                manifest.mark_done(job_id)
+
+    def finished(result, error=None):
+        name = f"{os.path.basename(result['image_path'])} -> {os.path.basename(result['preset_path'])}"
+        if error is None:
+            if cache is not None:
+                cache.put(result["cache_key"], result.get("write_path") or result["output_path"])
+            if writer is not None:
+                # A shard sample is only done once its shard is closed and indexed (see DatasetWriter.committed).
+                writer.write(result["key"], result["pixels"], result["image_path"],
+                             os.path.basename(result["preset_path"]), result.get("job_id"))
+                mark_done(writer.committed())
+            else:
+                mark_done([result.get("job_id")])
+        else:
+            failed.append(result)
+            print(f"{name} failed: {error}")
+            if manifest is not None:
+                manifest.mark_failed(result["job_id"], error)
+
+    try:
+        for done, result in enumerate(results, 1):
+            name = f"{os.path.basename(result['image_path'])} -> {os.path.basename(result['preset_path'])}"
+            if not result["ok"]:
+                finished(result, result["error"])
+                continue
+            print(f"[{done}/{len(jobs)}] {name}")
+            if encoder is None:
+                finished(result)
+            else:
+                # Marked done once the file is on disk; the pixels are not needed after that.
+                encoder.submit(result["write_path"], result["pixels"], dict(result, pixels=None),
+                               {"preset": os.path.basename(result["preset_path"]), "image": result["image_path"]})
+                for job, error in encoder.done():
+                    finished(job, error)
+        print(f"Rendering took {totals['render']:.1f} s")
+        if encoder is not None:
+            for job, error in encoder.close():
+                finished(job, error)
+            print(encoder.summary())
+    finally:
+        # Also on Ctrl-C or a crash: the open shard is completed, so the samples in it stay done.
+        if writer is not None:
+            writer.close()
+            mark_done(writer.committed())
+        if manifest is not None:
+            manifest.close()
+    print(f"Finished {total - len(failed)} of {total} jobs into {args.out}")
+    return 1 if failed else 0
+
+
+def soak(args):
+    # Renders the same preset over and over, cycling through the inputs, and fails if resident memory keeps growing.
+    import itertools
+    import tempfile
+
+    from memory import current_rss_bytes
+    from renderer import RenderSession
+
+    inputs = collect_inputs(args.inputs)
+    presets = collect_presets(args.preset)
+    if not inputs or not presets:
+        print("Soak test needs at least one input image and one preset.")
+        return 1
+
+    session = RenderSession()
+    baseline = None
+    peak_growth = 0
+    with tempfile.TemporaryDirectory() as out_dir:
+        output_path = os.path.join(out_dir, "soak.png")
+        image_paths = itertools.cycle(inputs)
+        for count in range(1, args.renders + 1):
+            session.render(presets[0], next(image_paths), effect_name_for(presets[0]), output_path)
+            if count == args.warmup:
+                baseline = current_rss_bytes()
+            if baseline is not None and (count % 100 == 0 or count == args.renders):
+                growth = current_rss_bytes() - baseline
+                peak_growth = max(peak_growth, growth)
+                print(f"{count} renders: RSS {current_rss_bytes() / 2**20:.1f} MB ({growth / 2**20:+.1f} MB since warm-up)")
+
+    if peak_growth > args.max_growth_mb * 2**20:
+        print(f"FAIL: memory grew by {peak_growth / 2**20:.1f} MB (limit {args.max_growth_mb} MB)")
+        return 1
+    print(f"OK: memory growth stayed within {args.max_growth_mb} MB")
+    return 0
+
+
+def bake_fields(args):
+    # Needs Blender: renders each preset's UV and shading passes once and stores them as a warp field.
+    import bpy
+    from renderer import render_warp_field
+    from warp_field import field_path, save_field
+
+    for preset_path in collect_presets(args.presets):
+        path = field_path(preset_path)
+        if os.path.exists(path) and not args.force:
+            continue
+        print("Baking warp field for " + os.path.basename(preset_path))
+        field = render_warp_field(preset_path, effect_name_for(preset_path), bake_cache=not args.no_bake_cache)
+        save_field(path, field, preset=os.path.basename(preset_path), blender=bpy.app.version_string)
+    return 0
+
+
+def warp(args):
+    # NumPy-only: applies stored warp fields to the inputs without starting Blender.
+    import numpy as np
+    from dataset_writer import open_writer
+    from warp_field import field_path, load_field, load_image, warp_batch
+
+    inputs = collect_inputs(args.inputs)
+    presets = collect_presets(args.presets)
+    missing = [os.path.basename(preset_path) for preset_path in presets if not os.path.exists(field_path(preset_path))]
+    if missing:
+        print("No warp field for " + ", ".join(missing) + "; run bake-fields first.")
+        return 1
+
+    with open_writer(args.format, args.out, int(args.shard_size_mb * 1024 ** 2)) as writer:
+        # Only fields_per_pass fields are loaded at a time, and each batch's results are written before the
+        # next one is warped, so memory holds at most batch_size x fields_per_pass warped images.
+        for first in range(0, len(presets), args.fields_per_pass):
+            pass_presets = presets[first:first + args.fields_per_pass]
+            fields = [load_field(field_path(preset_path)) for preset_path in pass_presets]
+            for start in range(0, len(inputs), args.batch_size):
+                # Documents are stacked per size, so one batch call covers every same-sized page.
+                by_shape = {}
+                for image_path in inputs[start:start + args.batch_size]:
+                    image = load_image(image_path)
+                    by_shape.setdefault(image.shape, []).append((image_path, image))
+                for group in by_shape.values():
+                    stack = np.stack([image for _, image in group])
+                    for preset_path, warped in zip(pass_presets, warp_batch(stack, fields, workers=args.threads)):
+                        for (image_path, _), pixels in zip(group, warped):
+                            writer.write(sample_key(image_path, preset_path), pixels, image_path,
+                                         os.path.basename(preset_path))
+            # Released before the next pass loads its fields.
+            fields = None
+    print(f"Warped {len(inputs) * len(presets)} images into {args.out}")
+    return 0
+
+
+def benchmark(args):
+    # Per-stage timings of full renders (fresh scene each time) for every preset and reference document.
+    from benchmark import DEFAULT_RESOLUTIONS, compare, load_results, reference_documents, run_benchmark
+
+    presets = collect_presets(args.presets)
+    if args.inputs:
+        documents = collect_inputs(args.inputs)
+    else:
+        resolutions = DEFAULT_RESOLUTIONS
+        if args.resolutions:
+            resolutions = [tuple(int(n) for n in size.split("x")) for size in args.resolutions.split(",")]
+        os.makedirs(args.documents_dir, exist_ok=True)
+        documents = reference_documents(args.documents_dir, resolutions)
+
+    records = run_benchmark(presets, documents, args.out, args.repeats, bake_cache=not args.no_bake_cache)
+    print(f"Wrote {len(records)} results to {args.out}")
+    if args.compare:
+        regressions = compare(records, load_results(args.compare), args.threshold)
+        print(f"{regressions} stages slower than {args.threshold}x the baseline")
+        return 1 if regressions else 0
+    return 0
+
+
+def enqueue(args, jobs, manifest=None):
+    # Jobs are rendered by "work" processes on any machine that mounts the queue and the output directory
+    # at the same paths, so every path in them is made absolute.
+    from job_queue import JobQueue
+
+    for job in jobs:
+        job["output_path"] = os.path.abspath(job["output_path"])
+        if "passes_path" in job["options"]:
+            job["options"] = dict(job["options"], passes_path=os.path.abspath(job["options"]["passes_path"]))
+    with JobQueue(args.queue) as job_queue:
+        added = job_queue.add(jobs)
+        counts = job_queue.counts()
+    if manifest is not None:
+        manifest.close()
+    print(f"Queued {added} new jobs in {args.queue} ({format_counts(counts)})")
+    print(f"Start workers on each machine with: render_cli.py work --queue {os.path.abspath(args.queue)}")
+    return 0
+
+
+def sync_manifest(queue_path, manifest):
+    # Queue workers only update the queue: the manifest may live on a filesystem where its WAL does not
+    # work across machines. So each "render --queue" first copies what the workers finished into the
+    # manifest, and jobs done since the last run are skipped like any other finished job.
+    from job_queue import JobQueue
+
+    if not os.path.exists(queue_path):
+        return
+    with JobQueue(queue_path) as job_queue:
+        finished = job_queue.finished()
+    done_ids = manifest.done_ids()
+    failed_ids = manifest.failed_ids()
+    synced = 0
+    for job_id, (status, error) in finished.items():
+        if status == "done" and job_id not in done_ids:
+            manifest.mark_done(job_id)
+            synced += 1
+        elif status == "dead" and job_id not in done_ids and job_id not in failed_ids:
+            manifest.mark_failed(job_id, error)
+            synced += 1
+    if synced:
+        print(f"Updated {synced} jobs in {manifest.path} from {queue_path}")
+
+
+def format_counts(counts):
+    return ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "empty"
+
+
+def work(args):
+    from job_queue import JobQueue, run_workers
+    from worker_pool import default_worker_counts
+
+    workers, threads = default_worker_counts(args.workers, args.threads_per_worker)
+    instrumentation = {"event_log": args.event_log, "metrics_dir": args.metrics_dir}
+    run_workers(args.queue, workers, threads, args.lease_seconds, args.max_attempts, instrumentation)
+    with JobQueue(args.queue) as job_queue:
+        print(f"Queue {args.queue}: {format_counts(job_queue.counts())}")
+    return 0
+
+
+def queue_status(args):
+    from job_queue import JobQueue
+
+    with JobQueue(args.queue) as job_queue:
+        if args.retry_dead:
+            print(f"Returned {job_queue.retry_dead()} dead jobs to the queue")
+        for job, error in job_queue.dead_jobs():
+            print(f"dead: {os.path.basename(job['image_path'])} -> {os.path.basename(job['preset_path'])}: {error}")
+        print(f"Queue {args.queue}: {format_counts(job_queue.counts())}")
+    return 0
+
+
+def prune_bakes(args):
+    from bake_cache import clear_stale
+
+    removed = clear_stale(preset_paths=collect_presets("*"))
+    print(f"Removed {len(removed)} stale bake cache entries")
+    return 0
+
+
+def list_presets(args):
+    from preset_registry import load_metadata
+
+    for preset_path in collect_presets(args.presets):
+        stem = os.path.splitext(os.path.basename(preset_path))[0]
+        metadata = load_metadata(preset_path)
+        if metadata is None:
+            print(stem)
+        else:
+            # Known once the preset has been rendered.
+            cost = metadata.get("render_seconds")
+            print(f"{stem}: physics={metadata['has_physics']} smooth={metadata['smooth_shaded']} "
+                  f"engine={metadata['engine']} resolution={metadata['resolution'][0]}x{metadata['resolution'][1]}"
+                  + (f" render={cost:.1f}s" if cost is not None else ""))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Render warped document images without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    render_parser = subparsers.add_parser("render", help="render every input through every selected preset")
+    render_parser.add_argument("--inputs", nargs="+", required=True, help="image files, directories or globs")
+    render_parser.add_argument("--presets", default="*", help="comma separated preset name globs, e.g. fold_*,curl_*")
+    render_parser.add_argument("--out", default="dataset", help="output directory")
+    render_parser.add_argument("--skip-existing", action="store_true", help="do not re-render outputs that already exist")
+    render_parser.add_argument("--workers", type=int, default=None,
+                               help="number of Blender worker processes (default: cores / threads per worker, 1 renders in-process)")
+    render_parser.add_argument("--threads-per-worker", type=int, default=None, help="render threads per worker")
+    render_parser.add_argument("--no-bake-cache", action="store_true",
+                               help="re-simulate every preset instead of reusing cached bakes")
+    render_parser.add_argument("--no-scene-reuse", action="store_true",
+                               help="reopen the preset file for every render instead of only swapping the texture")
+    render_parser.add_argument("--no-result-cache", action="store_true",
+                               help="always render instead of reusing earlier results for the same image and preset "
+                                    "(the cache is shared with the GUI and capped by IMAGE_WARPING_CACHE_GB, default 20)")
+    render_parser.add_argument("--format", choices=["files", "tar", "npz", "hdf5"], default="files",
+                               help="loose PNGs, or size-bounded tar (WebDataset), npz or HDF5 shards with an index.jsonl")
+    render_parser.add_argument("--shard-size-mb", type=float, default=1024, help="target size of each shard")
+    render_parser.add_argument("--output-format", choices=["png", "webp", "qoi", "npy"], default="png",
+                               help="file format of each render with --format files (webp is lossless)")
+    render_parser.add_argument("--compress-level", type=int, default=6, choices=range(10), metavar="0-9",
+                               help="PNG zlib level, or WebP effort; 1 is much faster than 6 and a little larger")
+    render_parser.add_argument("--writer-threads", type=int, default=2,
+                               help="threads encoding files while the next render runs (with --workers 1; pool workers "
+                                    "encode their own files); 0 writes PNGs in the renderer")
+    render_parser.add_argument("--writer-queue", type=int, default=8,
+                               help="rendered frames allowed to wait for the writers before rendering pauses")
+    render_parser.add_argument("--profile", choices=["fast", "balanced", "final"], default=None,
+                               help="render engine and quality profile (default: each preset's saved settings)")
+    render_parser.add_argument("--profile-overrides", default=None,
+                               help='JSON of per-preset profile settings, e.g. {"curl_*": {"balanced": {"samples": 128}}}')
+    render_parser.add_argument("--variants", type=int, default=0,
+                               help="render each document with this many sampled parameter sets per preset "
+                                    "(fold angle, crease depth, crumple strength, curl radius, camera tilt, rotation)")
+    render_parser.add_argument("--frames", default="",
+                               help="simulation frames to render from one bake, e.g. 10,20,40-100:20")
+    render_parser.add_argument("--frame-steps", type=int, default=0,
+                               help="render this many evenly spaced states through the bake, mildest first")
+    render_parser.add_argument("--frame-samples", type=int, default=0,
+                               help="render this many seeded random states of the bake per preset")
+    render_parser.add_argument("--seed", type=int, default=0, help="seed for --variants and --frame-samples")
+    render_parser.add_argument("--tile", type=int, default=1,
+                               help="render up to this many documents per Blender render for presets without physics; "
+                                    "faster, but tiles after the first are lit slightly differently from a single render")
+    render_parser.add_argument("--no-proxy", action="store_true",
+                               help="load documents at full size instead of a proxy sized to what the preset camera resolves")
+    render_parser.add_argument("--proxy-format", choices=["png", "tga"], default="png",
+                               help="format of cached proxies (uncompressed tga loads faster, png takes less disk)")
+    render_parser.add_argument("--event-log", default=None,
+                               help="append one JSON line of stage timings per render job to this file")
+    render_parser.add_argument("--metrics-dir", default=None,
+                               help="write Prometheus textfile metrics (job counts, stage latency histograms) here")
+    render_parser.add_argument("--manifest", default=None,
+                               help="job manifest used to resume interrupted runs (default: <out>/manifest.sqlite)")
+    render_parser.add_argument("--no-manifest", action="store_true",
+                               help="do not record jobs; outputs keep the plain <image>_<preset>.png names")
+    render_parser.add_argument("--passes", default="",
+                               help="comma separated extra passes rendered alongside each image: uv,alpha,normal,depth "
+                                    "(uv needs a Cycles preset)")
+    render_parser.add_argument("--pass-format", choices=["arrays", "exr"], default="arrays",
+                               help="save passes as a .passes.npz of arrays, or as one multilayer EXR with the image")
+    render_parser.add_argument("--queue", default=None,
+                               help="add the jobs to this shared queue file instead of rendering them; see 'work'. "
+                                    "The manifest catches up with the queue on the next render --queue")
+    render_parser.set_defaults(func=render)
+
+    work_parser = subparsers.add_parser("work", help="render jobs from a shared queue until it is empty")
+    work_parser.add_argument("--queue", required=True, help="queue file written by render --queue")
+    work_parser.add_argument("--workers", type=int, default=None, help="queue workers on this machine (default: by cores)")
+    work_parser.add_argument("--threads-per-worker", type=int, default=None, help="render threads per worker")
+    work_parser.add_argument("--lease-seconds", type=float, default=600,
+                             help="how long a claimed job stays reserved without a heartbeat")
+    work_parser.add_argument("--max-attempts", type=int, default=3, help="tries before a job is moved to the dead state")
+    work_parser.add_argument("--event-log", default=None, help="append one JSON line per job to this file")
+    work_parser.add_argument("--metrics-dir", default=None, help="write Prometheus textfile metrics here")
+    work_parser.set_defaults(func=work)
+
+    queue_parser = subparsers.add_parser("queue-status", help="show job counts and dead jobs of a shared queue")
+    queue_parser.add_argument("--queue", required=True, help="queue file written by render --queue")
+    queue_parser.add_argument("--retry-dead", action="store_true", help="return dead jobs to the queue")
+    queue_parser.set_defaults(func=queue_status)
+
+    fields_parser = subparsers.add_parser("bake-fields", help="render and store the warp field of each preset")
+    fields_parser.add_argument("--presets", default="*", help="comma separated preset name globs")
+    fields_parser.add_argument("--force", action="store_true", help="re-render fields that already exist")
+    fields_parser.add_argument("--no-bake-cache", action="store_true", help="re-simulate instead of using cached bakes")
+    fields_parser.set_defaults(func=bake_fields)
+
+    warp_parser = subparsers.add_parser("warp", help="apply stored warp fields with NumPy, without Blender")
+    warp_parser.add_argument("--inputs", nargs="+", required=True, help="image files, directories or globs")
+    warp_parser.add_argument("--presets", default="*", help="comma separated preset name globs")
+    warp_parser.add_argument("--out", default="dataset", help="output directory")
+    warp_parser.add_argument("--batch-size", type=int, default=32, help="documents loaded and warped per batch")
+    warp_parser.add_argument("--fields-per-pass", type=int, default=4,
+                             help="warp fields loaded and applied together; inputs are re-read once per pass")
+    warp_parser.add_argument("--threads", type=int, default=None, help="warp threads (default: all cores)")
+    warp_parser.add_argument("--format", choices=["files", "tar", "npz", "hdf5"], default="files",
+                             help="loose PNGs, or size-bounded tar (WebDataset), npz or HDF5 shards with an index.jsonl")
+    warp_parser.add_argument("--shard-size-mb", type=float, default=1024, help="target size of each shard")
+    warp_parser.set_defaults(func=warp)
+
+    soak_parser = subparsers.add_parser("soak", help="check that memory stays flat over a long render session")
+    soak_parser.add_argument("--inputs", nargs="+", required=True, help="image files, directories or globs to cycle through")
+    soak_parser.add_argument("--preset", default="fold_tl", help="preset name to render")
+    soak_parser.add_argument("--renders", type=int, default=10000, help="number of renders (default: 10000, the full soak; tests run a short one)")
+    soak_parser.add_argument("--warmup", type=int, default=20, help="renders before the baseline is taken")
+    soak_parser.add_argument("--max-growth-mb", type=float, default=64, help="allowed RSS growth after warm-up")
+    soak_parser.set_defaults(func=soak)
+
+    bench_parser = subparsers.add_parser("benchmark", help="time each render stage for every preset and reference document")
+    bench_parser.add_argument("--presets", default="*", help="comma separated preset name globs")
+    bench_parser.add_argument("--inputs", nargs="+", default=None,
+                              help="documents to render (default: generated reference pages at --resolutions)")
+    bench_parser.add_argument("--resolutions", default="", help="reference page sizes, e.g. 827x1169,2480x3508")
+    bench_parser.add_argument("--documents-dir", default="benchmark_documents", help="where reference pages are generated")
+    bench_parser.add_argument("--repeats", type=int, default=3, help="renders per preset and document")
+    bench_parser.add_argument("--no-bake-cache", action="store_true",
+                              help="run the cloth bake on every render, so the bake stage is measured too")
+    bench_parser.add_argument("--out", default="benchmark.jsonl", help="JSON lines file the results are appended to")
+    bench_parser.add_argument("--compare", default=None, help="earlier results file to check for regressions")
+    bench_parser.add_argument("--threshold", type=float, default=1.1, help="slowdown ratio reported as a regression")
+    bench_parser.set_defaults(func=benchmark)
+
+    prune_parser = subparsers.add_parser("prune-bakes", help="delete cached bakes of changed or removed presets")
+    prune_parser.set_defaults(func=prune_bakes)
+
+    list_parser = subparsers.add_parser("list-presets", help="print the available preset names")
+    list_parser.add_argument("--presets", default="*", help="comma separated preset name globs")
+    list_parser.set_defaults(func=list_presets)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import fnmatch
+import json
+import os
+
+# Named render settings applied on top of whatever the preset file saved. Keys are read by
+# renderer.apply_quality; anything a profile leaves out keeps the preset's own value.
+# threads 0 renders on every core; pool workers override it with their share (--threads-per-worker).
+# tile_size only applies when the profile (or an override) renders with Cycles.
+RENDER_PROFILES = {
+    # Cheap settings for interactive previews; the full-quality render happens on save.
+    "preview": {
+        "resolution_percentage": 50,
+        "samples": 8,
+        "max_texture_size": 1024,
+        "threads": 0,
+        "tile_size": 256,
+    },
+    # Rasterised, a handful of samples: maximum throughput for large dataset runs.
+    "fast": {
+        "engine": "BLENDER_EEVEE",
+        "samples": 4,
+        "resolution_percentage": 100,
+        "color_depth": "8",
+        "threads": 0,
+        "tile_size": 256,
+    },
+    # Path traced on the CPU, stopping early where the image has converged, then denoised.
+    "balanced": {
+        "engine": "CYCLES",
+        "device": "CPU",
+        "samples": 64,
+        "adaptive_threshold": 0.05,
+        "denoise": True,
+        "tile_size": 256,
+        "resolution_percentage": 100,
+        "color_depth": "8",
+        "threads": 0,
+    },
+    "final": {
+        "engine": "CYCLES",
+        "device": "CPU",
+        "samples": 512,
+        "adaptive_threshold": 0.01,
+        "denoise": True,
+        "tile_size": 2048,
+        "resolution_percentage": 100,
+        "color_depth": "16",
+        "threads": 0,
+    },
+}
+
+
+def load_overrides(path):
+    # {"<preset stem glob>": {"<profile name or *>": {setting: value}}}, e.g.
+    # {"curl_*": {"balanced": {"samples": 128}}, "90": {"*": {"resolution_percentage": 50}}}
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def resolve_profile(name, preset_path=None, overrides=None):
+    # The settings one preset renders with under a profile; later matching patterns win.
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile {name!r}; choose from {', '.join(RENDER_PROFILES)}")
+    quality = dict(RENDER_PROFILES[name])
+    if preset_path is not None:
+        stem = os.path.splitext(os.path.basename(preset_path))[0]
+        for pattern, by_profile in (overrides or {}).items():
+            if fnmatch.fnmatch(stem, pattern):
+                quality.update(by_profile.get("*", {}))
+                quality.update(by_profile.get(name, {}))
+    return quality
@@ -0,0 +1,857 @@
+import glob
+import math
+import os
+import shutil
+import tempfile
+import time
+import bpy
+import numpy as np
+from bpy_extras.object_utils import world_to_camera_view
+from mathutils import Matrix, Vector
+
+from bake_cache import baked_preset_path, point_caches
+from encoders import write_png
+from preset_params import PARAMETER_DEFAULTS
+from preset_registry import load_metadata, record_render_seconds, save_metadata
+from proxies import proxy_for, source_size
+from render_profiles import RENDER_PROFILES
+from stages import stage
+from warp_field import LINEAR_LUT_SIZE, LINEAR_TO_SRGB, linear_to_srgb
+
+
+PREVIEW_QUALITY = RENDER_PROFILES["preview"]
+
+# Workbench only offers fixed anti-aliasing sample counts.
+WORKBENCH_AA_SAMPLES = (1, 5, 8, 11, 16, 32)
+
+def purge_orphans():
+    bpy.data.orphans_purge(do_local_ids=True, do_linked_ids=True, do_recursive=True)
+
+class DocumentTexture:
+    # Owns the material, texture and image datablocks that put the document on the page.
+    # They are created once per loaded scene and re-pointed for every later document, so
+    # long sessions do not pile up materials or full-resolution image buffers.
+    # With a proxy_size, documents larger than the render can resolve are swapped for a cached,
+    # right-sized proxy before Blender ever loads them.
+    # per_object links the material to the object instead of its mesh, for copies sharing one mesh.
+    def __init__(self,obj,max_texture_size=None,proxy_size=None,proxy_format="png",per_object=False):
+        self.obj = obj
+        self.max_texture_size = max_texture_size
+        self.proxy_size = proxy_size
+        self.proxy_format = proxy_format
+        self.per_object = per_object
+        self.material = None
+        self.texture = None
+        self.image = None
+
+    def bind(self,selected_image_path):
+        source_path = selected_image_path
+        if self.proxy_size:
+            with stage("prepare_input"):
+                selected_image_path = proxy_for(selected_image_path, self.proxy_size, self.proxy_format)
+        with stage("load_image") as info:
+            if self.image is None:
+                self.material = bpy.data.materials.new(name="MyMaterial")
+                self.texture = bpy.data.textures.new(name="MyTexture", type='IMAGE')
+                self.image = bpy.data.images.load(selected_image_path)
+                self.texture.image = self.image
+
+                self.material.use_nodes = True
+                nodes = self.material.node_tree.nodes
+                node = nodes.get("Principled BSDF")
+                tex_node = nodes.new("ShaderNodeTexImage")
+                tex_node.image = self.image
+                self.material.node_tree.links.new(tex_node.outputs["Color"], node.inputs["Base Color"])
+
+                if self.per_object:
+                    self.obj.material_slots[0].link = 'OBJECT'
+                    self.obj.material_slots[0].material = self.material
+                else:
+                    self.obj.data.materials[0] = self.material
+            else:
+                # reload() drops the previous pixel buffer before reading the new file.
+                self.image.filepath = selected_image_path
+                self.image.reload()
+            # The metrics report the input document's size, not the proxy's.
+            size = source_size(source_path) if selected_image_path != source_path else None
+            info["width"], info["height"] = size or tuple(self.image.size)
+            self.downscale()
+
+    def downscale(self):
+        # Shrinks the in-memory pixels to a proxy; the file on disk is untouched.
+        width, height = self.image.size
+        if self.max_texture_size and max(width, height) > self.max_texture_size:
+            factor = self.max_texture_size / max(width, height)
+            self.image.scale(max(1, int(width * factor)), max(1, int(height * factor)))
+
+def open_preset(blender_file_path,bake_cache=True,variants=False):
+    # With variants the simulation is left unbaked and kept in memory: ParametricScene bakes it
+    # for each set of parameters, which must never overwrite the shared bake cache on disk.
+    metadata = load_metadata(blender_file_path)
+    if variants:
+        with stage("open_mainfile"):
+            bpy.ops.wm.open_mainfile(filepath=blender_file_path)
+        for point_cache in point_caches():
+            point_cache.use_disk_cache = False
+    elif metadata is not None and not metadata["has_physics"]:
+        # Nothing to simulate (e.g. Perspective and Rotation), so skip the bake cache and bake_all.
+        with stage("open_mainfile"):
+            bpy.ops.wm.open_mainfile(filepath=blender_file_path)
+    elif bake_cache:
+        # The cloth simulation does not depend on the document, so reuse the preset's baked copy.
+        with stage("bake"):
+            baked_path = baked_preset_path(blender_file_path)
+        if baked_path is not None:
+            with stage("open_mainfile"):
+                bpy.ops.wm.open_mainfile(filepath=baked_path)
+    else:
+        with stage("open_mainfile"):
+            bpy.ops.wm.open_mainfile(filepath=blender_file_path)
+        with stage("bake"):
+            bpy.ops.ptcache.bake_all(bake=True)
+    obj = bpy.data.objects.get("demo for blender")
+    if obj is not None:
+        bpy.context.view_layer.objects.active = obj
+        obj.select_set(True)
+    else:
+        print("Object 'demo for blender' not found.")
+    if metadata is None or "texture_size" not in metadata:
+        save_metadata(blender_file_path, inspect_scene(obj))
+    return obj
+
+def inspect_preset(blender_file_path):
+    # The preset's metadata, opening the file once to record it if nothing has rendered it yet, so
+    # job lists that depend on it (frame variants, tiling) are the same on the first run as later.
+    metadata = load_metadata(blender_file_path)
+    if metadata is None:
+        with stage("read_homefile"):
+            bpy.ops.wm.read_homefile(use_empty=True)
+        open_preset(blender_file_path,bake_cache=False,variants=True)
+        metadata = load_metadata(blender_file_path)
+    return metadata
+
+def inspect_scene(obj):
+    # Facts about the loaded preset that let later renders skip work it does not need.
+    scene = bpy.context.scene
+    scale = scene.render.resolution_percentage / 100
+    smooth_shaded = False
+    if obj is not None and obj.type == 'MESH' and len(obj.data.polygons):
+        smooth = np.empty(len(obj.data.polygons), dtype=bool)
+        obj.data.polygons.foreach_get("use_smooth", smooth)
+        smooth_shaded = bool(smooth.all() and obj.data.use_auto_smooth)
+    return {
+        "has_physics": any(True for _ in point_caches()),
+        "smooth_shaded": smooth_shaded,
+        "engine": scene.render.engine,
+        "resolution": [int(scene.render.resolution_x * scale), int(scene.render.resolution_y * scale)],
+        "resolution_percentage": scene.render.resolution_percentage,
+        "texture_size": page_texture_size(obj),
+    }
+
+def projected_bounds(obj):
+    # (left, bottom, right, top) of the object's bounding box in camera view coordinates, where the
+    # frame spans 0 to 1 on both axes; None if it is entirely behind the camera.
+    scene = bpy.context.scene
+    if obj is None or scene.camera is None:
+        return None
+    evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    corners = [world_to_camera_view(scene, scene.camera, evaluated.matrix_world @ Vector(corner))
+               for corner in evaluated.bound_box]
+    # Corners behind the camera have no meaningful projection.
+    corners = [corner for corner in corners if corner.z > 0]
+    if not corners:
+        return None
+    return (min(c.x for c in corners), min(c.y for c in corners), max(c.x for c in corners), max(c.y for c in corners))
+
+def page_texture_size(obj,oversample=1.5,limit=16384):
+    # How many texels across its longer side the document needs: the page's projected extent in
+    # output pixels, with headroom for parts that are foreshortened or curled towards the camera.
+    bounds = projected_bounds(obj)
+    if bounds is None:
+        return None
+    render = bpy.context.scene.render
+    scale = render.resolution_percentage / 100
+    width = (bounds[2] - bounds[0]) * render.resolution_x * scale
+    height = (bounds[3] - bounds[1]) * render.resolution_y * scale
+    return min(limit, int(max(width, height) * oversample))
+
+def proxy_size_for(blender_file_path,quality):
+    # The proxy size for this preset under the given render settings, or None to load documents as they are.
+    if not quality.get("proxy", True):
+        return None
+    metadata = load_metadata(blender_file_path)
+    size = metadata.get("texture_size") if metadata else None
+    if size and "resolution_percentage" in quality:
+        size = int(size * quality["resolution_percentage"] / metadata["resolution_percentage"])
+    if quality.get("max_texture_size"):
+        size = min(size or quality["max_texture_size"], quality["max_texture_size"])
+    return size
+
+def needs_smooth_shading(blender_file_path,effect_name):
+    if effect_name != "Curved":
+        return False
+    metadata = load_metadata(blender_file_path)
+    return not (metadata and metadata["smooth_shaded"])
+
+def make_blender_ready(blender_file_path,selected_image_path,bake_cache=True,quality=None,variants=False):
+    quality = quality or {}
+    obj = open_preset(blender_file_path,bake_cache,variants)
+    document = DocumentTexture(obj,quality.get("max_texture_size"),proxy_size_for(blender_file_path,quality),
+                               quality.get("proxy_format", "png"))
+    document.bind(selected_image_path)
+    # The preset's own page material and sample image are now unused; free them instead of carrying them along.
+    with stage("purge_orphans"):
+        purge_orphans()
+    return document
+
+def render_image(blender_file_path,selected_image_path,effect_name,output_path=None,threads=None,bake_cache=True,quality=None,
+                 passes=None,pass_format="arrays",passes_path=None):
+    with job_stage(blender_file_path,selected_image_path,effect_name):
+        return _render_image(blender_file_path,selected_image_path,effect_name,output_path,threads,bake_cache,quality,
+                             passes,pass_format,passes_path)
+
+def job_stage(blender_file_path,selected_image_path,effect_name):
+    # Outer stage around a whole render, so hooks can report each job as one event.
+    return stage("job", preset=os.path.basename(blender_file_path), effect=effect_name,
+                 image=selected_image_path, input_bytes=os.path.getsize(selected_image_path))
+
+def _render_image(blender_file_path,selected_image_path,effect_name,output_path,threads,bake_cache,quality,
+                  passes,pass_format,passes_path):
+    quality = quality or {}
+    with stage("read_homefile"):
+        bpy.ops.wm.read_homefile(use_empty=True)
+    make_blender_ready(blender_file_path,selected_image_path,bake_cache,quality)
+
+    if needs_smooth_shading(blender_file_path,effect_name):
+        with stage("shade_smooth"):
+            bpy.ops.object.shade_smooth(use_auto_smooth=True)
+
+    apply_quality(quality)
+    start = time.perf_counter()
+    result = render_scene(output_path,threads,passes,pass_format,passes_path,int(quality.get("color_depth", 8)))
+    record_render_seconds(blender_file_path, time.perf_counter() - start)
+    return result
+
+def apply_quality(quality):
+    # Applies a render profile (see render_profiles.RENDER_PROFILES) to the loaded scene.
+    scene = bpy.context.scene
+    if "engine" in quality:
+        scene.render.engine = quality["engine"]
+        if quality["engine"] == 'BLENDER_WORKBENCH':
+            # Workbench shows flat object colours unless told to use the document texture.
+            scene.display.shading.color_type = 'TEXTURE'
+    if "resolution_percentage" in quality:
+        scene.render.resolution_percentage = quality["resolution_percentage"]
+    if "samples" in quality:
+        if scene.render.engine == 'CYCLES':
+            scene.cycles.samples = quality["samples"]
+        elif scene.render.engine == 'BLENDER_EEVEE':
+            scene.eevee.taa_render_samples = quality["samples"]
+        elif scene.render.engine == 'BLENDER_WORKBENCH':
+            samples = max(count for count in WORKBENCH_AA_SAMPLES if count <= max(1, quality["samples"]))
+            scene.display.render_aa = 'FXAA' if samples == 1 else str(samples)
+    if scene.render.engine == 'CYCLES':
+        if "device" in quality:
+            scene.cycles.device = quality["device"]
+        if "adaptive_threshold" in quality:
+            scene.cycles.use_adaptive_sampling = True
+            scene.cycles.adaptive_threshold = quality["adaptive_threshold"]
+        if "denoise" in quality:
+            scene.cycles.use_denoising = quality["denoise"]
+            if quality["denoise"]:
+                scene.cycles.denoiser = 'OPENIMAGEDENOISE'
+        if "tile_size" in quality:
+            scene.cycles.use_auto_tile = True
+            scene.cycles.tile_size = quality["tile_size"]
+    if "threads" in quality:
+        if quality["threads"]:
+            scene.render.threads_mode = 'FIXED'
+            scene.render.threads = quality["threads"]
+        else:
+            scene.render.threads_mode = 'AUTO'
+
+def render_scene(output_path=None,threads=None,passes=None,pass_format="arrays",passes_path=None,bits=8):
+    # Renders whatever scene is currently loaded and returns the result in memory as an (H, W, 4)
+    # uint8 straight-alpha array (uint16 with bits=16), colour managed the way the preset saves it.
+    # A PNG is only encoded when output_path is given.
+    # With passes (see PASS_SOCKETS) the same render also produces those labels and a dict is
+    # returned instead: {"image": pixels, "<pass>": float array, ...}. pass_format "exr" writes them
+    # as one multilayer EXR at passes_path; "arrays" returns them (and saves an .npz at passes_path if given).
+    scene = bpy.context.scene
+    if passes and pass_format == "exr" and passes_path is None:
+        raise ValueError("pass_format 'exr' writes the passes to passes_path, but none was given.")
+    scene.render.film_transparent = True
+    scene.render.use_compositing = True
+    if threads:
+        # Pool workers pin their thread count so the machine is not oversubscribed.
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = threads
+    # The Standard view is applied to the Viewer pixels in NumPy (display_pixels); Filmic, which every
+    # shipped preset saves, is applied by the compositor in front of the Viewer (see setup_viewer_readback).
+    # Only a look or curves still need Blender to write the file, which is then read back.
+    standard_view = uses_standard_view(scene)
+    view_colorspace = None if standard_view else compositor_view(scene)
+    in_memory = standard_view or view_colorspace is not None
+    setup_viewer_readback(view_colorspace, scene.view_settings.exposure)
+    if passes:
+        pass_dir = tempfile.mkdtemp(prefix="passes-")
+        setup_pass_outputs(passes, pass_format, pass_dir)
+    if not in_memory:
+        still_dir = tempfile.mkdtemp(prefix="render-")
+        still_path = os.path.join(still_dir, "frame.png")
+        scene.render.image_settings.file_format = 'PNG'
+        scene.render.image_settings.color_mode = 'RGBA'
+        scene.render.image_settings.color_depth = str(bits)
+        # Read straight back, so compressing it would only cost time.
+        scene.render.image_settings.compression = 0
+        scene.render.filepath = still_path
+
+    with stage("render"):
+        render_result = bpy.ops.render.render(write_still=not in_memory)
+    if render_result == {'FINISHED'}:
+        print("Rendering completed successfully.")
+    else:
+        print("Rendering failed.")
+        raise RuntimeError("Rendering failed.")
+
+    with stage("readback") as info:
+        info["source"] = "viewer" if in_memory else "file"
+        viewer_pixels = read_viewer_pixels() if in_memory or (passes and "alpha" in passes) else None
+        if standard_view:
+            pixels = display_pixels(viewer_pixels, scene.view_settings.exposure, bits)
+        elif in_memory:
+            pixels = encoded_pixels(viewer_pixels, scene.view_settings.gamma, bits)
+        else:
+            try:
+                pixels = read_stored_pixels(still_path, bits)
+            finally:
+                shutil.rmtree(still_dir, ignore_errors=True)
+    if output_path is not None:
+        with stage("write_png") as info:
+            info["bytes"] = len(write_png(output_path, pixels))
+    if not passes:
+        return pixels
+
+    try:
+        result = {"image": pixels}
+        if pass_format == "exr":
+            shutil.move(written_pass_file(pass_dir, "passes_*.exr"), passes_path)
+        else:
+            result.update(read_pass_outputs(passes, pass_dir))
+            if "alpha" in passes:
+                result["alpha"] = viewer_pixels[..., 3].copy()
+            if passes_path is not None:
+                np.savez(passes_path, **{name: values for name, values in result.items() if name != "image"})
+        return result
+    finally:
+        shutil.rmtree(pass_dir, ignore_errors=True)
+
+# Extra view-layer passes a render can produce, mapped to their Render Layers output socket.
+PASS_SOCKETS = {
+    "uv": "UV",
+    "normal": "Normal",
+    "depth": "Depth",
+    "alpha": "Alpha",
+}
+PASS_CHANNELS = {
+    "uv": slice(0, 2),
+    "normal": slice(0, 3),
+    "depth": 0,
+}
+
+def setup_pass_outputs(passes,pass_format,directory):
+    # Adds a File Output node so the passes are written by the same render as the image.
+    unknown = set(passes) - set(PASS_SOCKETS)
+    if unknown:
+        raise ValueError("Unknown render passes: " + ", ".join(sorted(unknown)))
+    engine = bpy.context.scene.render.engine
+    if "uv" in passes and engine != 'CYCLES':
+        # Eevee and Workbench have no UV pass; the socket would stay unconnected and write zeros.
+        raise ValueError("The uv pass needs Cycles, but the scene renders with " + engine
+                         + "; use a Cycles profile such as --profile balanced.")
+    view_layer = bpy.context.view_layer
+    view_layer.use_pass_uv = "uv" in passes
+    view_layer.use_pass_normal = "normal" in passes
+    view_layer.use_pass_z = "depth" in passes
+
+    tree = bpy.context.scene.node_tree
+    layers = tree.nodes["Render Layers"]
+    output = tree.nodes.new("CompositorNodeOutputFile")
+    output.format.color_depth = '32'
+    output.format.color_mode = 'RGBA'
+    if pass_format == "exr":
+        output.format.file_format = 'OPEN_EXR_MULTILAYER'
+        output.format.exr_codec = 'ZIP'
+        output.base_path = os.path.join(directory, "passes_")
+        output.layer_slots.clear()
+        output.layer_slots.new("Image")
+        tree.links.new(layers.outputs["Image"], output.inputs[-1])
+        for name in passes:
+            output.layer_slots.new(name)
+            tree.links.new(layers.outputs[PASS_SOCKETS[name]], output.inputs[-1])
+    else:
+        # Alpha comes straight from the viewer pixels, so only the data passes need files.
+        output.format.file_format = 'OPEN_EXR'
+        output.format.exr_codec = 'NONE'
+        output.base_path = directory
+        output.file_slots.clear()
+        for name in passes:
+            if name in PASS_CHANNELS:
+                output.file_slots.new(name + "_")
+                tree.links.new(layers.outputs[PASS_SOCKETS[name]], output.inputs[-1])
+
+def read_pass_outputs(passes,directory):
+    arrays = {}
+    for name in passes:
+        if name not in PASS_CHANNELS:
+            continue
+        image = bpy.data.images.load(written_pass_file(directory, name + "_*.exr"))
+        image.colorspace_settings.is_data = True
+        width, height = image.size
+        values = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(values)
+        bpy.data.images.remove(image)
+        arrays[name] = values.reshape(height, width, 4)[::-1, :, PASS_CHANNELS[name]].copy()
+    return arrays
+
+def written_pass_file(directory,pattern):
+    matches = glob.glob(os.path.join(directory, pattern))
+    if not matches:
+        raise RuntimeError("The render wrote no " + pattern + " file; the pass may not exist for this scene.")
+    return matches[0]
+
+def uses_standard_view(scene):
+    # True when saving the render applies nothing but exposure and the sRGB transfer curve.
+    view = scene.view_settings
+    return (scene.display_settings.display_device == 'sRGB' and view.view_transform == 'Standard'
+            and view.look == 'None' and view.gamma == 1.0 and not view.use_curve_mapping)
+
+# View transforms the compositor can apply before the Viewer node, as the colour space each one
+# displays on an sRGB screen (names from Blender 3.x's OCIO configuration).
+VIEW_COLORSPACES = {"Filmic": "Filmic sRGB"}
+SCENE_LINEAR = "Linear"
+
+def compositor_view(scene):
+    # The colour space to convert the render to in the compositor so the Viewer holds what saving it
+    # would write, or None if only Blender's file output reproduces the view (looks, curves).
+    view = scene.view_settings
+    if scene.display_settings.display_device != 'sRGB' or view.look != 'None' or view.use_curve_mapping:
+        return None
+    return VIEW_COLORSPACES.get(view.view_transform)
+
+def encoded_pixels(pixels,gamma=1.0,bits=8):
+    # Viewer pixels already converted to the display colour space with straight alpha (see
+    # setup_viewer_readback); only the view gamma and quantising are left.
+    values = np.clip(pixels, 0, 1)
+    if gamma != 1.0:
+        values[..., :3] **= 1 / gamma
+    if bits == 16:
+        return np.round(values * 65535).astype(np.uint16)
+    return np.round(values * 255).astype(np.uint8)
+
+def read_stored_pixels(path,bits=8):
+    # The values exactly as written to the file: read as non-colour data with the alpha channel
+    # packed, so Blender neither converts them to linear nor premultiplies them.
+    image = bpy.data.images.load(path)
+    try:
+        image.colorspace_settings.name = 'Non-Color'
+        image.alpha_mode = 'CHANNEL_PACKED'
+        width, height = image.size
+        values = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(values)
+    finally:
+        bpy.data.images.remove(image)
+    scale = 65535 if bits == 16 else 255
+    values = np.round(values.reshape(height, width, 4)[::-1] * scale)
+    return values.astype(np.uint16 if bits == 16 else np.uint8)
+
+def display_pixels(pixels,exposure=0.0,bits=8):
+    # Viewer pixels are scene-linear and premultiplied. Encode them the way the Standard view
+    # transform writes a PNG: exposure, straight alpha, sRGB transfer, 8 (or 16) bits.
+    alpha = pixels[..., 3]
+    linear = unpremultiply(pixels[..., :3], alpha)
+    if exposure:
+        linear *= 2 ** exposure
+    np.clip(linear, 0, 1, out=linear)
+    if bits == 16:
+        # Too fine for the lookup table; evaluate the transfer curve directly.
+        out = np.empty(pixels.shape, dtype=np.uint16)
+        out[..., :3] = np.round(linear_to_srgb(linear) * 65535)
+        out[..., 3] = np.round(np.clip(alpha, 0, 1) * 65535)
+        return out
+    out = np.empty(pixels.shape, dtype=np.uint8)
+    out[..., :3] = LINEAR_TO_SRGB[(linear * (LINEAR_LUT_SIZE - 1) + 0.5).astype(np.intp)]
+    out[..., 3] = np.round(np.clip(alpha, 0, 1) * 255)
+    return out
+
+
+# Scene properties each preset parameter scales, by modifier type: (type, attribute, exponent).
+# curl_radius uses -1 because a larger radius bends the page less.
+PARAMETER_TARGETS = {
+    "fold_angle": [("SIMPLE_DEFORM", "angle", 1)],
+    "curl_radius": [("SIMPLE_DEFORM", "angle", -1)],
+    "crease_depth": [("DISPLACE", "strength", 1), ("WAVE", "height", 1)],
+    "crumple_strength": [("DISPLACE", "strength", 1), ("CLOTH", "shrink_min", 1)],
+}
+SIMULATION_TYPES = ('CLOTH', 'SOFT_BODY')
+
+class ParametricScene:
+    # Applies preset parameters (see preset_params) to the loaded scene in place, relative to the values
+    # the preset was authored with, so many variants render from one open file. Only changes that feed
+    # the simulation (cloth settings, or modifiers above it in the stack) trigger a re-bake.
+    def __init__(self,obj):
+        scene = bpy.context.scene
+        self.obj = obj
+        self.camera = scene.camera
+        self.camera_rotation = self.camera.rotation_euler.copy() if self.camera is not None else None
+        self.page_rotation = obj.rotation_euler.copy()
+        self.has_simulation = any(True for _ in point_caches())
+        self.baked = False
+        # One entry per (owner, attribute), holding every parameter that scales it: several parameters
+        # share an attribute (fold_angle and curl_radius both scale a SIMPLE_DEFORM angle), so their
+        # factors are multiplied together and the attribute is written once.
+        self.targets = {}
+        self.parameters = {"camera_tilt"} if self.camera is not None else set()
+        self.parameters.add("rotation")
+        simulation_index = next((i for i, modifier in enumerate(obj.modifiers) if modifier.type in SIMULATION_TYPES),
+                                len(obj.modifiers))
+        for name, specs in PARAMETER_TARGETS.items():
+            for index, modifier in enumerate(obj.modifiers):
+                for modifier_type, attribute, exponent in specs:
+                    if modifier.type != modifier_type:
+                        continue
+                    owner = modifier.settings if modifier_type in SIMULATION_TYPES else modifier
+                    key = (owner.as_pointer(), attribute)
+                    if key not in self.targets:
+                        self.targets[key] = (owner, attribute, getattr(owner, attribute), index <= simulation_index, [])
+                    self.targets[key][4].append((name, exponent))
+                    self.parameters.add(name)
+
+    def apply(self,params):
+        # Parameters that are not given go back to the preset's own values. A parameter the scene has
+        # nothing to apply to is an error rather than a variant that renders the same as the preset.
+        unsupported = sorted(name for name, value in params.items()
+                             if name not in self.parameters and value != PARAMETER_DEFAULTS.get(name))
+        if unsupported:
+            raise ValueError("The preset has nothing to vary for: " + ", ".join(unsupported))
+        rebake = self.has_simulation and not self.baked
+        if self.camera is not None:
+            self.camera.rotation_euler = self.camera_rotation
+            self.camera.rotation_euler.rotate_axis("X", math.radians(params.get("camera_tilt", 0.0)))
+        self.obj.rotation_euler = self.page_rotation
+        self.obj.rotation_euler.rotate_axis("Z", math.radians(params.get("rotation", 0.0)))
+        for owner, attribute, base, feeds_simulation, factors in self.targets.values():
+            new_value = base
+            for name, exponent in factors:
+                new_value *= params.get(name, PARAMETER_DEFAULTS[name]) ** exponent
+            if getattr(owner, attribute) != new_value:
+                setattr(owner, attribute, new_value)
+                rebake = rebake or (feeds_simulation and self.has_simulation)
+        if rebake:
+            with stage("bake"):
+                scene = bpy.context.scene
+                frame = scene.frame_current
+                bpy.ops.ptcache.free_bake_all()
+                bpy.ops.ptcache.bake_all(bake=True)
+                scene.frame_set(frame)
+            self.baked = True
+
+
+def simulation_frame_range():
+    # The frames the preset's simulation covers, from its point caches (the scene range without one).
+    scene = bpy.context.scene
+    caches = list(point_caches())
+    if caches:
+        return min(cache.frame_start for cache in caches), max(cache.frame_end for cache in caches)
+    return scene.frame_start, scene.frame_end
+
+def go_to_frame(frame=None,progress=None,default=None):
+    # Moves the loaded scene to an absolute frame, or to a fraction of the way through the
+    # simulation (0 is the undeformed page, 1 the end of the bake). Baked frames are read from the
+    # point cache, so every frame of one bake is a different, progressively stronger deformation.
+    scene = bpy.context.scene
+    if progress is not None:
+        start, end = simulation_frame_range()
+        frame = start + round(progress * (end - start))
+    if frame is None:
+        frame = default
+    if frame is not None and frame != scene.frame_current:
+        with stage("frame_set"):
+            scene.frame_set(frame)
+
+
+def tile_gap(bounds,width,height,margin=0.02):
+    # Pixels to leave between tiles so no page reaches into a neighbour's crop: a page that projects
+    # past its frame by some amount on one side needs that much room before the next tile starts.
+    # margin (a fraction of the frame) adds room for the pixel filter and soft edges.
+    left, bottom, right, top = bounds if bounds is not None else (0, 0, 1, 1)
+    gap_x = max(0.0, -left, right - 1) * width
+    gap_y = max(0.0, -bottom, top - 1) * height
+    return math.ceil(gap_x + width * margin), math.ceil(gap_y + height * margin)
+
+def tile_layout(count):
+    columns = math.ceil(math.sqrt(count))
+    return columns, math.ceil(count / columns)
+
+def widen_camera(columns,rows,gap):
+    # Enlarges the frame to a columns x rows grid of the original frame (plus gap pixels between
+    # tiles) at the same pixel scale, keeping the original view as the top-left tile.
+    # Returns the tile pitch in pixels and the camera's pixels per unit of image-plane offset.
+    scene = bpy.context.scene
+    render = scene.render
+    camera = scene.camera.data
+    width, height = render.resolution_x, render.resolution_y
+    pitch_x, pitch_y = width + gap[0], height + gap[1]
+    total_width, total_height = width + (columns - 1) * pitch_x, height + (rows - 1) * pitch_y
+
+    fit = camera.sensor_fit
+    sensor = camera.sensor_width if fit in ('AUTO', 'HORIZONTAL') else camera.sensor_height
+    if fit == 'AUTO':
+        # AUTO fits sensor_width to the larger side.
+        fit = 'HORIZONTAL' if width >= height else 'VERTICAL'
+    fit_pixels, total_fit_pixels = (width, total_width) if fit == 'HORIZONTAL' else (height, total_height)
+    grow = total_fit_pixels / fit_pixels
+    if camera.type == 'ORTHO':
+        pixels_per_unit = fit_pixels / camera.ortho_scale
+        camera.ortho_scale *= grow
+    else:
+        # Focal length in pixels.
+        pixels_per_unit = camera.lens * fit_pixels / sensor
+    camera.sensor_fit = fit
+    if fit == 'HORIZONTAL':
+        camera.sensor_width = sensor * grow
+    else:
+        camera.sensor_height = sensor * grow
+
+    # Lens shift is a fraction of the sensor-fit side of the frame (the larger side under AUTO);
+    # move the centre so tile (0, 0) stays put.
+    shift_x = camera.shift_x * fit_pixels + (total_width - width) / 2
+    shift_y = camera.shift_y * fit_pixels - (total_height - height) / 2
+    render.resolution_x, render.resolution_y = total_width, total_height
+    camera.shift_x = shift_x / total_fit_pixels
+    camera.shift_y = shift_y / total_fit_pixels
+    return (pitch_x, pitch_y), pixels_per_unit
+
+def tile_offset_matrix(offset_x,offset_y,pixels_per_unit):
+    # World transform that moves an object's image by (offset_x, offset_y) pixels and leaves it
+    # otherwise identical. For a perspective camera that is a shear in camera space,
+    # X' = X - a Z, which shifts the projection by the same amount at every depth.
+    scene = bpy.context.scene
+    camera_matrix = scene.camera.matrix_world.normalized()
+    a = offset_x / pixels_per_unit
+    b = offset_y / pixels_per_unit
+    if scene.camera.data.type == 'ORTHO':
+        offset = Matrix.Translation((a, b, 0))
+    else:
+        offset = Matrix(((1, 0, -a, 0), (0, 1, -b, 0), (0, 0, 1, 0), (0, 0, 0, 1)))
+    return camera_matrix @ offset @ camera_matrix.inverted()
+
+def render_tiled(blender_file_path,selected_image_paths,effect_name,output_paths=None,threads=None,quality=None):
+    # Renders several documents through one preset in a single render call: the page object is
+    # copied once per document into a grid, each copy with its own texture, and the frame is cut back
+    # into one (H, W, 4) array per document. Only for presets without physics (Perspective, Rotation):
+    # a simulated page cannot be copied. The geometry of every tile matches a single render, but the
+    # shading of tiles other than the first does not exactly: each copy sits elsewhere relative to the
+    # lights, and with a perspective camera the shear that offsets it also tilts its normals. The gap
+    # between tiles comes from how far the page projects past its frame (tile_gap); shadows or
+    # reflections cast further than that can still reach a neighbour.
+    quality = quality or {}
+    with stage("read_homefile"):
+        bpy.ops.wm.read_homefile(use_empty=True)
+    obj = open_preset(blender_file_path,bake_cache=False,variants=True)
+    if obj is None or any(True for _ in point_caches()):
+        raise ValueError(os.path.basename(blender_file_path) + " has physics and cannot be tiled.")
+    scene = bpy.context.scene
+    apply_quality(quality)
+    proxy_size = proxy_size_for(blender_file_path,quality)
+
+    columns, rows = tile_layout(len(selected_image_paths))
+    width, height = scene.render.resolution_x, scene.render.resolution_y
+    pitch, pixels_per_unit = widen_camera(columns, rows, tile_gap(projected_bounds(obj), width, height))
+    # An identity parent carries each copy's offset in its parent inverse, which, unlike the
+    # object's own transform, can hold a shear.
+    world = obj.matrix_world.copy()
+    for index, image_path in enumerate(selected_image_paths):
+        page = obj if index == 0 else obj.copy()
+        if index:
+            for collection in obj.users_collection:
+                collection.objects.link(page)
+            column, row = index % columns, index // columns
+            anchor = bpy.data.objects.new("tile anchor", None)
+            scene.collection.objects.link(anchor)
+            page.parent = anchor
+            page.matrix_parent_inverse = tile_offset_matrix(column * pitch[0], -row * pitch[1], pixels_per_unit)
+            page.matrix_basis = world
+        DocumentTexture(page,quality.get("max_texture_size"),proxy_size,quality.get("proxy_format", "png"),
+                        per_object=True).bind(image_path)
+    with stage("purge_orphans"):
+        purge_orphans()
+
+    frame = render_scene(None,threads,bits=int(quality.get("color_depth", 8)))
+    # The frame may be rounded by resolution_percentage; scale tile positions to what was rendered.
+    scale_x = frame.shape[1] / scene.render.resolution_x
+    scale_y = frame.shape[0] / scene.render.resolution_y
+    results = []
+    for index in range(len(selected_image_paths)):
+        column, row = index % columns, index // columns
+        left, top = round(column * pitch[0] * scale_x), round(row * pitch[1] * scale_y)
+        pixels = frame[top:top + round(height * scale_y), left:left + round(width * scale_x)].copy()
+        if output_paths is not None and output_paths[index] is not None:
+            with stage("write_png") as info:
+                info["bytes"] = len(write_png(output_paths[index], pixels))
+        results.append(pixels)
+    return results
+
+
+class RenderSession:
+    # Keeps the last preset scene loaded and only repoints the document texture while the preset stays the same.
+    def __init__(self):
+        self.scene_key = None
+        self.document = None
+        self.parametric = None
+        self.saved_frame = None
+
+    def render(self,blender_file_path,selected_image_path,effect_name,output_path=None,threads=None,bake_cache=True,reuse=True,quality=None,
+               passes=None,pass_format="arrays",passes_path=None,params=None,frame=None,progress=None):
+        # params (e.g. from preset_params.sample_variants) renders a variant of the preset in the loaded scene.
+        # frame or progress (see go_to_frame) picks the simulation state; without either the preset's saved frame is used.
+        with job_stage(blender_file_path,selected_image_path,effect_name):
+            return self._render(blender_file_path,selected_image_path,effect_name,output_path,threads,bake_cache,reuse,quality,
+                                passes,pass_format,passes_path,params,frame,progress)
+
+    def render_tiled(self,blender_file_path,selected_image_paths,effect_name,output_paths=None,threads=None,quality=None,**options):
+        # The tiled scene is built for one batch only, so the next render reloads the preset.
+        self.scene_key = None
+        self.document = None
+        self.parametric = None
+        with job_stage(blender_file_path,selected_image_paths[0],effect_name) as info:
+            info["documents"] = len(selected_image_paths)
+            return render_tiled(blender_file_path,selected_image_paths,effect_name,output_paths,threads,quality)
+
+    def _render(self,blender_file_path,selected_image_path,effect_name,output_path,threads,bake_cache,reuse,quality,
+                passes,pass_format,passes_path,params,frame,progress):
+        quality = quality or {}
+        variants = params is not None
+        scene_key = (os.path.abspath(blender_file_path), effect_name, bake_cache, tuple(sorted(quality.items())), variants)
+        if reuse and scene_key == self.scene_key and self.document is not None:
+            self.document.bind(selected_image_path)
+        else:
+            self.scene_key = None
+            self.document = None
+            self.parametric = None
+            with stage("read_homefile"):
+                bpy.ops.wm.read_homefile(use_empty=True)
+            self.document = make_blender_ready(blender_file_path,selected_image_path,bake_cache,quality,variants)
+            self.saved_frame = bpy.context.scene.frame_current
+            if variants and self.document.obj is not None:
+                self.parametric = ParametricScene(self.document.obj)
+            if needs_smooth_shading(blender_file_path,effect_name):
+                with stage("shade_smooth"):
+                    bpy.ops.object.shade_smooth(use_auto_smooth=True)
+            apply_quality(quality)
+            self.scene_key = scene_key if reuse else None
+        if self.parametric is not None:
+            self.parametric.apply(params)
+        go_to_frame(frame,progress,self.saved_frame)
+
+        start = time.perf_counter()
+        result = render_scene(output_path,threads,passes,pass_format,passes_path,int(quality.get("color_depth", 8)))
+        record_render_seconds(blender_file_path, time.perf_counter() - start)
+        return result
+
+
+def setup_viewer_readback(colorspace=None,exposure=0.0):
+    # Routes the render through the compositor's Viewer node so its pixels can be read without writing a file.
+    # With a colorspace (see compositor_view) the Viewer gets the image with straight alpha, exposed and
+    # converted the way the view transform would save it.
+    scene = bpy.context.scene
+    scene.use_nodes = True
+    tree = scene.node_tree
+    tree.nodes.clear()
+    layers = tree.nodes.new("CompositorNodeRLayers")
+    composite = tree.nodes.new("CompositorNodeComposite")
+    viewer = tree.nodes.new("CompositorNodeViewer")
+    viewer.use_alpha = True
+    tree.links.new(layers.outputs["Image"], composite.inputs["Image"])
+    image = layers.outputs["Image"]
+    if colorspace is not None:
+        straight = tree.nodes.new("CompositorNodePremulKey")
+        straight.mapping = 'PREMUL_TO_STRAIGHT'
+        tree.links.new(image, straight.inputs["Image"])
+        image = straight.outputs["Image"]
+        if exposure:
+            exposed = tree.nodes.new("CompositorNodeExposure")
+            exposed.inputs["Exposure"].default_value = exposure
+            tree.links.new(image, exposed.inputs["Image"])
+            image = exposed.outputs["Image"]
+        convert = tree.nodes.new("CompositorNodeConvertColorSpace")
+        convert.from_color_space = SCENE_LINEAR
+        convert.to_color_space = colorspace
+        tree.links.new(image, convert.inputs["Image"])
+        image = convert.outputs["Image"]
+    tree.links.new(image, viewer.inputs["Image"])
+    tree.links.new(layers.outputs["Alpha"], viewer.inputs["Alpha"])
+
+def read_viewer_pixels():
+    # Scene-linear, premultiplied RGBA as float32, top row first.
+    viewer = bpy.data.images["Viewer Node"]
+    width, height = viewer.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    viewer.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)[::-1].copy()
+
+def unpremultiply(values, alpha):
+    return np.divide(values, alpha[..., None], out=np.zeros_like(values), where=alpha[..., None] > 0)
+
+def render_warp_field(blender_file_path,effect_name,bake_cache=True):
+    # Renders the preset twice with the document swapped out: once with a white page to capture
+    # lighting, once with the page emitting its own UV coordinates. Together they describe where
+    # every output pixel samples the document and how much it is shaded, for warp_field.warp_image.
+    bpy.ops.wm.read_homefile(use_empty=True)
+    obj = open_preset(blender_file_path,bake_cache)
+    if needs_smooth_shading(blender_file_path,effect_name):
+        bpy.ops.object.shade_smooth(use_auto_smooth=True)
+
+    scene = bpy.context.scene
+    scene.render.film_transparent = True
+    scene.view_settings.view_transform = 'Standard'
+    scene.view_settings.look = 'None'
+    scene.view_settings.exposure = 0
+    scene.view_settings.gamma = 1
+    setup_viewer_readback()
+
+    shading_material = bpy.data.materials.new(name="WarpFieldShading")
+    shading_material.use_nodes = True
+    shading_material.node_tree.nodes.get("Principled BSDF").inputs["Base Color"].default_value = (1, 1, 1, 1)
+    obj.data.materials[0] = shading_material
+    bpy.ops.render.render()
+    shading_pass = read_viewer_pixels()
+
+    uv_material = bpy.data.materials.new(name="WarpFieldUV")
+    uv_material.use_nodes = True
+    nodes = uv_material.node_tree.nodes
+    nodes.clear()
+    coords = nodes.new("ShaderNodeTexCoord")
+    emission = nodes.new("ShaderNodeEmission")
+    output = nodes.new("ShaderNodeOutputMaterial")
+    uv_material.node_tree.links.new(coords.outputs["UV"], emission.inputs["Color"])
+    uv_material.node_tree.links.new(emission.outputs["Emission"], output.inputs["Surface"])
+    obj.data.materials[0] = uv_material
+    # No pixel filter or extra samples: neighbouring UVs across a fold must not be averaged together.
+    scene.render.filter_size = 0.0
+    if scene.render.engine == 'CYCLES':
+        scene.cycles.filter_width = 0.01
+        scene.cycles.samples = 1
+        scene.cycles.use_denoising = False
+    elif scene.render.engine == 'BLENDER_EEVEE':
+        scene.eevee.taa_render_samples = 1
+        scene.eevee.use_bloom = False
+    bpy.ops.render.render()
+    uv_pass = read_viewer_pixels()
+
+    alpha = uv_pass[..., 3]
+    return {
+        "uv": unpremultiply(uv_pass[..., :2], alpha),
+        "alpha": alpha,
+        "shading": unpremultiply(shading_pass[..., :3], shading_pass[..., 3]),
+    }
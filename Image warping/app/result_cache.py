@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+
+from presets import CACHE_ROOT
+
+RESULT_CACHE_DIR = os.path.join(CACHE_ROOT, "results")
+# One cap for everything that shares the cache directory (the GUI and the batch CLI), so neither
+# evicts the other's results down to a smaller limit of its own.
+DEFAULT_MAX_BYTES = int(float(os.environ.get("IMAGE_WARPING_CACHE_GB", 20)) * 1024 ** 3)
+# Eviction frees down to this fraction of the cap, so a full cache is not rescanned on every insert.
+EVICT_TO = 0.9
+
+_hash_memo = {}
+
+
+def file_hash(path):
+    # Memoised on (size, mtime) so re-selecting an effect does not re-read the document.
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _hash_memo:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+class ResultCache:
+    # Rendered outputs keyed by input image content, preset content and render settings,
+    # capped at max_bytes with least-recently-used eviction (file mtime is the access time).
+    # Each file keeps its output format's extension (.png, .webp, .qoi, .npy).
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, image_path, preset_path, settings=None):
+        digest = hashlib.sha256()
+        digest.update(file_hash(image_path).encode())
+        digest.update(file_hash(preset_path).encode())
+        digest.update(json.dumps(settings or {}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def path_for(self, key, extension=".png"):
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+
+    def get(self, key, extension=".png"):
+        path = self.path_for(key, extension)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, source_path):
+        path = self.path_for(key, os.path.splitext(source_path)[1] or ".png")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.account(path)
+        return path
+
+    def put_bytes(self, key, data, extension=".png"):
+        # Stores an already-encoded file, e.g. pixels rendered in memory.
+        path = self.path_for(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.account(path)
+        return path
+
+    def account(self, path):
+        if self.total_bytes is None:
+            self.total_bytes = self.disk_usage()
+        else:
+            self.total_bytes += os.path.getsize(path)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                # Skips the temporary files of writes still in progress.
+                if ".tmp" not in name:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Oldest first until the cache is back under EVICT_TO of its cap.
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.total_bytes = total
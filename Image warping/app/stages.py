@@ -0,0 +1,24 @@
+import time
+from contextlib import contextmanager
+
+# Callbacks run as hook(name, seconds, info) after every timed stage of a render.
+STAGE_HOOKS = []
+
+
+@contextmanager
+def stage(name, **info):
+    # The yielded dict lets the stage add details it only knows at the end, e.g. bytes written.
+    start = time.perf_counter()
+    try:
+        yield info
+    except Exception as e:
+        info["error"] = str(e)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        for hook in STAGE_HOOKS:
+            # A broken hook must not fail the stage it reports on, e.g. a file already written.
+            try:
+                hook(name, seconds, info)
+            except Exception as e:
+                print(f"Stage hook {type(hook).__name__} failed on {name}: {e}")
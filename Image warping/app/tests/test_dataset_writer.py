@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import tarfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from dataset_writer import INDEX_NAME, open_writer
+
+
+def samples(count, size=16):
+    rng = np.random.default_rng(0)
+    return [(f"page{n}_fold_tl", rng.integers(0, 256, size=(size, size, 4), dtype=np.uint8)) for n in range(count)]
+
+
+def write_all(kind, out_dir, items, max_shard_bytes=1024 ** 3):
+    with open_writer(kind, str(out_dir), max_shard_bytes) as writer:
+        for key, pixels in items:
+            writer.write(key, pixels, f"/in/{key}.png", "fold_tl")
+    with open(os.path.join(out_dir, INDEX_NAME)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_files(tmp_path):
+    items = samples(3)
+    index = write_all("files", tmp_path, items)
+    assert [entry["key"] for entry in index] == [key for key, _ in items]
+    for entry, (key, pixels) in zip(index, items):
+        assert entry["source"] == f"/in/{key}.png" and entry["preset"] == "fold_tl"
+        assert np.array_equal(np.asarray(Image.open(tmp_path / entry["file"])), pixels)
+
+
+def test_tar_offsets_point_at_the_png(tmp_path):
+    items = samples(5)
+    index = write_all("tar", tmp_path, items, max_shard_bytes=4096)
+    assert len({entry["shard"] for entry in index}) > 1
+    for entry, (key, pixels) in zip(index, items):
+        with open(tmp_path / entry["shard"], "rb") as f:
+            f.seek(entry["offset"])
+            png = f.read(entry["size"])
+        assert np.array_equal(np.asarray(Image.open(io.BytesIO(png))), pixels)
+        with tarfile.open(tmp_path / entry["shard"]) as tar:
+            assert json.load(tar.extractfile(key + ".json")) == {"height": 16, "width": 16}
+
+
+def test_npz(tmp_path):
+    items = samples(5)
+    index = write_all("npz", tmp_path, items, max_shard_bytes=2 * 16 * 16 * 4)
+    shards = sorted(name for name in os.listdir(tmp_path) if name.endswith(".npz"))
+    assert sorted({entry["shard"] for entry in index}) == shards and len(shards) == 3
+    for entry, (key, pixels) in zip(index, items):
+        with np.load(tmp_path / entry["shard"]) as shard:
+            assert np.array_equal(shard[entry["member"]], pixels)
+
+
+@pytest.mark.parametrize("kind", ["tar", "npz", "hdf5"])
+def test_samples_commit_with_their_shard(tmp_path, kind):
+    if kind == "hdf5":
+        pytest.importorskip("h5py")
+    # Each cap is reached by the third sample.
+    writer = open_writer(kind, str(tmp_path), max_shard_bytes={"tar": 9000, "npz": 3000, "hdf5": 3000}[kind])
+    items = samples(4)
+    for number, (key, pixels) in enumerate(items[:2]):
+        writer.write(key, pixels, "/in/page.png", "fold_tl", job=number)
+    # Nothing is readable yet: no finished shard, no index lines, no jobs to mark done.
+    assert writer.committed() == []
+    assert (tmp_path / INDEX_NAME).read_text() == ""
+    assert not [name for name in os.listdir(tmp_path) if not name.endswith((".partial", INDEX_NAME))]
+
+    for number, (key, pixels) in enumerate(items[2:], 2):
+        writer.write(key, pixels, "/in/page.png", "fold_tl", job=number)
+    assert writer.committed() == [0, 1, 2]
+    writer.close()
+    assert writer.committed() == [3]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".partial")]
+
+
+def test_interrupted_shard_is_left_behind(tmp_path):
+    writer = open_writer("tar", str(tmp_path))
+    writer.write(*samples(1)[0], "/in/page.png", "fold_tl")
+    writer.index.close()
+    index = write_all("tar", tmp_path, samples(1))
+    assert index[0]["shard"] == "shard-000001.tar"
+
+
+def test_appending_starts_a_new_shard(tmp_path):
+    first = write_all("tar", tmp_path, samples(2))
+    second = write_all("tar", tmp_path, samples(2))
+    assert len(second) == 4
+    assert second[0]["shard"] == first[0]["shard"] != second[2]["shard"]
+
+
+def test_hdf5(tmp_path):
+    h5py = pytest.importorskip("h5py")
+    items = samples(3)
+    index = write_all("hdf5", tmp_path, items)
+    with h5py.File(tmp_path / index[0]["shard"]) as shard:
+        for entry, (key, pixels) in zip(index, items):
+            assert shard["keys"][entry["offset"]].decode() == key
+            png = shard["images"][entry["offset"]].tobytes()
+            assert np.array_equal(np.asarray(Image.open(io.BytesIO(png))), pixels)
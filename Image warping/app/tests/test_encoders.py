@@ -0,0 +1,114 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from encoders import encode, encode_npy, encode_png, encode_qoi
+
+
+def decode_qoi(data):
+    # Straight from the reference decoder at qoiformat.org.
+    assert data[:4] == b"qoif" and data[-8:] == b"\x00" * 7 + b"\x01"
+    width, height, channels, _ = struct.unpack(">IIBB", data[4:14])
+    pixels = np.zeros((width * height, 4), dtype=np.uint8)
+    index = np.zeros((64, 4), dtype=np.uint8)
+    px = np.array([0, 0, 0, 255], dtype=np.uint8)
+    pos = 14
+    run = 0
+    for i in range(width * height):
+        if run:
+            run -= 1
+        else:
+            b = data[pos]
+            pos += 1
+            if b == 0xFE:
+                px = px.copy()
+                px[:3] = list(data[pos:pos + 3])
+                pos += 3
+            elif b == 0xFF:
+                px = np.array(list(data[pos:pos + 4]), dtype=np.uint8)
+                pos += 4
+            elif b >> 6 == 0:
+                px = index[b].copy()
+            elif b >> 6 == 1:
+                px = px.copy()
+                px[:3] += np.array([(b >> 4 & 3) - 2, (b >> 2 & 3) - 2, (b & 3) - 2]).astype(np.uint8)
+            elif b >> 6 == 2:
+                dg = (b & 0x3F) - 32
+                second = data[pos]
+                pos += 1
+                px = px.copy()
+                px[:3] += np.array([dg + (second >> 4) - 8, dg, dg + (second & 15) - 8]).astype(np.uint8)
+            else:
+                run = b & 0x3F
+            r, g, bl, a = px.astype(np.int64)
+            index[(r * 3 + g * 5 + bl * 7 + a * 11) % 64] = px
+        pixels[i] = px
+    assert pos == len(data) - 8
+    return pixels.reshape(height, width, 4)[..., :channels]
+
+
+def sample_image(channels, dtype=np.uint8, seed=0):
+    # Smooth gradients, flat runs and noise, so every QOI op and PNG filter path is exercised.
+    rng = np.random.default_rng(seed)
+    height, width = 37, 53
+    top = np.iinfo(dtype).max
+    y, x = np.mgrid[:height, :width]
+    image = np.stack([(x * 5 + y * c) % (top + 1) for c in range(channels)], axis=-1).astype(dtype)
+    image[5:12] = image[5, 0]
+    image[20:] = rng.integers(0, top + 1, size=image[20:].shape, dtype=dtype)
+    return image
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+def test_qoi_round_trip(channels):
+    image = sample_image(channels)
+    assert np.array_equal(decode_qoi(encode_qoi(image)), image)
+
+
+def test_qoi_long_runs_and_alpha_changes():
+    image = np.zeros((10, 30, 4), dtype=np.uint8)
+    image[..., 3] = 255
+    image[3, :, 3] = np.arange(30)
+    image[7:, :, 0] = 200
+    assert np.array_equal(decode_qoi(encode_qoi(image)), image)
+
+
+def test_qoi_rejects_16_bit():
+    with pytest.raises(ValueError):
+        encode_qoi(sample_image(3, np.uint16))
+
+
+@pytest.mark.parametrize("channels", [1, 2, 3, 4])
+def test_png_round_trip_8_bit(channels):
+    image = sample_image(channels)
+    decoded = np.asarray(Image.open(io.BytesIO(encode_png(image))))
+    assert np.array_equal(decoded.reshape(image.shape), image)
+
+
+def test_png_round_trip_16_bit_gray():
+    image = sample_image(1, np.uint16)[..., 0]
+    decoded = np.asarray(Image.open(io.BytesIO(encode_png(image))))
+    assert np.array_equal(decoded.astype(np.uint16), image)
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+def test_webp_is_lossless(channels):
+    image = sample_image(channels)
+    decoded = np.asarray(Image.open(io.BytesIO(encode(image, "webp"))))
+    # Lossless WebP may drop the colour of fully transparent pixels.
+    visible = image[..., 3] > 0 if channels == 4 else np.ones(image.shape[:2], dtype=bool)
+    assert np.array_equal(decoded[visible], image[visible])
+
+
+def test_npy_keeps_dtype():
+    image = sample_image(4, np.uint16)
+    decoded = np.load(io.BytesIO(encode_npy(image)))
+    assert decoded.dtype == np.uint16 and np.array_equal(decoded, image)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        encode(sample_image(3), "bmp")
@@ -0,0 +1,74 @@
+import time
+
+from job_queue import JobQueue
+
+
+def jobs(count, preset_path="/presets/fold_tl.blend"):
+    return [{"job_id": f"{preset_path}:{n}", "image_path": f"/in/{n}.png", "preset_path": preset_path,
+             "output_path": f"/out/{n}.png"} for n in range(count)]
+
+
+def test_add_is_idempotent(tmp_path):
+    with JobQueue(str(tmp_path / "queue.sqlite")) as job_queue:
+        assert job_queue.add(jobs(3)) == 3
+        job = job_queue.claim("a")
+        job_queue.complete(job["job_id"])
+        assert job_queue.add(jobs(4)) == 1
+        assert job_queue.counts() == {"done": 1, "pending": 3}
+
+
+def test_workers_never_claim_the_same_job(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    with JobQueue(path) as first, JobQueue(path) as second:
+        first.add(jobs(5))
+        claimed = []
+        for worker, job_queue in [("a", first), ("b", second)] * 3:
+            job = job_queue.claim(worker)
+            if job is not None:
+                claimed.append(job["job_id"])
+        assert sorted(claimed) == sorted(job["job_id"] for job in jobs(5))
+        assert first.claim("a") is None
+        assert first.unfinished() == 5
+
+
+def test_claim_prefers_the_loaded_preset(tmp_path):
+    with JobQueue(str(tmp_path / "queue.sqlite")) as job_queue:
+        job_queue.add(jobs(2, "/presets/a.blend") + jobs(2, "/presets/b.blend"))
+        assert job_queue.claim("w", "/presets/b.blend")["preset_path"] == "/presets/b.blend"
+        assert job_queue.claim("w")["preset_path"] == "/presets/a.blend"
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    with JobQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0.05) as job_queue:
+        job_queue.add(jobs(1))
+        job = job_queue.claim("crashed")
+        assert job_queue.claim("other") is None
+        time.sleep(0.1)
+        assert job_queue.claim("other")["job_id"] == job["job_id"]
+        # The first worker lost its lease and can no longer renew or fail it.
+        assert not job_queue.heartbeat(job["job_id"], "crashed")
+        job_queue.fail(job["job_id"], "crashed", "too late")
+        assert job_queue.counts() == {"leased": 1}
+
+
+def test_failures_end_in_dead_letters(tmp_path):
+    with JobQueue(str(tmp_path / "queue.sqlite"), max_attempts=2) as job_queue:
+        job_queue.add(jobs(1))
+        for attempt in range(2):
+            job = job_queue.claim("w")
+            job_queue.fail(job["job_id"], "w", f"error {attempt}")
+        assert job_queue.claim("w") is None
+        assert job_queue.unfinished() == 0
+        [(dead, error)] = job_queue.dead_jobs()
+        assert dead["output_path"] == "/out/0.png" and error == "error 1"
+        assert job_queue.retry_dead() == 1
+        assert job_queue.claim("w")["job_id"] == job["job_id"]
+
+
+def test_abandoned_last_attempt_is_dead(tmp_path):
+    with JobQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0.05, max_attempts=1) as job_queue:
+        job_queue.add(jobs(1))
+        job_queue.claim("crashed")
+        time.sleep(0.1)
+        assert job_queue.claim("other") is None
+        assert job_queue.counts() == {"dead": 1}
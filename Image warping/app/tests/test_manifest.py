@@ -0,0 +1,53 @@
+import os
+
+from manifest import JobManifest, output_name
+
+
+def make_inputs(tmp_path):
+    image = tmp_path / "page.png"
+    preset = tmp_path / "fold_tl.blend"
+    image.write_bytes(b"page")
+    preset.write_bytes(b"preset")
+    return str(image), str(preset)
+
+
+def job(manifest, image, preset, out_dir, settings):
+    job_id = manifest.job_id(image, preset, settings)
+    return {"job_id": job_id, "image_path": image, "preset_path": preset, "settings": settings,
+            "output_path": os.path.join(out_dir, output_name(image, preset, job_id) + ".png")}
+
+
+def test_job_id_depends_on_content_and_settings(tmp_path):
+    image, preset = make_inputs(tmp_path)
+    copy = tmp_path / "renamed.png"
+    copy.write_bytes(b"page")
+    with JobManifest(str(tmp_path / "manifest.sqlite")) as manifest:
+        first = manifest.job_id(image, preset, {"effect": "Fold TL"})
+        assert manifest.job_id(str(copy), preset, {"effect": "Fold TL"}) == first
+        assert manifest.job_id(image, preset, {"effect": "Fold TL", "frame": 10}) != first
+        (tmp_path / "page.png").write_bytes(b"edited page")
+        assert manifest.job_id(image, preset, {"effect": "Fold TL"}) != first
+
+
+def test_status_survives_reopening(tmp_path):
+    image, preset = make_inputs(tmp_path)
+    path = str(tmp_path / "manifest.sqlite")
+    with JobManifest(path) as manifest:
+        done = job(manifest, image, preset, str(tmp_path), {"effect": "Fold TL"})
+        failed = job(manifest, image, preset, str(tmp_path), {"effect": "Fold TL", "frame": 5})
+        manifest.record([done, failed])
+        manifest.mark_done(done["job_id"])
+        manifest.mark_failed(failed["job_id"], "boom")
+
+    with JobManifest(path) as manifest:
+        # Recording the same jobs again keeps their status.
+        manifest.record([done, failed])
+        assert manifest.done_ids() == {done["job_id"]}
+        assert manifest.counts() == {"done": 1, "failed": 1}
+        assert manifest.db.execute("SELECT error, attempts FROM jobs WHERE job_id = ?",
+                                   (failed["job_id"],)).fetchone() == ("boom", 1)
+
+
+def test_output_names_are_readable_and_distinct():
+    assert output_name("/in/page.1.png", "/presets/fold_tl.blend", "abcdef0123456789") == "page.1_fold_tl_abcdef012345"
+    assert output_name("a.png", "p.blend", "1" * 64) != output_name("a.png", "p.blend", "2" * 64)
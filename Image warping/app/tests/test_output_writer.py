@@ -0,0 +1,54 @@
+import numpy as np
+from PIL import Image
+
+from output_writer import AsyncWriter, write_encoded
+from metrics import JobEvents
+from stages import STAGE_HOOKS
+
+
+def test_write_encoded_reports_the_encode(tmp_path):
+    events = []
+
+    def hook(name, seconds, info):
+        events.append((name, dict(info)))
+
+    STAGE_HOOKS.append(hook)
+    try:
+        pixels = np.full((8, 8, 4), 200, dtype=np.uint8)
+        written = write_encoded(str(tmp_path / "a.png"), pixels, "png", 6, {"preset": "fold_tl.blend"})
+    finally:
+        STAGE_HOOKS.remove(hook)
+    assert np.array_equal(np.asarray(Image.open(tmp_path / "a.png")), pixels)
+    assert events == [("encode", {"format": "png", "preset": "fold_tl.blend", "bytes": written})]
+    assert [path.name for path in tmp_path.iterdir()] == ["a.png"]
+
+
+def test_async_writer_hands_jobs_back(tmp_path):
+    writer = AsyncWriter("npy", threads=2, queue_size=2)
+    for n in range(5):
+        writer.submit(str(tmp_path / f"{n}.npy"), np.full((4, 4, 4), n, dtype=np.uint8), job=n)
+    writer.submit(str(tmp_path / "missing" / "x.npy"), np.zeros((4, 4, 4), np.uint8), job="bad")
+    finished = dict(writer.close())
+    assert sorted(job for job, error in finished.items() if error is None) == list(range(5))
+    assert finished["bad"] is not None
+    assert writer.files == 5 and np.load(tmp_path / "3.npy")[0, 0, 0] == 3
+
+
+def test_encode_event_without_job_info_is_not_a_failed_write(tmp_path):
+    events = []
+
+    class Events(JobEvents):
+        def emit(self, event):
+            events.append(event)
+
+    def broken(name, seconds, info):
+        raise KeyError("preset")
+
+    STAGE_HOOKS.extend([Events(), broken])
+    try:
+        writer = AsyncWriter("npy", threads=1)
+        writer.submit(str(tmp_path / "a.npy"), np.zeros((4, 4, 4), np.uint8), job="a")
+        assert writer.close() == [("a", None)]
+    finally:
+        STAGE_HOOKS[-2:] = []
+    assert events[0]["preset"] is None and events[0]["ok"]
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pytest
+
+from encoders import write_png
+from preset_params import PARAMETER_DEFAULTS, sample_variants
+from presets import PRESET_DIR
+
+
+def preset(stem):
+    return os.path.join(PRESET_DIR, stem + ".blend")
+
+
+@pytest.mark.parametrize("stem", ["left", "90"])
+def test_variants_differ(stem):
+    variants = sample_variants(preset(stem), 5, seed=3)
+    assert len({tuple(sorted(params.items())) for params in variants}) == 5
+    for params in variants:
+        assert params and all(value != PARAMETER_DEFAULTS[name] for name, value in params.items())
+    assert sample_variants(preset(stem), 5, seed=3) == variants
+
+
+def test_presets_without_parameters_render_once():
+    # Their deformation is baked into the mesh, so N variants would be N copies of the same image.
+    assert sample_variants(preset("fold_tl"), 5) == [{}]
+    assert sample_variants(preset("curl_tl"), 5) == [{}]
+
+
+def test_rendered_variants_differ(tmp_path):
+    pytest.importorskip("bpy")
+    from render_profiles import RENDER_PROFILES
+    from renderer import RenderSession
+
+    document = str(tmp_path / "page.png")
+    write_png(document, np.random.default_rng(0).integers(0, 256, size=(128, 96, 3), dtype=np.uint8))
+    session = RenderSession()
+    renders = [session.render(preset("90"), document, "90°", quality=RENDER_PROFILES["preview"], params=params)
+               for params in sample_variants(preset("90"), 2)]
+    assert not np.array_equal(renders[0], renders[1])
+    with pytest.raises(ValueError):
+        session.render(preset("fold_tl"), document, "Fold TL", quality=RENDER_PROFILES["preview"],
+                       params={"fold_angle": 1.2})
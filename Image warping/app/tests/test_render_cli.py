@@ -0,0 +1,181 @@
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from encoders import write_png
+from manifest import JobManifest
+from job_queue import JobQueue
+from render_cli import build_jobs, frame_options, job_variants, main, parse_frames, sync_manifest
+
+
+def test_parse_frames():
+    assert parse_frames("10,20,40-100:20") == [10, 20, 40, 60, 80, 100]
+    assert parse_frames(" 5, 1-3 ,,3") == [5, 1, 2, 3]
+    assert parse_frames("") == []
+
+
+def make_files(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        # Unique content, so no preset metadata from an earlier run applies.
+        path.write_bytes(f"{tmp_path}/{name}".encode())
+        paths.append(str(path))
+    return paths
+
+
+def test_build_jobs_is_preset_major(tmp_path):
+    inputs = make_files(tmp_path, ["a.png", "b.png"])
+    presets = make_files(tmp_path, ["fold_tl.blend", "90.blend"])
+    jobs = build_jobs(inputs, presets, "out")
+    assert [(job["preset_path"], job["image_path"]) for job in jobs] == [(p, i) for p in presets for i in inputs]
+    assert jobs[0]["output_path"] == "out/a_fold_tl.png" and jobs[0]["key"] == "a_fold_tl"
+    assert [job["effect_name"] for job in jobs[::2]] == ["Fold TL", "90°"]
+
+
+def test_build_jobs_skips_existing_outputs(tmp_path):
+    inputs = make_files(tmp_path, ["a.png", "b.png"])
+    presets = make_files(tmp_path, ["fold_tl.blend"])
+    (tmp_path / "a_fold_tl.png").write_bytes(b"done")
+    jobs = build_jobs(inputs, presets, str(tmp_path), skip_existing=True)
+    assert [job["image_path"] for job in jobs] == inputs[1:]
+    assert build_jobs(inputs, presets, str(tmp_path), write_files=False, skip_existing=True)[0]["output_path"] is None
+
+
+def test_build_jobs_with_variants_and_manifest(tmp_path):
+    inputs = make_files(tmp_path, ["a.png"])
+    presets = make_files(tmp_path, ["fold_tl.blend"])
+    variants = lambda preset_path: [("", {}), ("_f10", {"frame": 10})]
+    with JobManifest(str(tmp_path / "manifest.sqlite")) as manifest:
+        jobs = build_jobs(inputs, presets, "out", options={"reuse": True}, manifest=manifest,
+                          quality_for=lambda preset_path: {"samples": 8}, variants_for=variants, extension=".qoi")
+        again = build_jobs(inputs, presets, "out", options={"reuse": False}, manifest=manifest,
+                           quality_for=lambda preset_path: {"samples": 8}, variants_for=variants, extension=".qoi")
+    assert [job["options"] for job in jobs] == [{"reuse": True, "quality": {"samples": 8}},
+                                                 {"reuse": True, "quality": {"samples": 8}, "frame": 10}]
+    assert jobs[1]["settings"] == {"effect": "Fold TL", "quality": {"samples": 8}, "frame": 10}
+    assert jobs[0]["job_id"] != jobs[1]["job_id"]
+    # Options that do not change the pixels do not change the job.
+    assert [job["job_id"] for job in again] == [job["job_id"] for job in jobs]
+    assert jobs[1]["output_path"] == f"out/a_fold_tl_{jobs[1]['job_id'][:12]}.qoi"
+
+
+def test_uninspected_presets_count_as_static(tmp_path):
+    # Without Blender nothing can inspect the preset, and its name says nothing about physics.
+    if importlib.util.find_spec("bpy") is not None:
+        pytest.skip("with Blender the preset file is opened and inspected")
+    fold, = make_files(tmp_path, ["fold_tl.blend"])
+    assert frame_options(fold, "10,20", frame_steps=2) == [{}]
+
+
+def test_queue_results_reach_the_manifest(tmp_path):
+    inputs = make_files(tmp_path, ["a.png", "b.png", "c.png"])
+    presets = make_files(tmp_path, ["fold_tl.blend"])
+    queue_path = str(tmp_path / "queue.sqlite")
+    with JobManifest(str(tmp_path / "manifest.sqlite")) as manifest:
+        jobs = build_jobs(inputs, presets, str(tmp_path), manifest=manifest)
+        manifest.record(jobs)
+        with JobQueue(queue_path, max_attempts=1) as job_queue:
+            job_queue.add(jobs)
+            job_queue.complete(job_queue.claim("w")["job_id"])
+            dead = job_queue.claim("w")
+            job_queue.fail(dead["job_id"], "w", "boom")
+        sync_manifest(queue_path, manifest)
+        sync_manifest(queue_path, manifest)
+        assert manifest.done_ids() == {jobs[0]["job_id"]}
+        assert manifest.failed_ids() == {dead["job_id"]}
+        assert manifest.counts() == {"done": 1, "failed": 1, "pending": 1}
+
+
+def test_frame_variants_only_for_physics_presets(tmp_path, monkeypatch):
+    import preset_registry
+
+    fold, rotation = make_files(tmp_path, ["fold_tl.blend", "90.blend"])
+    metadata = {fold: {"has_physics": True}, rotation: {"has_physics": False}}
+    monkeypatch.setattr(preset_registry, "load_metadata", metadata.get)
+    assert frame_options(fold, "10,20", frame_steps=2) == [{"frame": 10}, {"frame": 20}, {"progress": 0.5},
+                                                           {"progress": 1.0}]
+    assert frame_options(rotation, "10,20", frame_steps=2) == [{}]
+    assert frame_options(fold, frame_samples=3, seed=1) == frame_options(fold, frame_samples=3, seed=1)
+
+    class Args:
+        variants = 0
+        frames = "10"
+        frame_steps = 1
+        frame_samples = 0
+        seed = 0
+
+    assert job_variants(fold, Args) == [("_f10", {"frame": 10}), ("_p1000", {"progress": 1.0})]
+    assert job_variants(rotation, Args) == [("", {})]
+
+
+# CI runs a short soak; IMAGE_WARPING_SOAK_RENDERS=10000 is the full soak setting (the CLI default).
+SOAK_RENDERS = int(os.environ.get("IMAGE_WARPING_SOAK_RENDERS", 300))
+
+
+def test_soak_memory_stays_flat(tmp_path):
+    # Needs Blender's Python module; many renders of one preset must not keep growing the process.
+    pytest.importorskip("bpy")
+    rng = np.random.default_rng(0)
+    for n in range(3):
+        write_png(str(tmp_path / f"page{n}.png"), rng.integers(0, 256, size=(256, 192, 3), dtype=np.uint8))
+    assert main(["soak", "--inputs", str(tmp_path), "--preset", "fold_tl", "--renders", str(SOAK_RENDERS),
+                 "--warmup", str(min(50, SOAK_RENDERS // 5)), "--max-growth-mb", "64"]) == 0
+
+
+def test_soak_catches_growing_memory(tmp_path, monkeypatch):
+    # The soak loop itself, with a stand-in session that optionally keeps 2 MB per render.
+    import types
+
+    class Session:
+        leak = False
+        kept = []
+
+        def render(self, preset_path, image_path, effect_name, output_path):
+            if self.leak:
+                self.kept.append(bytearray(b"x" * (2 << 20)))
+
+    monkeypatch.setitem(sys.modules, "renderer", types.SimpleNamespace(RenderSession=Session))
+    inputs = make_files(tmp_path, ["page.png"])
+    args = ["soak", "--inputs", *inputs, "--preset", "fold_tl", "--renders", "60", "--warmup", "10",
+            "--max-growth-mb", "64"]
+    assert main(args) == 0
+    Session.leak = True
+    assert main(args) == 1
+    Session.kept.clear()
+
+
+def test_interrupted_shard_run_resumes(tmp_path, monkeypatch):
+    import render_cli
+
+    inputs = make_files(tmp_path, [f"page{n}.png" for n in range(5)])
+    rendered = []
+
+    def fake_renders(jobs, threads=None, stop_after=None):
+        for job in jobs:
+            if len(rendered) == stop_after:
+                raise KeyboardInterrupt
+            rendered.append(job["image_path"])
+            yield dict(job, worker_id=0, ok=True, error=None, pixels=np.zeros((16, 16, 4), np.uint8))
+
+    out = tmp_path / "out"
+    argv = ["render", "--inputs", *inputs, "--presets", "fold_tl", "--out", str(out), "--workers", "1",
+            "--format", "npz", "--shard-size-mb", str(2048 / 1024 ** 2)]
+    monkeypatch.setattr(render_cli, "run_inline", lambda jobs, threads: fake_renders(jobs, stop_after=3))
+    with pytest.raises(KeyboardInterrupt):
+        main(argv)
+    # The open shard was completed on the way out, so the three samples are readable and done.
+    with JobManifest(str(out / "manifest.sqlite")) as manifest:
+        assert manifest.counts() == {"done": 3, "pending": 2}
+    assert sorted(name for name in os.listdir(out) if name.endswith(".npz")) == ["shard-000000.npz",
+                                                                                 "shard-000001.npz"]
+
+    rendered.clear()
+    monkeypatch.setattr(render_cli, "run_inline", lambda jobs, threads: fake_renders(jobs))
+    assert main(argv) == 0
+    assert rendered == inputs[3:]
+    with open(out / "index.jsonl") as f:
+        assert len(f.readlines()) == 5
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+from encoders import write_png
+from presets import PRESET_DIR
+from stages import STAGE_HOOKS
+
+bpy = pytest.importorskip("bpy")
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = str(tmp_path / "page.png")
+    write_png(path, np.random.default_rng(0).integers(0, 256, size=(128, 96, 3), dtype=np.uint8))
+    return path
+
+
+def test_filmic_presets_read_back_from_memory(tmp_path, document):
+    from render_profiles import RENDER_PROFILES
+    from renderer import read_stored_pixels, render_image
+
+    sources = []
+
+    def hook(name, seconds, info):
+        if name == "readback":
+            sources.append(info["source"])
+
+    STAGE_HOOKS.append(hook)
+    try:
+        pixels = render_image(os.path.join(PRESET_DIR, "fold_tl.blend"), document, "Fold TL",
+                              quality=RENDER_PROFILES["preview"])
+    finally:
+        STAGE_HOOKS.remove(hook)
+    assert bpy.context.scene.view_settings.view_transform == "Filmic"
+    assert sources == ["viewer"]
+
+    # Blender's own file output of the same render, with the view transform applied.
+    saved = str(tmp_path / "saved.png")
+    bpy.data.images["Render Result"].save_render(saved)
+    expected = read_stored_pixels(saved)
+    visible = expected[..., 3] > 0
+    assert np.abs(pixels[visible].astype(int) - expected[visible]).max() <= 2
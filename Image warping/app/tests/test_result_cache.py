@@ -0,0 +1,16 @@
+import os
+
+from result_cache import ResultCache
+
+
+def test_outputs_keep_their_format_extension(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    source = tmp_path / "out.webp"
+    source.write_bytes(b"RIFF webp")
+    path = cache.put("ab" * 32, str(source))
+    assert path.endswith(".webp")
+    assert cache.get("ab" * 32) is None
+    assert cache.get("ab" * 32, ".webp") == path
+    cache.put_bytes("cd" * 32, b"\x93NUMPY", ".npy")
+    assert sorted(os.path.basename(path) for _, _, path in cache.entries()) == ["ab" * 32 + ".webp",
+                                                                               "cd" * 32 + ".npy"]
@@ -0,0 +1,82 @@
+import numpy as np
+
+from warp_field import load_field, sampling_plan, save_field, warp_batch, warp_image
+
+
+def identity_field(height, width):
+    # Every output pixel samples the centre of the same input pixel, unshaded and opaque.
+    y, x = np.mgrid[:height, :width]
+    uv = np.stack([(x + 0.5) / width, 1 - (y + 0.5) / height], axis=-1).astype(np.float32)
+    return {"uv": uv, "alpha": np.ones((height, width), np.float32),
+            "shading": np.ones((height, width, 1), np.float32)}
+
+
+def document(height=24, width=32, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def test_identity_field_reproduces_the_document():
+    image = document()
+    out = warp_image(image, identity_field(*image.shape[:2]))
+    assert out.shape == image.shape[:2] + (4,)
+    assert np.abs(out[..., :3].astype(int) - image).max() <= 1
+    assert (out[..., 3] == 255).all()
+
+
+def test_uncovered_pixels_stay_transparent():
+    image = document()
+    field = identity_field(*image.shape[:2])
+    field["alpha"][:, :5] = 0
+    out = warp_image(image, field)
+    assert (out[:, :5] == 0).all()
+    assert (out[:, 5:, 3] == 255).all()
+
+
+def test_shading_darkens_in_linear_light():
+    image = np.full((8, 8, 3), 255, dtype=np.uint8)
+    field = identity_field(8, 8)
+    field["shading"][:] = 0.5
+    out = warp_image(image, field)
+    # Half of linear white is sRGB 188, not 128.
+    assert (out[..., :3] == 188).all()
+
+
+def test_edges_clamp():
+    image = document(4, 4)
+    field = identity_field(4, 4)
+    field["uv"][:] = (-1.0, 2.0)
+    out = warp_image(image, field)
+    assert np.abs(out[..., :3].astype(int) - image[0, 0]).max() <= 1
+
+
+def test_plan_reuse_matches_fresh_plan():
+    image = document()
+    field = identity_field(*image.shape[:2])
+    field["uv"] = field["uv"][::-1].copy()
+    plan = sampling_plan(field["uv"][field["alpha"] > 0], image.shape[1], image.shape[0])
+    assert np.array_equal(warp_image(image, field, plan), warp_image(image, field))
+
+
+def test_batch_matches_single_warps():
+    stack = np.stack([document(seed=seed) for seed in range(3)])
+    fields = [identity_field(24, 32), identity_field(24, 32)]
+    fields[1]["uv"] = fields[1]["uv"][:, ::-1].copy()
+    fields[1]["alpha"][10:] = 0
+    outputs = warp_batch(stack, fields, chunk_rows=7, workers=2)
+    for field, out in zip(fields, outputs):
+        for image, warped in zip(stack, out):
+            assert np.array_equal(warped, warp_image(image, field))
+    assert np.array_equal(warp_batch(stack, fields[0]), outputs[0])
+
+
+def test_saved_field_round_trip(tmp_path):
+    field = identity_field(6, 9)
+    field["alpha"][0, 0] = 0.25
+    path = tmp_path / "fields" / "fold.npz"
+    save_field(str(path), field, preset="fold", resolution=[9, 6])
+    loaded = load_field(str(path))
+    assert np.array_equal(loaded["uv"], field["uv"])
+    assert np.allclose(loaded["alpha"], field["alpha"]) and loaded["alpha"].dtype == np.float32
+    assert np.allclose(loaded["shading"], field["shading"])
+    assert loaded["metadata"] == {"preset": "fold", "resolution": [9, 6]}
+    assert [p.name for p in path.parent.iterdir()] == ["fold.npz"]
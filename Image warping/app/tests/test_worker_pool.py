@@ -0,0 +1,30 @@
+import os
+
+from worker_pool import RenderPool
+
+
+def crashing_worker(worker_id, threads, job_queue, result_conn, current_job, instrumentation):
+    # Stands in for Blender: reports each job and dies on the one marked "crash" without reporting it.
+    while True:
+        item = job_queue.get()
+        if item is None:
+            break
+        index, job = item
+        current_job.value = index
+        if job.get("crash"):
+            os._exit(3)
+        result_conn.send(("done", index, job["image_path"]))
+        current_job.value = -1
+
+
+class CrashingPool(RenderPool):
+    worker_main = staticmethod(crashing_worker)
+
+
+def test_results_sent_before_a_crash_are_kept():
+    jobs = [{"image_path": "a"}, {"image_path": "b", "crash": True}, {"image_path": "c"}]
+    with CrashingPool(workers=1, threads_per_worker=1) as pool:
+        results = {result["image_path"]: result for result in pool.run(jobs)}
+    assert results["a"]["ok"] and results["a"]["pixels"] == "a"
+    assert not results["b"]["ok"] and results["b"]["error"] == "worker exited with code 3"
+    assert results["c"]["ok"]
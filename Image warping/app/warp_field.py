@@ -0,0 +1,163 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from presets import CACHE_ROOT
+from result_cache import file_hash
+
+WARP_FIELD_DIR = os.path.join(CACHE_ROOT, "warp_fields")
+
+
+def field_path(preset_path, field_dir=WARP_FIELD_DIR):
+    # Keyed by preset content, so editing a preset means re-running bake-fields for it.
+    stem = os.path.splitext(os.path.basename(preset_path))[0]
+    return os.path.join(field_dir, f"{stem}_{file_hash(preset_path)[:16]}.npz")
+
+
+def save_field(path, field, **metadata):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}.npz"
+    # Uncompressed so loading is a straight read; half floats are plenty for alpha and shading.
+    np.savez(tmp_path,
+             uv=field["uv"].astype(np.float32),
+             alpha=field["alpha"].astype(np.float16),
+             shading=field["shading"].astype(np.float16),
+             metadata=np.array(json.dumps(metadata)))
+    os.replace(tmp_path, path)
+
+
+def load_field(path):
+    with np.load(path) as data:
+        return {
+            "uv": data["uv"],
+            "alpha": data["alpha"].astype(np.float32),
+            "shading": data["shading"].astype(np.float32),
+            "metadata": json.loads(str(data["metadata"])),
+        }
+
+
+def srgb_to_linear(values):
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(values):
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1 / 2.4) - 0.055)
+
+
+# Lookup tables keep the per-pixel colour conversions to a single gather.
+SRGB_TO_LINEAR = srgb_to_linear(np.arange(256) / 255).astype(np.float32)
+LINEAR_LUT_SIZE = 1 << 14
+LINEAR_TO_SRGB = np.round(linear_to_srgb(np.linspace(0, 1, LINEAR_LUT_SIZE)) * 255).astype(np.uint8)
+
+
+def sampling_plan(uv, width, height):
+    # Precomputes the four texel indices and blend weights for sampling a width x height image at
+    # the given (n, 2) Blender UVs. The plan only depends on the field and the image size, so it can
+    # be reused for every document of that size.
+    # Blender's UV origin is the bottom-left corner and texel centres sit at half-pixel offsets.
+    x = uv[:, 0] * np.float32(width) - np.float32(0.5)
+    y = (1 - uv[:, 1]) * np.float32(height) - np.float32(0.5)
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = (x - x0)[:, None]
+    fy = (y - y0)[:, None]
+    x0 = x0.astype(np.intp)
+    y0 = y0.astype(np.intp)
+    # Edges clamp.
+    x1 = np.clip(x0 + 1, 0, width - 1)
+    y1 = np.clip(y0 + 1, 0, height - 1)
+    np.clip(x0, 0, width - 1, out=x0)
+    np.clip(y0, 0, height - 1, out=y0)
+    y0 *= width
+    y1 *= width
+    return (y0 + x0, y0 + x1, y1 + x0, y1 + x1), fx, fy
+
+
+def sample_bilinear(image, plan, lut=None):
+    # image is (h, w, c). With a lut, texels are mapped through it (e.g. to linear light) before interpolation.
+    flat = image.reshape(-1, image.shape[-1])
+    (i00, i01, i10, i11), fx, fy = plan
+
+    def texels(indices):
+        values = np.take(flat, indices, axis=0)
+        return lut[values] if lut is not None else values.astype(np.float32)
+
+    top = texels(i00)
+    top += (texels(i01) - top) * fx
+    bottom = texels(i10)
+    bottom += (texels(i11) - bottom) * fx
+    top += (bottom - top) * fy
+    return top
+
+
+def shade(image, plan, shading):
+    # Samples the document in linear light, applies the preset's shading and returns sRGB uint8 (n, 3).
+    linear = sample_bilinear(image, plan, SRGB_TO_LINEAR)
+    linear *= shading
+    np.clip(linear, 0, 1, out=linear)
+    return LINEAR_TO_SRGB[(linear * (LINEAR_LUT_SIZE - 1) + 0.5).astype(np.intp)]
+
+
+def warp_image(image, field, plan=None):
+    # Applies a stored warp field to an (h, w, 3|4) uint8 document and returns (H, W, 4) uint8 RGBA,
+    # matching a Blender render of the preset under the Standard view transform.
+    height, width = image.shape[:2]
+    alpha = field["alpha"]
+    out = np.zeros(alpha.shape + (4,), dtype=np.uint8)
+    covered = alpha > 0
+    if plan is None:
+        plan = sampling_plan(field["uv"][covered], width, height)
+
+    out[covered, :3] = shade(np.ascontiguousarray(image[..., :3]), plan, field["shading"][covered])
+    out[covered, 3] = np.round(np.clip(alpha[covered], 0, 1) * 255)
+    return out
+
+
+def warp_batch(stack, fields, chunk_rows=64, workers=None):
+    # Warps an (n, h, w, 3|4) uint8 stack of same-sized documents through one field or a list of
+    # fields, returning one (n, H, W, 4) uint8 array per field. Work is split into bands of
+    # chunk_rows output rows; each band builds its sampling plan once and reuses it for all n
+    # documents, so temporary memory stays proportional to the band rather than the batch.
+    single = isinstance(fields, dict)
+    if single:
+        fields = [fields]
+    count, height, width = stack.shape[:3]
+    images = np.ascontiguousarray(stack[..., :3])
+    outputs = [np.zeros((count,) + field["alpha"].shape + (4,), dtype=np.uint8) for field in fields]
+
+    bands = []
+    for field, out in zip(fields, outputs):
+        rows = field["alpha"].shape[0]
+        for start in range(0, rows, chunk_rows):
+            bands.append((field, out, start, min(rows, start + chunk_rows)))
+
+    def warp_band(band):
+        field, out, start, stop = band
+        alpha = field["alpha"][start:stop]
+        covered = alpha > 0
+        if not covered.any():
+            return
+        plan = sampling_plan(field["uv"][start:stop][covered], width, height)
+        shading = field["shading"][start:stop][covered]
+        alpha_bytes = np.round(np.clip(alpha[covered], 0, 1) * 255)
+        for index in range(count):
+            # Bands write disjoint rows of the output, so threads never touch the same pixels.
+            block = out[index, start:stop]
+            block[covered, :3] = shade(images[index], plan, shading)
+            block[covered, 3] = alpha_bytes
+
+    # NumPy releases the GIL inside the gathers and arithmetic, so threads scale across bands.
+    with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        for _ in pool.map(warp_band, bands):
+            pass
+    return outputs[0] if single else outputs
+
+
+def load_image(path):
+    # Pillow is only needed on the NumPy-only warp path.
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+from multiprocessing.connection import wait
+
+
+def default_worker_counts(workers=None, threads_per_worker=None):
+    # Split the machine so workers * threads never exceeds the core count.
+    cores = os.cpu_count() or 1
+    if workers is None and threads_per_worker is None:
+        threads_per_worker = 2 if cores >= 4 else 1
+    if workers is None:
+        workers = max(1, cores // threads_per_worker)
+    if threads_per_worker is None:
+        threads_per_worker = max(1, cores // workers)
+    return workers, threads_per_worker
+
+
+def _worker_main(worker_id, threads, job_queue, result_conn, current_job, instrumentation):
+    # bpy is imported here so only the worker processes pay for it.
+    from metrics import install
+    from renderer import RenderSession
+
+    install(worker_id=worker_id, **instrumentation)
+    session = RenderSession()
+
+    while True:
+        item = job_queue.get()
+        if item is None:
+            break
+        index, job = item
+        # Written synchronously so the parent still knows the job if this process crashes.
+        current_job.value = index
+        try:
+            if "tile" in job:
+                # Several documents rendered in one call; see renderer.render_tiled.
+                output_paths = [tile_job["output_path"] for tile_job in job["tile"]]
+                pixels = session.render_tiled(job["preset_path"], [tile_job["image_path"] for tile_job in job["tile"]],
+                                              job["effect_name"], output_paths, threads=threads, **job.get("options", {}))
+                write_files = output_paths[0] is not None
+            else:
+                pixels = session.render(job["preset_path"], job["image_path"], job["effect_name"],
+                                        job["output_path"], threads=threads, **job.get("options", {}))
+                write_files = job["output_path"] is not None
+            targets = job["tile"] if "tile" in job else [job]
+            if "encode" in targets[0]:
+                # Encoded here rather than in the parent, so the workers compress their outputs in parallel.
+                from output_writer import write_encoded
+
+                for target, target_pixels in zip(targets, pixels if "tile" in job else [pixels]):
+                    write_encoded(target["write_path"], target_pixels, target["encode"]["output_format"],
+                                  target["encode"]["compress_level"],
+                                  {"preset": os.path.basename(job["preset_path"]), "image": target["image_path"]})
+                write_files = True
+            # Jobs without an output path hand the pixels back, e.g. for a dataset shard writer.
+            result_conn.send(("done", index, None if write_files else pixels))
+        except Exception as e:
+            result_conn.send(("failed", index, str(e)))
+        # The result is in the pipe, so a crash from here on must not be blamed on this job.
+        current_job.value = -1
+
+
+class RenderPool:
+    # A set of long-lived Blender processes pulling (image, preset) jobs from a queue.
+    worker_main = staticmethod(_worker_main)
+
+    def __init__(self, workers=None, threads_per_worker=None, instrumentation=None):
+        # instrumentation holds metrics.install() arguments (event_log, metrics_dir) for every worker.
+        self.workers, self.threads_per_worker = default_worker_counts(workers, threads_per_worker)
+        self.instrumentation = instrumentation or {}
+        self.context = multiprocessing.get_context("spawn")
+        self.job_queue = self.context.Queue()
+        self.processes = {}
+        self.result_conns = {}
+        self.current_jobs = {}
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+
+    def _start_worker(self, worker_id):
+        # Results go over a per-worker pipe: send() is synchronous, so nothing is lost if the worker crashes later.
+        reader, writer = self.context.Pipe(duplex=False)
+        current_job = self.context.Value("i", -1, lock=False)
+        process = self.context.Process(target=self.worker_main,
+                                       args=(worker_id, self.threads_per_worker, self.job_queue, writer, current_job,
+                                             self.instrumentation),
+                                       daemon=True)
+        process.start()
+        writer.close()
+        self.processes[worker_id] = process
+        self.result_conns[worker_id] = reader
+        self.current_jobs[worker_id] = current_job
+
+    def run(self, jobs):
+        # Yields one result dict per job, in completion order.
+        jobs = list(jobs)
+        for index, job in enumerate(jobs):
+            self.job_queue.put((index, job))
+
+        finished = set()
+        while len(finished) < len(jobs):
+            conns = {conn: worker_id for worker_id, conn in self.result_conns.items()}
+            wait(list(conns), timeout=1)
+            for conn, worker_id in conns.items():
+                yield from self._received(conn, worker_id, jobs, finished)
+
+            # A worker that dies mid-render (e.g. a Blender crash) loses its job; report it and replace the worker.
+            for worker_id, process in list(self.processes.items()):
+                if process.is_alive():
+                    continue
+                # Results it sent before dying may still be in the pipe: read them before deciding what was lost.
+                conn = self.result_conns.pop(worker_id)
+                yield from self._received(conn, worker_id, jobs, finished)
+                conn.close()
+                index = self.current_jobs[worker_id].value
+                if index >= 0 and index not in finished:
+                    finished.add(index)
+                    yield dict(jobs[index], worker_id=worker_id, ok=False,
+                               error=f"worker exited with code {process.exitcode}", pixels=None)
+                self._start_worker(worker_id)
+
+    def _received(self, conn, worker_id, jobs, finished):
+        # Every result waiting in a worker's pipe, up to its end if the worker has exited.
+        while conn.poll():
+            try:
+                status, index, value = conn.recv()
+            except EOFError:
+                return
+            finished.add(index)
+            if status == "done":
+                yield dict(jobs[index], worker_id=worker_id, ok=True, error=None, pixels=value)
+            else:
+                yield dict(jobs[index], worker_id=worker_id, ok=False, error=value, pixels=None)
+
+    def close(self):
+        for _ in self.processes:
+            self.job_queue.put(None)
+        for process in self.processes.values():
+            process.join()
+        for conn in self.result_conns.values():
+            conn.close()
+        self.processes = {}
+        self.result_conns = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()